@@ -0,0 +1,321 @@
+"""End-to-end load and latency benchmark against a fake LLM and fake Telegram.
+
+    python -m benchmarks.e2e_bench [--users 50] [--messages 5] [--memory-kb 64]
+        [--scenarios chat,telegram,consolidate,reminders] [--output FILE] [--compare FILE]
+
+Every scenario runs the real code paths (agent.chat, bot.handle_message,
+consolidate.consolidate_user, reminders.loop) on a temporary data directory
+prefilled with `--memory-kb` of memory and `--log-kb` of conversation log per
+user. LLM calls go to benchmarks.fakes.FakeLLM; Telegram calls to FakeTelegram.
+
+Results (throughput, p50/p95/p99 latency, RSS, fake-LLM request and token
+counts) are printed and written as JSON, by default to
+benchmarks/results/e2e-<commit>.json. --compare prints the change against an
+earlier results file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from benchmarks.fakes import FakeLLM, FakeTelegram
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS = ("chat", "telegram", "consolidate", "reminders")
+
+MESSAGES = (
+    "I started learning the cello last month and practice every evening",
+    "remind me to call the dentist tomorrow morning",
+    "what should I cook for dinner tonight?",
+    "my sister Ana is visiting in two weeks",
+    "I'm allergic to peanuts, keep that in mind",
+    "remind me to water the tomatoes on friday",
+    "work has been stressful, the launch slipped again",
+    "any ideas for a weekend trip near the mountains?",
+)
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def git_commit() -> tuple[str, bool]:
+    root = Path(__file__).parent.parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+def summarize(latencies: list[float], seconds: float, errors: int, llm: FakeLLM, before: dict) -> dict:
+    return {
+        "operations": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_per_sec": round(len(latencies) / seconds, 2) if seconds else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+        } if latencies else None,
+        "llm": {key: value - before[key] for key, value in llm.stats().items()},
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def use_storage(storage):
+    """Point every module-level default storage at `storage`, as the tests do."""
+    from src import common, consolidate, shard
+    from src.skills import history, memory, recall, reminders, search
+    common.storage = storage
+    consolidate.storage = storage
+    shard.default_storage = storage
+    memory.default_storage = storage
+    recall.default_storage = storage
+    reminders.default_storage = storage
+    history.default_storage = storage
+    search.default_storage = storage
+
+def prefill(storage, users: list[str], memory_kb: int, log_kb: int):
+    stamp = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M")
+    for user_id in users:
+        i = written = 0
+        while written < memory_kb * 1024:
+            fact = f"- {MESSAGES[i % len(MESSAGES)]} (note {i})"
+            storage.append_memory(user_id, stamp, fact)
+            written += len(fact) + 22
+            i += 1
+        written = 0
+        while written < log_kb * 1024:
+            message = MESSAGES[i % len(MESSAGES)]
+            storage.append_log(user_id, stamp, f"{message} ({i})", "Noted!")
+            written += len(message) + 40
+            i += 1
+    storage.sync()
+
+async def run_users(users: list[str], messages: int, concurrency: int, turn) -> tuple[list[float], int, float]:
+    """Each user sends `messages` messages one after another; up to `concurrency` users at once."""
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def user(user_id: str, offset: int):
+        nonlocal errors
+        async with limit:
+            for i in range(messages):
+                start = time.perf_counter()
+                try:
+                    await turn(user_id, MESSAGES[(offset + i) % len(MESSAGES)])
+                except Exception as e:
+                    errors += 1
+                    print(f"{user_id}: {e!r}")
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id, n) for n, user_id in enumerate(users)))
+    return latencies, errors, time.perf_counter() - start
+
+async def bench_chat(args, users, llm, agent, **_) -> dict:
+    before = llm.stats()
+    latencies, errors, seconds = await run_users(
+        users, args.messages, args.concurrency, lambda user_id, text: agent.chat(user_id, text)
+    )
+    return summarize(latencies, seconds, errors, llm, before)
+
+async def bench_telegram(args, users, llm, agent, telegram, **_) -> dict:
+    from src import bot
+    before = llm.stats()
+    context = telegram.context()
+
+    async def turn(user_id: str, text: str):
+        await bot.handle_message(telegram.update(int(user_id), text), context)
+
+    latencies, errors, seconds = await run_users(users, args.messages, args.concurrency, turn)
+    start = time.perf_counter()
+    await agent.drain()
+    result = summarize(latencies, seconds, errors, llm, before)
+    result["drain_seconds"] = round(time.perf_counter() - start, 3)
+    result["telegram_calls"] = dict(telegram.calls)
+    return result
+
+async def bench_consolidate(args, users, llm, storage, **_) -> dict:
+    from src import consolidate
+    before = llm.stats()
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(user_id: str):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await consolidate.consolidate_user(user_id)
+            except Exception as e:
+                errors += 1
+                print(f"{user_id}: {e!r}")
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(user_id) for user_id in users))
+    result = summarize(latencies, time.perf_counter() - start, errors, llm, before)
+    result["wiki_pages"] = sum(len(storage.wiki_manifest(user_id)) for user_id in users)
+    return result
+
+async def bench_reminders(args, users, llm, storage, telegram, **_) -> dict:
+    from src import bot
+    from src.common import get_config
+    from src.skills import reminders
+    due = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M")
+    expected = 0
+    for user_id in users:
+        for i in range(args.reminders):
+            reminders.add(user_id, f"benchmark reminder {i}", due, storage)
+            expected += 1
+
+    app = telegram.application()
+    fired = []
+    start = time.perf_counter()
+
+    async def send(user_id: str, reminder: dict):
+        await bot.send_reminder(app, user_id, reminder)
+        fired.append(time.perf_counter() - start)
+
+    before = llm.stats()
+    dispatcher = reminders.Dispatcher(send, storage, **{
+        **get_config().get("reminders", {}), "global_rate": args.reminder_rate, "per_chat_rate": args.reminder_rate,
+    })
+    loop = asyncio.create_task(reminders.loop(send, interval=1, storage=storage, dispatcher=dispatcher))
+    while dispatcher.sent + dispatcher.failed < expected:
+        await asyncio.sleep(0.01)
+    seconds = time.perf_counter() - start
+    loop.cancel()
+    # Every reminder is due when the loop starts, so latency is time from due to sent.
+    return summarize(fired, seconds, dispatcher.failed, llm, before)
+
+BENCHES = {
+    "chat": bench_chat,
+    "telegram": bench_telegram,
+    "consolidate": bench_consolidate,
+    "reminders": bench_reminders,
+}
+
+async def run(args) -> dict:
+    llm = FakeLLM(args.llm_latency_ms, args.llm_jitter, args.llm_ms_per_token,
+                  (args.chat_tokens_min, args.chat_tokens_max), args.seed)
+    os.environ["LLM_BASE_URL"] = await llm.start()
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ.pop("LLM_FALLBACK_BASE_URL", None)
+
+    from src import agent
+    from src.common import FileStorage
+    if not args.cache:
+        agent.response_cache = None
+
+    temp_dir = Path(tempfile.mkdtemp())
+    telegram = FakeTelegram(args.telegram_latency_ms)
+    report = {}
+    try:
+        storage = FileStorage(temp_dir)
+        use_storage(storage)
+        users = [str(100000 + i) for i in range(args.users)]
+        start = time.perf_counter()
+        prefill(storage, users, args.memory_kb, args.log_kb)
+        report["prefill_seconds"] = round(time.perf_counter() - start, 3)
+        for name in args.scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            report[name] = await BENCHES[name](
+                args, users=users, llm=llm, agent=agent, storage=storage, telegram=telegram,
+            )
+        await agent.drain()
+    finally:
+        await llm.close()
+        shutil.rmtree(temp_dir)
+    return report
+
+def compare(current: dict, previous: dict) -> list[str]:
+    """One line per shared scenario metric: previous -> current (change)."""
+    lines = [f"Compared with {previous.get('commit', '?')}:"]
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not isinstance(result, dict) or not isinstance(old, dict):
+            continue
+        metrics = [("throughput_per_sec", result.get("throughput_per_sec"), old.get("throughput_per_sec"))]
+        for pct in ("p50", "p95", "p99"):
+            metrics.append((f"{pct}_ms", (result.get("latency_ms") or {}).get(pct), (old.get("latency_ms") or {}).get(pct)))
+        metrics.append(("peak_rss_mb", result.get("peak_rss_mb"), old.get("peak_rss_mb")))
+        for metric, new, before in metrics:
+            if new is None or not before:
+                continue
+            lines.append(f"  {name}.{metric}: {before} -> {new} ({(new - before) / before:+.1%})")
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5, help="messages per user")
+    parser.add_argument("--concurrency", type=int, default=50, help="users active at once")
+    parser.add_argument("--memory-kb", type=int, default=64, help="prefilled memory.md size per user")
+    parser.add_argument("--log-kb", type=int, default=64, help="prefilled log.md size per user")
+    parser.add_argument("--reminders", type=int, default=2, help="due reminders per user")
+    parser.add_argument("--reminder-rate", type=float, default=1000, help="send rate limit for the reminders run")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="log-normal sigma of LLM latency")
+    parser.add_argument("--llm-ms-per-token", type=float, default=2)
+    parser.add_argument("--chat-tokens-min", type=int, default=40)
+    parser.add_argument("--chat-tokens-max", type=int, default=200)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    commit, dirty = git_commit()
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    results = {
+        "benchmark": "e2e",
+        "commit": commit,
+        "dirty": dirty,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": params,
+        "scenarios": asyncio.run(run(args)),
+    }
+    output = args.output or RESULTS_DIR / f"e2e-{commit}{'-dirty' if dirty else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {output}", file=sys.stderr)
+    if args.compare:
+        print("\n".join(compare(results, json.loads(args.compare.read_text()))))
+
+if __name__ == "__main__":
+    main()
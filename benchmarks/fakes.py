@@ -0,0 +1,210 @@
+"""Stand-ins for the LLM API and Telegram used by the end-to-end benchmarks.
+
+`FakeLLM` is a local OpenAI-compatible server (POST /v1/chat/completions,
+streaming included) with a configurable latency and token distribution. Its
+answers are shaped like the real model's for each of the app's prompts:
+intents, memory and reminder extraction, batched extraction, consolidation
+plans and chat replies. `FakeTelegram` plays the bot API for `src.bot`.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+WORDS = (
+    "sure thing that sounds like a good plan I will keep it in mind let me know if you want "
+    "anything else about your week work family health garden trip dinner project"
+).split()
+
+_TASK = re.compile(r"^### Task (\d+)\n", re.MULTILINE)
+_USER_LINE = re.compile(r"^User(?: message)?: (.*)$", re.MULTILINE)
+
+class FakeLLM:
+    """OpenAI-compatible server whose latency is `latency_ms` (log-normal, `jitter` sigma)
+    plus `ms_per_token` for each generated token; chat replies are `chat_tokens` long."""
+
+    def __init__(self, latency_ms: float = 300, jitter: float = 0.3, ms_per_token: float = 5,
+                 chat_tokens: tuple = (40, 200), seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.ms_per_token = ms_per_token
+        self.chat_tokens = chat_tokens
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port, limit=1 << 24)
+        return f"http://{host}:{self.server.sockets[0].getsockname()[1]}/v1"
+
+    async def close(self):
+        self.server.close()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens}
+
+    def _words(self, count: int) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def _reminders(self, prompt: str) -> dict:
+        message = (_USER_LINE.findall(prompt) or [""])[-1]
+        if "remind me" not in message.lower():
+            return {"reminders": []}
+        due = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%dT09:00")
+        return {"reminders": [{"text": message[:60], "due": due, "recurrence": None, "confidence": 0.9}]}
+
+    def _plan(self, prompt: str) -> dict:
+        quotes = [line[len("**User:** "):] for line in prompt.splitlines() if line.startswith("**User:** ")]
+        quotes = quotes or _USER_LINE.findall(prompt)
+        files = []
+        for i in range(0, min(len(quotes), 30), 10):
+            topic = self.random.choice(("work", "family", "health", "hobbies", "ideas"))
+            files.append({"filename": f"{topic}.md", "title": topic.title(), "quotes": quotes[i:i + 10]})
+        return {"files": files}
+
+    def _value(self, schema: dict):
+        """A minimal value of `schema`'s type, for schemas the app doesn't use yet."""
+        kind = schema.get("type", "string")
+        kind = kind[0] if isinstance(kind, list) else kind
+        if kind == "object":
+            return {name: self._value(sub) for name, sub in schema.get("properties", {}).items()}
+        return {"array": [], "string": "", "integer": 0, "number": 0, "boolean": False, "null": None}[kind]
+
+    def answer(self, prompt: str, schema: dict = None):
+        """What the fake model says to `prompt`: a string, or a JSON value when `schema` is given."""
+        properties = (schema or {}).get("properties", {})
+        if properties and all(name.isdigit() for name in properties):
+            blocks = _TASK.split(prompt)[1:]
+            tasks = {number: text.split("\n\nRespond with ONLY a JSON object mapping")[0]
+                     for number, text in zip(blocks[::2], blocks[1::2])}
+            return {
+                number: self.answer(tasks.get(number, ""), None if sub == {"type": "string"} else sub)
+                for number, sub in properties.items()
+            }
+        if "reminders" in properties:
+            return self._reminders(prompt)
+        if "files" in properties:
+            return self._plan(prompt)
+        if schema is not None:
+            return self._value(schema)
+        if prompt.startswith("Classify this user message"):
+            return "chat"
+        if prompt.startswith("Extract any facts"):
+            return "NOTHING" if self.random.random() < 0.5 else f"- {self._words(12)}"
+        return self._words(self.random.randint(*self.chat_tokens))
+
+    def _delay(self, tokens: int) -> float:
+        base = self.latency_ms * self.random.lognormvariate(0, self.jitter) if self.jitter else self.latency_ms
+        return (base + tokens * self.ms_per_token) / 1000
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                request = json.loads(await reader.readexactly(int(headers.get("content-length", 0))))
+                await self._respond(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request: dict, writer: asyncio.StreamWriter):
+        self.requests += 1
+        messages = request.get("messages", [])
+        prompt = "\n".join(m.get("content") or "" for m in messages)
+        if len(messages) > 1:
+            # Chat turns carry a system prompt; skills send a single user message.
+            content = self._words(self.random.randint(*self.chat_tokens))
+        else:
+            schema = (request.get("response_format") or {}).get("json_schema", {}).get("schema")
+            answer = self.answer(prompt, schema)
+            content = answer if isinstance(answer, str) else json.dumps(answer)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content.split())}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.completion_tokens += usage["completion_tokens"]
+
+        if not request.get("stream"):
+            await asyncio.sleep(self._delay(usage["completion_tokens"]))
+            body = json.dumps({
+                "id": f"fake-{self.requests}", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await asyncio.sleep(self._delay(0))
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            delta = word if i == len(words) - 1 else word + " "
+            self._event(writer, {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                                 "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]})
+            await writer.drain()
+            await asyncio.sleep(self.ms_per_token / 1000)
+        self._event(writer, {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                             "choices": [], "usage": usage})
+        self._chunk(writer, b"data: [DONE]\n\n")
+        self._chunk(writer, b"")
+        await writer.drain()
+
+    def _event(self, writer: asyncio.StreamWriter, data: dict):
+        self._chunk(writer, b"data: " + json.dumps(data).encode() + b"\n\n")
+
+    @staticmethod
+    def _chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+class FakeMessage:
+    def __init__(self, telegram: "FakeTelegram", chat_id: int, text: str = ""):
+        self.telegram = telegram
+        self.chat_id = chat_id
+        self.text = text
+
+    async def reply_text(self, text: str) -> "FakeMessage":
+        return await self.telegram.send_message(self.chat_id, text)
+
+    async def edit_text(self, text: str) -> "FakeMessage":
+        await self.telegram.call("edit")
+        self.text = text
+        return self
+
+class FakeTelegram:
+    """Bot API stand-in: every call takes `latency_ms`; sent messages are counted per chat."""
+
+    def __init__(self, latency_ms: float = 30):
+        self.latency = latency_ms / 1000
+        self.calls = {"send": 0, "edit": 0}
+        self.sent = {}
+
+    async def call(self, method: str):
+        await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+
+    async def send_message(self, chat_id: int, text: str) -> FakeMessage:
+        await self.call("send")
+        self.sent[chat_id] = self.sent.get(chat_id, 0) + 1
+        return FakeMessage(self, chat_id, text)
+
+    def update(self, chat_id: int, text: str) -> SimpleNamespace:
+        """An incoming text message, shaped like telegram.Update for `bot.handle_message`."""
+        return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=FakeMessage(self, chat_id, text))
+
+    def context(self) -> SimpleNamespace:
+        return SimpleNamespace(bot_data={})
+
+    def application(self) -> SimpleNamespace:
+        return SimpleNamespace(bot=self, bot_data={})
@@ -0,0 +1,99 @@
+"""Measure cold-start import time of the entry points and fail if it regresses.
+
+    python -m benchmarks.import_bench [--runs N] [--scale X] [--top N] [--modules M ...]
+
+Each entry point is imported `--runs` times in a fresh interpreter with
+`python -X importtime`, and the median cumulative time is checked against its
+budget in BUDGETS_MS, multiplied by `--scale` for slower machines. An entry
+point also fails if it imports a module it should leave alone: only the bot
+needs python-telegram-bot (which brings httpx), and openai waits for the
+first LLM call.
+Exits with status 1 on any failure, so it can gate CI.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# entry point -> (budget in ms, top-level packages it must not import)
+BUDGETS_MS = {
+    "src.main": (300, ("telegram", "openai", "httpx")),
+    "src.consolidate": (300, ("telegram", "openai", "httpx")),
+    "src.shard": (300, ("telegram", "openai", "httpx")),
+    "src.sqlite_storage": (200, ("telegram", "openai", "httpx")),
+    "src.bot": (600, ("openai",)),
+}
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for each line of `-X importtime` output."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def measure(module: str) -> list[tuple[str, int, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def run(modules: list[str], runs: int, scale: float, top: int) -> tuple[dict, list[str]]:
+    report = {}
+    failures = []
+    for module in modules:
+        budget_ms, forbidden = BUDGETS_MS.get(module, (300, ()))
+        budget_ms *= scale
+        totals = []
+        self_times = defaultdict(list)
+        imported = set()
+        for _ in range(runs):
+            rows = measure(module)
+            totals.append(next(cumulative for name, _, cumulative in rows if name == module) / 1000)
+            for name, self_us, _ in rows:
+                self_times[name].append(self_us / 1000)
+                imported.add(name.split(".")[0])
+        median_ms = statistics.median(totals)
+        heaviest = sorted(self_times, key=lambda name: -statistics.median(self_times[name]))[:top]
+        unwanted = sorted(imported & set(forbidden))
+        report[module] = {
+            "median_ms": round(median_ms, 1),
+            "min_ms": round(min(totals), 1),
+            "budget_ms": round(budget_ms, 1),
+            "modules": len(self_times),
+            "unwanted_imports": unwanted,
+            "heaviest_self_ms": {name: round(statistics.median(self_times[name]), 1) for name in heaviest},
+        }
+        if median_ms > budget_ms:
+            failures.append(f"{module}: {median_ms:.0f} ms is over its {budget_ms:.0f} ms budget")
+        if unwanted:
+            failures.append(f"{module}: imports {', '.join(unwanted)} at startup")
+    return report, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=list(BUDGETS_MS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports listed per entry point")
+    args = parser.parse_args()
+
+    report, failures = run(args.modules, args.runs, args.scale, args.top)
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark the local intent classifier against LLM labels.
+
+    python -m benchmarks.intent_bench [--llm] [--train] [--examples FILE]
+
+Labels come from benchmarks/intent_examples.jsonl; with --llm every message is
+relabeled by the configured extraction model and real LLM latency is measured.
+--train evaluates the NaiveBayes model leave-one-out on the same examples.
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from src.skills import intent
+
+EXAMPLES_FILE = Path(__file__).parent / "intent_examples.jsonl"
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def load_examples(path: Path) -> list[tuple[str, str]]:
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["message"], row["intent"]) for row in rows]
+
+async def llm_labels(messages: list[str]) -> tuple[list[str], list[float]]:
+    from src.agent import llm_call
+    labels, latencies = [], []
+    for message in messages:
+        start = time.perf_counter()
+        labels.append(await intent.detect_llm(lambda p: llm_call(p, "extraction"), message))
+        latencies.append(time.perf_counter() - start)
+    return labels, latencies
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def run(examples, threshold: float, train: bool, llm_latency: float) -> dict:
+    hits = correct = 0
+    latencies = []
+    tokens_saved = 0
+    for i, (message, label) in enumerate(examples):
+        classifier = intent.Classifier()
+        if train:
+            classifier.train(examples[:i] + examples[i + 1:])
+        start = time.perf_counter()
+        predicted, confidence = classifier.classify(message)
+        latencies.append(time.perf_counter() - start)
+        if confidence >= threshold:
+            hits += 1
+            correct += predicted == label
+            tokens_saved += estimate_tokens(intent.build_prompt(message)) + 1
+    return {
+        "examples": len(examples),
+        "local_hits": hits,
+        "coverage": hits / len(examples),
+        "local_accuracy": correct / hits if hits else None,
+        "local_p50_us": percentile(latencies, 0.5) * 1e6,
+        "local_p95_us": percentile(latencies, 0.95) * 1e6,
+        "llm_calls_saved": hits,
+        "tokens_saved": tokens_saved,
+        "latency_saved_s": hits * llm_latency,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--examples", type=Path, default=EXAMPLES_FILE)
+    parser.add_argument("--threshold", type=float, default=intent.CONFIDENCE_THRESHOLD)
+    parser.add_argument("--train", action="store_true")
+    parser.add_argument("--llm", action="store_true", help="relabel with the live LLM and time it")
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0,
+                        help="assumed LLM round-trip when --llm is not given")
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples)
+    llm_latency = args.llm_latency_ms / 1000
+    if args.llm:
+        labels, latencies = asyncio.run(llm_labels([m for m, _ in examples]))
+        examples = [(m, label) for (m, _), label in zip(examples, labels)]
+        llm_latency = sum(latencies) / len(latencies)
+
+    print(json.dumps(run(examples, args.threshold, args.train, llm_latency), indent=2))
+
+if __name__ == "__main__":
+    main()
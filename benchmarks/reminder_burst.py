@@ -0,0 +1,80 @@
+"""Load test: drain a burst of reminders that all come due at once.
+
+    python -m benchmarks.reminder_burst [--users 5000] [--latency-ms 50] [--concurrency 16]
+
+A fake bot sleeps for the given latency per send (and fails a fraction of
+sends) so the effect of the worker pool, rate limits and retries on drain
+time can be measured without Telegram.
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.common import FileStorage
+from src.skills import reminders
+
+class FakeBot:
+    def __init__(self, latency: float, failure_rate: float):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delivered = 0
+        self.failures = 0
+
+    async def send(self, user_id: str, reminder: dict):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            raise ConnectionError("fake send failed")
+        self.delivered += 1
+
+async def run(args) -> dict:
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        storage = FileStorage(temp_dir)
+        due = "2024-02-01T09:00"
+        for i in range(args.users):
+            reminders.add(f"user{i}", "stand-up meeting", due, storage)
+
+        bot = FakeBot(args.latency_ms / 1000, args.failure_rate)
+        dispatcher = reminders.Dispatcher(
+            bot.send, storage, concurrency=args.concurrency, global_rate=args.global_rate,
+            per_chat_rate=args.per_chat_rate, retries=3, backoff=0.05,
+        )
+        start = time.perf_counter()
+        loop = asyncio.create_task(reminders.loop(bot.send, storage=storage, dispatcher=dispatcher))
+        while dispatcher.sent + dispatcher.failed < args.users:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        loop.cancel()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return {
+        "reminders": args.users,
+        "concurrency": args.concurrency,
+        "global_rate": args.global_rate,
+        "latency_ms": args.latency_ms,
+        "drain_seconds": round(elapsed, 3),
+        "delivered": bot.delivered,
+        "send_failures": bot.failures,
+        "gave_up": dispatcher.failed,
+        "throughput_per_sec": round(args.users / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--global-rate", type=float, default=25)
+    parser.add_argument("--per-chat-rate", type=float, default=1)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
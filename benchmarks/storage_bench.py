@@ -0,0 +1,75 @@
+"""Compare the file and SQLite storage backends.
+
+    python -m benchmarks.storage_bench [--users 10000] [--entries 5]
+
+Each backend gets the same synthetic users (memory entries, log turns and one
+reminder each); the phases below are timed separately.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.common import FileStorage
+from src.sqlite_storage import SQLiteStorage
+
+TIMESTAMP = "2024-02-01 09:00"
+
+def timed(results: dict, name: str, ops: int, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    results[name] = {"seconds": round(elapsed, 4), "ops_per_sec": round(ops / elapsed) if elapsed else None}
+
+def bench(storage, users: list[str], entries: int) -> dict:
+    results = {}
+
+    def write():
+        for user_id in users:
+            for i in range(entries):
+                storage.append_memory(user_id, TIMESTAMP, f"- fact {i} about {user_id}")
+                storage.append_log(user_id, TIMESTAMP, f"message {i}", f"reply {i}")
+            storage.add_reminder(user_id, f"task for {user_id}", "2024-02-01T10:00")
+
+    def read():
+        for user_id in users:
+            storage.read_memory(user_id)
+            storage.list_reminders(user_id)
+
+    def load_schedule():
+        assert sum(1 for _ in storage.pending_reminders()) == len(users)
+
+    def complete():
+        for user_id in users:
+            storage.complete_reminder(user_id, f"task for {user_id}")
+
+    timed(results, "write", len(users) * (2 * entries + 1), write)
+    timed(results, "read", len(users) * 2, read)
+    timed(results, "read_again", len(users) * 2, read)
+    timed(results, "list_users", 1, storage.get_all_user_ids)
+    timed(results, "load_schedule", len(users), load_schedule)
+    timed(results, "complete", len(users), complete)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--entries", type=int, default=5)
+    args = parser.parse_args()
+
+    users = [f"user{i}" for i in range(args.users)]
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        report = {
+            "users": args.users,
+            "entries": args.entries,
+            "files": bench(FileStorage(temp_dir / "data"), users, args.entries),
+            "sqlite": bench(SQLiteStorage(temp_dir / "bench.db"), users, args.entries),
+        }
+    finally:
+        shutil.rmtree(temp_dir)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
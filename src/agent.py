@@ -1,31 +1,103 @@
+import asyncio
 import os
-from openai import AsyncOpenAI
-from src.common import escape_markdown, config
-from src.skills import memory, reminders, intent
+from typing import AsyncIterator, Optional
+from src import batcher, llm_cache, metrics, structured
+from src.common import escape_markdown, get_config, estimate_tokens, format_reminder
+from src.skills import history, memory, recall, reminders, intent, search
 
 base_url = os.environ.get(
     "LLM_BASE_URL",
     "https://openrouter.ai/api/v1"
 )
 
-client = AsyncOpenAI(
-    base_url=base_url,
-    api_key=os.environ.get("OPENROUTER_API_KEY"),
-)
+# Pooled, retrying, failing-over client, built by get_client() on first use; see src/transport.py
+client = None
+
+def get_client():
+    """The LLM client. Building it imports openai and httpx, so it waits until a call needs it."""
+    global client
+    if client is None:
+        from src import transport
+        client = metrics.instrument(transport.from_config(
+            get_config().get("llm", {}),
+            base_url,
+            os.environ.get("OPENROUTER_API_KEY"),
+        ))
+    return client
+
+# Optional cache for extraction/intent answers; see src/llm_cache.py
+response_cache = llm_cache.from_config(get_config().get("llm_cache", {}))
 
 def get_model(usage: str) -> str:
     """Get model for a specific usage type from config."""
-    return config.get("models", {}).get(usage, "google/gemini-2.0-flash-001")
-
-async def llm_call(prompt: str, usage: str = "extraction") -> str:
-    """Generic LLM call with configurable model based on usage."""
-    model = get_model(usage)
-    response = await client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=500,
-    )
-    return response.choices[0].message.content
+    return get_config().get("models", {}).get(usage, "google/gemini-2.0-flash-001")
+
+# Answer length for extraction-sized calls; consolidation asks for more.
+DEFAULT_MAX_TOKENS = 500
+
+async def complete(prompt: str, usage: str = "extraction", skill: str = None, user_id: str = None,
+                   max_tokens: int = DEFAULT_MAX_TOKENS, schema: dict = None,
+                   allow_cut_off: bool = True) -> Optional[str]:
+    """One uncached completion of `prompt`, labelled for `src.metrics`.
+
+    With `schema` the answer is constrained to matching JSON via `response_format`.
+    Without `allow_cut_off`, an answer that ran into `max_tokens` is returned as None.
+    """
+    skill = skill or usage
+    kwargs = {}
+    if schema is not None:
+        kwargs["response_format"] = structured.response_format(skill, schema)
+    with metrics.labels(usage=usage, skill=skill, user=user_id):
+        response = await get_client().chat.completions.create(
+            model=get_model(usage),
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+    choice = response.choices[0]
+    if not allow_cut_off and choice.finish_reason == "length":
+        print(f"LLM {usage} answer for {skill} hit max_tokens={max_tokens}; discarding it")
+        return None
+    return choice.message.content
+
+# Optional micro-batching of extraction prompts across users; see src/batcher.py
+extraction_batcher = batcher.from_config(
+    get_config().get("extraction_batch", {}),
+    lambda prompt, **kwargs: complete(prompt, "extraction", **kwargs),
+)
+
+async def llm_call(prompt: str, usage: str = "extraction", skill: str = None, user_id: str = None,
+                   schema: dict = None, max_tokens: int = DEFAULT_MAX_TOKENS,
+                   allow_cut_off: bool = True) -> Optional[str]:
+    """Generic LLM call with configurable model based on usage.
+
+    `skill` and `user_id` label the call in `src.metrics`; skills enabled in
+    the llm_cache config are answered from `response_cache` when possible,
+    and misses for skills in the extraction_batch config share a request
+    with other users' prompts. `schema` asks for JSON; see `src.structured`.
+    `max_tokens` and `allow_cut_off` are passed to `complete`.
+    """
+    skill = skill or usage
+    cache_key = None
+    if response_cache is not None and response_cache.allows(usage, skill):
+        cache_key = response_cache.key(get_model(usage), prompt)
+        cached = response_cache.get(cache_key, skill)
+        metrics.registry.record_cache(usage, skill, hit=cached is not None)
+        if cached is not None:
+            return cached
+
+    if extraction_batcher is not None and extraction_batcher.allows(usage, skill):
+        content = await extraction_batcher.submit(prompt, skill, user_id, schema)
+    else:
+        content = await complete(prompt, usage, skill, user_id, max_tokens=max_tokens, schema=schema,
+                                 allow_cut_off=allow_cut_off)
+    if cache_key is not None and content is not None:
+        response_cache.put(cache_key, content)
+    return content
+
+def skill_call(skill: str, user_id: str, usage: str = "extraction"):
+    """An `llm_call` bound to a usage and metric labels, in the shape skills expect."""
+    return lambda p, **kwargs: llm_call(p, usage, skill=skill, user_id=user_id, **kwargs)
 
 async def handle_organize(user_id: str) -> str:
     """Handle organize intent."""
@@ -35,13 +107,10 @@ async def handle_organize(user_id: str) -> str:
 async def handle_show_notes(user_id: str) -> str:
     """Handle show_notes intent."""
     from src.consolidate import get_wiki_tree
-    wiki_content = memory.read(user_id)
-    tree = get_wiki_tree(user_id)
-
-    if not wiki_content.strip():
+    if memory.is_empty(user_id):
         return "You don't have any notes yet. Just chat with me and I'll remember important things!"
 
-    return f"📝 Your Notes:\n\n{tree}"
+    return f"📝 Your Notes:\n\n{get_wiki_tree(user_id)}"
 
 async def handle_show_reminders(user_id: str) -> str:
     """Handle show_reminders intent."""
@@ -52,30 +121,52 @@ async def handle_show_reminders(user_id: str) -> str:
 
     return f"⏰ Your Reminders:\n\n{reminder_content}"
 
-async def chat(user_id: str, user_message: str) -> str:
-    # Detect intent using LLM
-    intent_call = lambda p: llm_call(p, "extraction")
-    detected_intent = await intent.detect(intent_call, user_message)
+async def handle_search(user_id: str, user_message: str) -> str:
+    """Handle search intent: the notes, turns and wiki quotes closest to the message's topic."""
+    settings = get_config().get("search", {})
+    hits = await search.search(user_id, search.query_text(user_message), top_k=settings.get("top_k", 5))
+    if not hits:
+        return "I couldn't find anything about that in your notes yet."
+
+    return "🔎 Here's what I found:\n\n" + "\n".join(search.format_item(item) for _, item in hits)
+
+background_tasks: set[asyncio.Task] = set()
+
+async def post_process(user_id: str, user_message: str, assistant_response: str, reminder_task: asyncio.Future) -> dict:
+    """Run memory and reminder extraction side by side; one failing doesn't lose the other."""
+    names = ("memory", "reminders")
+    results = await asyncio.gather(
+        memory.extract_and_store(skill_call("memory", user_id), user_id, user_message, assistant_response),
+        reminder_task,
+        return_exceptions=True,
+    )
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"{name} extraction failed for {user_id}: {result!r}")
+    return dict(zip(names, results))
 
-    # Handle special intents
+async def drain():
+    """Wait for background post-processing started by `chat(..., background=True)`."""
+    while background_tasks:
+        await asyncio.gather(*list(background_tasks), return_exceptions=True)
+
+async def handle_intent(user_id: str, detected_intent: str, user_message: str = "") -> Optional[str]:
+    """Run a special intent's handler; None means plain chat."""
     if detected_intent == "organize":
         return await handle_organize(user_id)
     elif detected_intent == "show_notes":
         return await handle_show_notes(user_id)
     elif detected_intent == "show_reminders":
         return await handle_show_reminders(user_id)
+    elif detected_intent == "search":
+        return await handle_search(user_id, user_message)
+    return None
 
-    # Default: chat
-    user_memory = escape_markdown(memory.read(user_id), version=2)
-    user_reminders = escape_markdown(reminders.read(user_id), version=2)
-
-    system = f"""You are a helpful personal assistant with memory. You remember details about the user and help them stay organized.
+# Longest chat reply asked for; reserved out of the context budget.
+CHAT_REPLY_TOKENS = 1000
 
-## Your Memory
-{user_memory}
-
-## Active Reminders
-{user_reminders}
+# Identical for every user and turn, so it leads the prompt as a cacheable prefix.
+SYSTEM_PROMPT = """You are a helpful personal assistant with memory. You remember details about the user and help them stay organized.
 
 ## Instructions
 Be conversational and helpful. If the user mentions something worth remembering (facts, preferences, plans), acknowledge it naturally.
@@ -83,22 +174,141 @@ Be conversational and helpful. If the user mentions something worth remembering
 For reminders:
 - If the user mentions a reminder WITHOUT a specific time, ask when they want to be reminded
 - If the user mentions a reminder WITH a specific time, confirm you'll remind them at that time
-- Do NOT confirm you'll track a reminder until you have a specific time"""
-
-    model = get_model("chat")
-    response = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_message},
-        ],
-        max_tokens=1000,
+- Do NOT confirm you'll track a reminder until you have a specific time
+
+The recent conversation follows, then what you currently know about the user."""
+
+CONTEXT_PROMPT = """## Your Memory
+{memory}
+
+## Active Reminders
+{reminders}"""
+
+def context_budget(model: str) -> int:
+    """Prompt tokens allowed for `model`, from config.json's "context" budgets."""
+    budgets = get_config().get("context", {}).get("budgets", {})
+    return budgets.get(model, budgets.get("default", 8000))
+
+def build_messages(user_id: str, user_message: str) -> list[dict]:
+    """The chat prompt: fixed system prompt, recent turns, then memory and reminders, then the message.
+
+    Everything before the memory block changes only when a turn is added (or
+    the history window moves), so providers can reuse the cached prefix.
+    Recent turns and memory share what's left of the model's budget after the
+    reply, the message and the reminders; turns are served first.
+    """
+    settings = get_config().get("memory_context", {})
+    budget = get_config().get("context", {})
+    open_reminders = "".join(
+        format_reminder(r["text"], r["due"], every=r["every"], tz=r["tz"])
+        for r in reminders.parse(user_id) if not r["completed"]
+    )
+    user_reminders = escape_markdown(open_reminders, version=2)
+
+    available = (
+        context_budget(get_model("chat")) - CHAT_REPLY_TOKENS
+        - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(CONTEXT_PROMPT)
+        - estimate_tokens(user_reminders) - estimate_tokens(user_message) - 3 * history.MESSAGE_TOKENS
+    )
+    turns = history.window(user_id, max(0, min(budget.get("history_tokens", 2000), available)))
+    available -= sum(estimate_tokens(u) + estimate_tokens(a) + 2 * history.MESSAGE_TOKENS for u, a in turns)
+
+    relevant_memory = recall.select(
+        user_id,
+        user_message,
+        top_k=settings.get("top_k", 8),
+        max_tokens=max(0, min(settings.get("max_tokens", 1000), available)),
+        recent=settings.get("recent", 2),
+    )
+    user_memory = escape_markdown(relevant_memory, version=2)
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for past_message, past_response in turns:
+        messages.append({"role": "user", "content": past_message})
+        messages.append({"role": "assistant", "content": past_response})
+    messages.append({"role": "system", "content": CONTEXT_PROMPT.format(memory=user_memory, reminders=user_reminders)})
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+def start_reminder_extraction(user_id: str, user_message: str) -> asyncio.Task:
+    return asyncio.create_task(
+        reminders.extract_and_store(skill_call("reminders", user_id), user_id, user_message)
     )
-    assistant_response = response.choices[0].message.content
 
-    # Use extraction model for these
-    extraction_call = lambda p: llm_call(p, "extraction")
-    await memory.extract_and_store(extraction_call, user_id, user_message, assistant_response)
-    await reminders.extract_and_store(extraction_call, user_id, user_message)
+async def finish(user_id: str, user_message: str, assistant_response: str, reminder_task: asyncio.Task, background: bool):
+    extraction = post_process(user_id, user_message, assistant_response, reminder_task)
+    if background:
+        task = asyncio.create_task(extraction)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    else:
+        await extraction
+
+async def chat(user_id: str, user_message: str, background: bool = False) -> str:
+    """Reply to a message.
+
+    Reminder extraction only needs the user message, so it starts alongside
+    intent detection. With `background=True` memory/reminder extraction
+    finishes after the reply is returned; see `drain()`.
+    """
+    reminder_task = start_reminder_extraction(user_id, user_message)
+    try:
+        # Detect intent using LLM
+        detected_intent = await intent.detect(skill_call("intent", user_id), user_message)
+
+        # Handle special intents
+        if detected_intent != "chat":
+            reminder_task.cancel()
+            return await handle_intent(user_id, detected_intent, user_message)
+
+        # Default: chat
+        with metrics.labels(usage="chat", skill="chat", user=user_id):
+            response = await get_client().chat.completions.create(
+                model=get_model("chat"),
+                messages=build_messages(user_id, user_message),
+                max_tokens=CHAT_REPLY_TOKENS,
+            )
+        assistant_response = response.choices[0].message.content
+    except BaseException:
+        reminder_task.cancel()
+        raise
 
+    await finish(user_id, user_message, assistant_response, reminder_task, background)
     return assistant_response
+
+async def chat_stream(user_id: str, user_message: str, background: bool = True) -> AsyncIterator[str]:
+    """Like `chat`, but yield the reply in chunks as the model produces them.
+
+    Special intents yield their whole reply at once. Extraction starts once
+    the stream is complete.
+    """
+    reminder_task = start_reminder_extraction(user_id, user_message)
+    parts = []
+    try:
+        detected_intent = await intent.detect(skill_call("intent", user_id), user_message)
+
+        if detected_intent != "chat":
+            reminder_task.cancel()
+            yield await handle_intent(user_id, detected_intent, user_message)
+            return
+
+        with metrics.labels(usage="chat", skill="chat", user=user_id):
+            stream = await get_client().chat.completions.create(
+                model=get_model("chat"),
+                messages=build_messages(user_id, user_message),
+                max_tokens=CHAT_REPLY_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    except BaseException:
+        reminder_task.cancel()
+        raise
+
+    await finish(user_id, user_message, "".join(parts), reminder_task, background)
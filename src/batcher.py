@@ -0,0 +1,149 @@
+"""Micro-batching of extraction prompts across users.
+
+Extraction prompts submitted within `window` seconds of each other (or until
+`max_items` are waiting) are sent as one numbered multi-task prompt; the JSON
+answer is split back out to each caller. Prompts with a JSON schema get it as
+their slot in the batch's schema. Items the model drops, or a whole batch
+that doesn't parse, are retried as ordinary single calls.
+"""
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from src import structured
+
+DEFAULT_SKILLS = ("memory", "reminders")
+
+BATCH_PROMPT = """You are given {count} independent tasks. Answer each one exactly as its own instructions ask, without referring to the other tasks.
+
+{tasks}
+
+Respond with ONLY a JSON object mapping each task number to its answer, e.g. {{"1": "...", "2": "..."}}. Answers are strings, except that a task asking for JSON gets that JSON value. Include every task number."""
+
+@dataclass
+class _Job:
+    prompt: str
+    skill: str
+    user_id: Optional[str]
+    schema: Optional[dict]
+    future: asyncio.Future
+
+def build_prompt(prompts: list[str]) -> str:
+    tasks = "\n\n".join(f"### Task {i}\n{prompt}" for i, prompt in enumerate(prompts, 1))
+    return BATCH_PROMPT.format(count=len(prompts), tasks=tasks)
+
+def batch_schema(schemas: list[Optional[dict]]) -> dict:
+    properties = {str(i): schema or {"type": "string"} for i, schema in enumerate(schemas, 1)}
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def parse_answers(text: str, count: int) -> Optional[dict[int, str]]:
+    """Answers by task number (1-based) from a batch reply, or None if it isn't a JSON object.
+
+    Structured answers come back re-serialized, so every caller gets a string.
+    """
+    data = structured.parse_json(text)
+    if not isinstance(data, dict):
+        return None
+    answers = {}
+    for key, value in data.items():
+        try:
+            number = int(key)
+        except (TypeError, ValueError):
+            continue
+        if not 1 <= number <= count or value is None:
+            continue
+        answers[number] = value if isinstance(value, str) else json.dumps(value)
+    return answers
+
+class Batcher:
+    """Collects extraction prompts and answers them in shared LLM calls.
+
+    `send(prompt, skill=..., user_id=..., max_tokens=..., schema=...)` makes one completion;
+    batches are sent with skill "batch" and no user.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[str]], window: float = 0.2, max_items: int = 16,
+                 max_tokens: int = 500, skills: tuple = DEFAULT_SKILLS):
+        self.send = send
+        self.window = window
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.skills = set(skills)
+        self._pending: list[_Job] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def allows(self, usage: str, skill: str) -> bool:
+        return usage == "extraction" and skill in self.skills
+
+    async def submit(self, prompt: str, skill: str, user_id: str = None, schema: dict = None) -> str:
+        loop = asyncio.get_running_loop()
+        job = _Job(prompt, skill, user_id, schema, loop.create_future())
+        self._pending.append(job)
+        if len(self._pending) >= self.max_items:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await job.future
+
+    def flush(self):
+        """Send whatever is waiting now instead of at the end of the window."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        jobs, self._pending = self._pending, []
+        if jobs:
+            task = asyncio.create_task(self._run(jobs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _single(self, job: _Job):
+        try:
+            result = await self.send(
+                job.prompt, skill=job.skill, user_id=job.user_id, max_tokens=self.max_tokens, schema=job.schema,
+            )
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def _run(self, jobs: list[_Job]):
+        jobs = [job for job in jobs if not job.future.done()]
+        if len(jobs) <= 1:
+            await asyncio.gather(*(self._single(job) for job in jobs))
+            return
+        try:
+            reply = await self.send(
+                build_prompt([job.prompt for job in jobs]),
+                skill="batch", user_id=None, max_tokens=self.max_tokens * len(jobs),
+                schema=batch_schema([job.schema for job in jobs]),
+            )
+        except Exception as e:
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+        answers = parse_answers(reply, len(jobs))
+        if answers is None:
+            print(f"Batch of {len(jobs)} extraction prompts didn't parse; retrying one by one")
+            answers = {}
+        retry = []
+        for number, job in enumerate(jobs, 1):
+            if number not in answers:
+                retry.append(job)
+            elif not job.future.done():
+                job.future.set_result(answers[number])
+        await asyncio.gather(*(self._single(job) for job in retry))
+
+def from_config(settings: dict, send: Callable[..., Awaitable[str]]) -> Optional[Batcher]:
+    """Build the batcher described by config.json's "extraction_batch" section, or None if disabled."""
+    if not settings.get("enabled"):
+        return None
+    return Batcher(
+        send,
+        window=settings.get("window", 0.2),
+        max_items=settings.get("max_items", 16),
+        skills=tuple(settings.get("skills", DEFAULT_SKILLS)),
+    )
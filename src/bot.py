@@ -1,13 +1,22 @@
 import asyncio
 import os
+import time
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
-from src.agent import chat
+from src import metrics, webhook
+from src.agent import chat_stream, drain
+from src.common import get_config, storage
+from src.shard import ShardDispatcher
 from src.skills import reminders
 
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
+# Telegram rate-limits edits; don't update a streaming reply more often than this.
+EDIT_INTERVAL = 1.0
+PLACEHOLDER = "…"
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_chat.id)
     print(f"User started: {user_id}")
@@ -17,29 +26,82 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_chat.id)
     user_message = update.message.text
     print(f"Message from {user_id}: {user_message}")
-    response = await chat(user_id, user_message)
-    await update.message.reply_text(response)
+    # With shards, the message is forwarded here, before the first await, so
+    # concurrent updates from one user reach their worker in order.
+    shards = context.bot_data.get("shards")
+    replies = shards.chat(user_id, user_message) if shards else chat_stream(user_id, user_message)
+    message = await update.message.reply_text(PLACEHOLDER)
+    sent = PLACEHOLDER
+    response = ""
+    last_edit = 0.0
+
+    async def edit(text: str):
+        nonlocal sent, last_edit
+        if not text.strip() or text == sent:
+            return
+        try:
+            await message.edit_text(text)
+            sent = text
+        except BadRequest as e:
+            print(f"Failed to edit reply for {user_id}: {e}")
+        last_edit = time.monotonic()
+
+    async for chunk in replies:
+        response += chunk
+        if time.monotonic() - last_edit >= EDIT_INTERVAL:
+            await edit(response)
+    await edit(response)
 
 async def send_reminder(app: Application, user_id: str, reminder: dict):
+    """Send one reminder; errors propagate so the reminder dispatcher can retry."""
     print(f"Sending reminder to {user_id}: {reminder['text']}")
     try:
         await app.bot.send_message(chat_id=int(user_id), text=f"🔔 REMINDER: {reminder['text']}")
     except Exception as e:
         print(f"Failed to send reminder to {user_id}: {e}")
+        raise
 
 async def post_init(app: Application):
     async def reminder_callback(user_id: str, reminder: dict):
         await send_reminder(app, user_id, reminder)
-    asyncio.create_task(reminders.loop(reminder_callback, interval=60))
+    workers = int(os.environ.get("BOT_WORKERS", get_config().get("telegram", {}).get("workers", 1)))
+    if workers > 1:
+        # Workers own storage and reminders; this process only talks to Telegram.
+        shards = app.bot_data["shards"] = ShardDispatcher(workers, reminder_callback)
+        await shards.start()
+    else:
+        asyncio.create_task(reminders.loop(reminder_callback, interval=60))
+        asyncio.create_task(storage.sync_loop())
+    await metrics.start(get_config().get("metrics", {}))
 
-def main():
-    app = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+async def post_shutdown(app: Application):
+    shards = app.bot_data.get("shards")
+    if shards:
+        await shards.stop()
+    storage.sync()
 
+def build_app(settings: dict) -> Application:
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(settings.get("concurrent_updates", True))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
 
-    print("Bot running...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+def main():
+    settings = get_config().get("telegram", {})
+    app = build_app(settings)
+    mode = os.environ.get("BOT_MODE", settings.get("mode", "polling"))
+    print(f"Bot running ({mode})...")
+    if mode == "webhook":
+        asyncio.run(webhook.run(app, webhook.settings_from_env(settings.get("webhook", {})), drain=drain))
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
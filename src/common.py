@@ -1,13 +1,22 @@
+import asyncio
 import json
+import os
 import re
+import sys
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from pathlib import Path
-from telegram.helpers import escape_markdown
+from typing import Any, Callable, Iterator, Optional
 
 DEFAULT_DATA_DIR = Path(__file__).parent.parent / "data"
 CONFIG_FILE = Path(__file__).parent.parent / "config.json"
 
-# Re-export escape_markdown from telegram.helpers
-__all__ = ['escape_markdown', 'sanitize_user_id', 'Storage', 'storage', 'config']
+# log.md is closed into log/ as a segment once it reaches this size (or a new month starts).
+DEFAULT_SEGMENT_BYTES = 1 << 20
+
+__all__ = ['escape_markdown', 'sanitize_user_id', 'estimate_tokens', 'FileCache', 'Storage', 'FileStorage', 'open_storage', 'storage', 'get_config']
 
 def load_config() -> dict:
     """Load config from config.json."""
@@ -16,7 +25,32 @@ def load_config() -> dict:
             return json.load(f)
     return {"models": {}}
 
-config = load_config()
+_config = None
+
+def get_config() -> dict:
+    """config.json, read on first use and shared by every caller after that."""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+def escape_markdown(text: str, version: int = 1, entity_type: Optional[str] = None) -> str:
+    """Escape Telegram markup symbols, as telegram.helpers.escape_markdown does.
+
+    Kept here so that only the bot has to import python-telegram-bot.
+    """
+    if int(version) == 1:
+        escape_chars = r"_*`["
+    elif int(version) == 2:
+        if entity_type in ("pre", "code"):
+            escape_chars = r"\`"
+        elif entity_type in ("text_link", "custom_emoji"):
+            escape_chars = r"\)"
+        else:
+            escape_chars = r"\_*[]()~`>#+-=|{}.!"
+    else:
+        raise ValueError("Markdown version must be either 1 or 2!")
+    return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
 
 def sanitize_user_id(user_id: str) -> str:
     """Sanitize user_id to prevent path traversal. Allow only alphanumeric, dash, underscore."""
@@ -25,20 +59,720 @@ def sanitize_user_id(user_id: str) -> str:
         raise ValueError("Invalid user_id")
     return sanitized
 
-class Storage:
-    def __init__(self, data_dir: Path = None):
+# Markdown layout of the per-user files. FileStorage stores these directly;
+# other backends render them so prompts and exports look the same.
+
+_ENTRY_HEADER = re.compile(r"^## (\d{4}-\d{2}-\d{2} \d{2}:\d{2})$", re.MULTILINE)
+_REMINDER_LINE = re.compile(r"- \[([ x])\] ([^`\n]+?)((?:\s+`\w+:[^`]+`)*)\s*$")
+_REMINDER_TAG = re.compile(r"`(\w+):([^`]+)`")
+_DUE_TAG = re.compile(r"`due:[^`]+`")
+
+def format_memory_entry(timestamp: str, content: str) -> str:
+    return f"\n## {timestamp}\n{content}\n"
+
+def format_log_turn(timestamp: str, user_message: str, assistant_response: str) -> str:
+    return (
+        f"\n## {timestamp}\n"
+        f"**User:** {user_message}\n\n"
+        f"**Assistant:** {assistant_response}\n"
+    )
+
+def format_reminder(text: str, due: Optional[str] = None, completed: bool = False,
+                    every: Optional[str] = None, tz: Optional[str] = None) -> str:
+    line = f"- [{'x' if completed else ' '}] {text}"
+    for name, value in (("due", due), ("every", every), ("tz", tz)):
+        if value:
+            line += f" `{name}:{value}`"
+    return f"{line}\n"
+
+def parse_entries(content: str) -> list[tuple[str, str]]:
+    """Split memory.md/log.md into (timestamp, body) pairs on their `## ` headers."""
+    matches = list(_ENTRY_HEADER.finditer(content))
+    entries = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        body = content[match.end() + 1:end]
+        entries.append((match.group(1), body.rstrip("\n")))
+    return entries
+
+def parse_log_turn(body: str) -> tuple[str, str]:
+    """Split a log.md entry body into (user_message, assistant_response)."""
+    user, _, assistant = body.partition("\n\n**Assistant:** ")
+    return user.removeprefix("**User:** "), assistant
+
+def parse_reminders(content: str) -> list[dict]:
+    reminders = []
+    for line in content.split("\n"):
+        match = _REMINDER_LINE.match(line.strip())
+        if match:
+            tags = dict(_REMINDER_TAG.findall(match.group(3)))
+            reminders.append({
+                "text": match.group(2).strip(),
+                "completed": match.group(1) == "x",
+                "due": tags.get("due"),
+                "every": tags.get("every"),
+                "tz": tags.get("tz"),
+            })
+    return reminders
+
+def complete_reminder_line(content: str, text: str) -> Optional[str]:
+    """Tick the first open reminder containing `text`; None if there is none."""
+    lines = content.split("\n")
+    for i, line in enumerate(lines):
+        if text in line and "- [ ]" in line:
+            lines[i] = line.replace("- [ ]", "- [x]")
+            return "\n".join(lines)
+    return None
+
+def reschedule_reminder_line(content: str, text: str, due: str) -> Optional[str]:
+    """Set the due time of the first open reminder containing `text`; None if there is none."""
+    lines = content.split("\n")
+    for i, line in enumerate(lines):
+        if text in line and "- [ ]" in line:
+            if _DUE_TAG.search(line):
+                lines[i] = _DUE_TAG.sub(f"`due:{due}`", line, count=1)
+            else:
+                lines[i] = f"{line.rstrip()} `due:{due}`"
+            return "\n".join(lines)
+    return None
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for budgeting prompts."""
+    return (len(text) + 3) // 4
+
+def parse_wiki_page(content: str) -> tuple[str, list[str]]:
+    """A wiki page's (title, quotes): its first `# ` heading and its `- ` bullets."""
+    title = ""
+    quotes = []
+    for line in content.split("\n"):
+        if line.startswith("# ") and not title:
+            title = line[2:].strip()
+        elif line.startswith("- "):
+            quotes.append(line[2:])
+    return title, quotes
+
+def wiki_filename(filename: str) -> str:
+    """Reduce an LLM-chosen wiki filename to a safe `name.md`."""
+    name = Path(filename.strip()).name
+    if not name.endswith(".md"):
+        name += ".md"
+    return name
+
+class FileCache:
+    """LRU cache of file contents (and values derived from them), bounded by entry count and bytes.
+
+    Entries are keyed by path and validated against the file's mtime/size, so
+    edits made outside the bot (e.g. in Obsidian) are picked up on the next read.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def peek(self, path: Path, stamp) -> Optional[dict]:
+        """Return the entry if it is current, without touching counters or LRU order."""
+        entry = self._entries.get(path)
+        if entry is None or entry["stamp"] != stamp:
+            return None
+        return entry
+
+    def get(self, path: Path, stamp) -> Optional[dict]:
+        with self._lock:
+            entry = self.peek(path, stamp)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(path)
+            return entry
+
+    def put(self, path: Path, stamp, content: str) -> dict:
+        with self._lock:
+            self.discard(path)
+            entry = {"stamp": stamp, "content": content, "derived": {}, "size": sys.getsizeof(content)}
+            self._entries[path] = entry
+            self.size += entry["size"]
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, old = self._entries.popitem(last=False)
+                self.size -= old["size"]
+                self.evictions += 1
+            return entry
+
+    def discard(self, path: Path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self.size -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+class UserCache:
+    """In-memory per-user objects (histories, indexes), kept separately for each storage.
+
+    Past `max_users` per storage, the least recently `put` users are dropped.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users = weakref.WeakKeyDictionary()
+
+    def _for(self, storage: "Storage") -> OrderedDict:
+        if storage not in self._users:
+            self._users[storage] = OrderedDict()
+        return self._users[storage]
+
+    def get(self, storage: "Storage", user_id: str) -> Optional[Any]:
+        """The user's object, without making them more recent."""
+        return self._for(storage).get(sanitize_user_id(user_id))
+
+    def put(self, storage: "Storage", user_id: str, value: Any):
+        users = self._for(storage)
+        key = sanitize_user_id(user_id)
+        users[key] = value
+        users.move_to_end(key)
+        while len(users) > self.max_users:
+            users.popitem(last=False)
+
+    def clear(self):
+        self._users.clear()
+
+def atomic_write(path: Path, text: str):
+    """Replace `path` via a fsynced temp file and rename, so readers never see a torn file."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    # The rename itself is only durable once the directory entry is on disk.
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _stamp(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class Storage(ABC):
+    """Per-user state: memory, conversation log, reminders and wiki pages.
+
+    FileStorage keeps the Obsidian-compatible markdown tree under data/;
+    src/sqlite_storage.py has a SQLite backend with the same interface.
+    """
+
+    @abstractmethod
+    def get_all_user_ids(self) -> list[str]: ...
+
+    @abstractmethod
+    def read_memory(self, user_id: str) -> str: ...
+
+    @abstractmethod
+    def append_memory(self, user_id: str, timestamp: str, content: str): ...
+
+    @abstractmethod
+    def read_log(self, user_id: str) -> str: ...
+
+    @abstractmethod
+    def append_log(self, user_id: str, timestamp: str, user_message: str, assistant_response: str): ...
+
+    def iter_log(self, user_id: str, start: int = 0) -> Iterator[tuple[int, str]]:
+        """Yield (offset, text) pieces of the log, oldest first, skipping pieces that end before `start`.
+
+        Offsets are into the whole log as `read_log` returns it.
+        """
+        yield 0, self.read_log(user_id)
+
+    def read_log_from(self, user_id: str, start: int) -> str:
+        """The log from character `start` on, reading only the pieces that overlap it."""
+        pieces = list(self.iter_log(user_id, start))
+        if not pieces:
+            return ""
+        return "".join(text for _, text in pieces)[max(0, start - pieces[0][0]):]
+
+    def log_length(self, user_id: str) -> int:
+        return len(self.read_log(user_id))
+
+    def tail_log(self, user_id: str, max_chars: int) -> str:
+        """The last `max_chars` characters of the log."""
+        return self.read_log_from(user_id, max(0, self.log_length(user_id) - max_chars))
+
+    @abstractmethod
+    def compact_memory(self, user_id: str, count: int, timestamp: str, summary: str):
+        """Archive the oldest `count` memory entries and put one `summary` entry in their place."""
+
+    @abstractmethod
+    def read_reminders(self, user_id: str) -> str: ...
+
+    @abstractmethod
+    def list_reminders(self, user_id: str) -> list[dict]: ...
+
+    @abstractmethod
+    def add_reminder(self, user_id: str, text: str, due: Optional[str] = None,
+                     every: Optional[str] = None, tz: Optional[str] = None): ...
+
+    @abstractmethod
+    def complete_reminder(self, user_id: str, text: str) -> bool: ...
+
+    @abstractmethod
+    def reschedule_reminder(self, user_id: str, text: str, due: str) -> bool:
+        """Move the next firing of an open (recurring) reminder to `due`."""
+
+    def pending_reminders(self) -> Iterator[tuple[str, dict]]:
+        """Yield (user_id, reminder) for every open reminder of every user."""
+        for user_id in self.get_all_user_ids():
+            for r in self.list_reminders(user_id):
+                if not r["completed"]:
+                    yield user_id, r
+
+    @abstractmethod
+    def list_wiki_pages(self, user_id: str) -> list[str]: ...
+
+    @abstractmethod
+    def read_wiki_page(self, user_id: str, filename: str) -> str: ...
+
+    @abstractmethod
+    def write_wiki_page(self, user_id: str, filename: str, content: str): ...
+
+    @abstractmethod
+    def wiki_manifest(self, user_id: str) -> dict[str, dict]:
+        """filename -> {"title", "notes", "size", "mtime"} for each wiki page, without reading them all."""
+
+    def has_memory(self, user_id: str) -> bool:
+        return bool(self.read_memory(user_id).strip())
+
+    def sync(self):
+        """Make buffered writes durable. Backends that write synchronously need nothing."""
+
+    async def sync_loop(self, interval: float = 0.2):
+        """Call `sync()` off the event loop every `interval` seconds, so several appends share one fsync."""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.sync)
+        finally:
+            self.sync()
+
+    @abstractmethod
+    def read_state(self, user_id: str, name: str) -> dict:
+        """Small JSON bookkeeping (checkpoints, manifests) kept beside the user's data."""
+
+    @abstractmethod
+    def write_state(self, user_id: str, name: str, state: dict): ...
+
+    @abstractmethod
+    def read_blob(self, user_id: str, name: str) -> bytes:
+        """Derived binary data (e.g. search vectors) kept beside the user's data; b"" if there is none."""
+
+    @abstractmethod
+    def write_blob(self, user_id: str, name: str, data: bytes, start: int = 0):
+        """Replace the blob from byte `start` on with `data`; `start=len(blob)` appends."""
+
+class FileStorage(Storage):
+    """Markdown files under `data_dir/<user_id>/`, read through a FileCache.
+
+    Mutations of one user's files are serialized by a per-user lock (other
+    users proceed in parallel). Rewrites go through `atomic_write`; appends
+    are written immediately but fsynced in batches by `sync()`.
+    """
+
+    def __init__(self, data_dir: Path = None, cache: FileCache = None, segment_bytes: int = DEFAULT_SEGMENT_BYTES):
         self.data_dir = data_dir or DEFAULT_DATA_DIR
+        self.cache = cache or FileCache()
+        self.segment_bytes = segment_bytes
+        self._user_dirs = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._dirty = set()
+        self._dirty_guard = threading.Lock()
 
     def get_user_dir(self, user_id: str) -> Path:
         safe_id = sanitize_user_id(user_id)
-        user_dir = self.data_dir / safe_id
-        user_dir.mkdir(parents=True, exist_ok=True)
+        user_dir = self._user_dirs.get(safe_id)
+        if user_dir is None:
+            user_dir = self.data_dir / safe_id
+            user_dir.mkdir(parents=True, exist_ok=True)
+            self._user_dirs[safe_id] = user_dir
         return user_dir
 
+    def _entry(self, path: Path) -> Optional[dict]:
+        stamp = _stamp(path)
+        if stamp is None:
+            self.cache.discard(path)
+            return None
+        entry = self.cache.get(path, stamp)
+        if entry is None:
+            entry = self.cache.put(path, stamp, path.read_text())
+        return entry
+
+    def read_text(self, path: Path) -> str:
+        """Read a file through the cache; missing files read as ""."""
+        entry = self._entry(path)
+        return entry["content"] if entry else ""
+
+    def read_tail(self, path: Path, max_chars: int) -> str:
+        """The last `max_chars` characters of a file, reading only its end unless it is cached."""
+        stamp = _stamp(path)
+        if stamp is None or max_chars <= 0:
+            return ""
+        entry = self.cache.peek(path, stamp)
+        if entry is not None:
+            return entry["content"][-max_chars:]
+        with open(path, "rb") as f:
+            # UTF-8 needs at most 4 bytes per character.
+            offset = max(0, stamp[1] - 4 * max_chars)
+            f.seek(offset)
+            data = f.read()
+        if offset:
+            # Skip the continuation bytes of a character cut in half by the seek.
+            start = 0
+            while start < len(data) and data[start] & 0xC0 == 0x80:
+                start += 1
+            data = data[start:]
+        return data.decode()[-max_chars:]
+
+    def derived(self, path: Path, name: str, build: Callable[[str], Any]) -> Any:
+        """Return `build(content)` for a file, cached until the file changes."""
+        entry = self._entry(path)
+        if entry is None:
+            return build("")
+        if name not in entry["derived"]:
+            entry["derived"][name] = build(entry["content"])
+        return entry["derived"][name]
+
+    def _ensure_parent(self, path: Path):
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    def lock(self, path: Path) -> threading.RLock:
+        """The lock serializing writes to the user directory `path` lives in."""
+        try:
+            key = path.relative_to(self.data_dir).parts[0]
+        except (ValueError, IndexError):
+            key = str(path)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.RLock()
+            return self._locks[key]
+
+    def append_text(self, path: Path, text: str):
+        """Append to a file, keeping a cached copy current. Durable after the next `sync()`."""
+        with self.lock(path):
+            before = self.cache.peek(path, _stamp(path))
+            try:
+                with open(path, "a") as f:
+                    f.write(text)
+            except FileNotFoundError:
+                self._ensure_parent(path)
+                with open(path, "a") as f:
+                    f.write(text)
+            with self._dirty_guard:
+                self._dirty.add(path)
+            if before is not None:
+                self.cache.put(path, _stamp(path), before["content"] + text)
+            else:
+                self.cache.discard(path)
+
+    def write_text(self, path: Path, text: str):
+        """Atomically replace a file's contents, writing through the cache."""
+        with self.lock(path):
+            self._ensure_parent(path)
+            atomic_write(path, text)
+            with self._dirty_guard:
+                self._dirty.discard(path)
+            self.cache.put(path, _stamp(path), text)
+
+    def sync(self):
+        """fsync every file appended to since the last call, once each."""
+        with self._dirty_guard:
+            dirty, self._dirty = self._dirty, set()
+        for path in dirty:
+            with self.lock(path):
+                self._fsync(path)
+
+    @staticmethod
+    def _fsync(path: Path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
     def get_all_user_ids(self) -> list[str]:
         if not self.data_dir.exists():
             return []
         return [d.name for d in self.data_dir.iterdir() if d.is_dir()]
 
+    def get_wiki_dir(self, user_id: str) -> Path:
+        wiki_dir = self.get_user_dir(user_id) / "wiki"
+        wiki_dir.mkdir(parents=True, exist_ok=True)
+        return wiki_dir
+
+    def read_memory(self, user_id: str) -> str:
+        return self.read_text(self.get_user_dir(user_id) / "memory.md")
+
+    def append_memory(self, user_id: str, timestamp: str, content: str):
+        self.append_text(self.get_user_dir(user_id) / "memory.md", format_memory_entry(timestamp, content))
+
+    def compact_memory(self, user_id: str, count: int, timestamp: str, summary: str):
+        user_dir = self.get_user_dir(user_id)
+        path = user_dir / "memory.md"
+        with self.lock(path):
+            entries = parse_entries(self.read_text(path))
+            old, rest = entries[:count], entries[count:]
+            if not old:
+                return
+            self.append_text(user_dir / "memory-archive.md", "".join(format_memory_entry(*e) for e in old))
+            self.write_text(path, "".join(format_memory_entry(*e) for e in [(timestamp, summary)] + rest))
+
+    # The log is log.md (the open segment) preceded by the closed segments in
+    # log/, listed oldest first in the "log" state with their offsets.
+
+    def read_log(self, user_id: str) -> str:
+        return "".join(text for _, text in self.iter_log(user_id))
+
+    def iter_log(self, user_id: str, start: int = 0) -> Iterator[tuple[int, str]]:
+        user_dir = self.get_user_dir(user_id)
+        with self.lock(user_dir):
+            segments = self._log_segments(user_id)
+            current = self.read_text(user_dir / "log.md")
+        end = 0
+        for segment in segments:
+            end = segment["start"] + segment["chars"]
+            if end > start:
+                yield segment["start"], self.read_text(user_dir / "log" / segment["name"])
+        yield end, current
+
+    def log_length(self, user_id: str) -> int:
+        user_dir = self.get_user_dir(user_id)
+        with self.lock(user_dir):
+            segments = self._log_segments(user_id)
+            current = self.read_text(user_dir / "log.md")
+        closed = segments[-1]["start"] + segments[-1]["chars"] if segments else 0
+        return closed + len(current)
+
+    def tail_log(self, user_id: str, max_chars: int) -> str:
+        user_dir = self.get_user_dir(user_id)
+        with self.lock(user_dir):
+            segments = self._log_segments(user_id)
+            pieces = [self.read_tail(user_dir / "log.md", max_chars)]
+        chars = len(pieces[0])
+        for segment in reversed(segments):
+            if chars >= max_chars:
+                break
+            pieces.append(self.read_tail(user_dir / "log" / segment["name"], max_chars - chars))
+            chars += len(pieces[-1])
+        return "".join(reversed(pieces))
+
+    def _log_segments(self, user_id: str) -> list[dict]:
+        """The closed segments, rebuilt from log/ if it no longer matches the index."""
+        index = self.read_state(user_id, "log")
+        segments = index.get("segments", [])
+        segment_dir = self.get_user_dir(user_id) / "log"
+        names = sorted(f.name for f in segment_dir.glob("*.md")) if segment_dir.exists() else []
+        if names != [segment["name"] for segment in segments]:
+            segments = []
+            for name in names:
+                segments.append(self._segment_entry(name, self.read_text(segment_dir / name), segments))
+            self.write_state(user_id, "log", {**index, "segments": segments})
+        return segments
+
+    @staticmethod
+    def _segment_entry(name: str, content: str, segments: list[dict]) -> dict:
+        entries = parse_entries(content)
+        start = segments[-1]["start"] + segments[-1]["chars"] if segments else 0
+        return {
+            "name": name,
+            "first": entries[0][0] if entries else None,
+            "last": entries[-1][0] if entries else None,
+            "start": start,
+            "chars": len(content),
+        }
+
+    def _rotate_log(self, user_id: str, index: dict):
+        """Close log.md as the next segment in log/."""
+        user_dir = self.get_user_dir(user_id)
+        path = user_dir / "log.md"
+        content = self.read_text(path)
+        segments = self._log_segments(user_id)
+        entry = self._segment_entry("", content, segments)
+        month = (entry["first"] or index.get("month") or "log")[:7]
+        segment_dir = user_dir / "log"
+        segment_dir.mkdir(exist_ok=True)
+        number = 1
+        while (segment_dir / f"{month}-{number:03d}.md").exists():
+            number += 1
+        entry["name"] = f"{month}-{number:03d}.md"
+        self._fsync(path)
+        os.replace(path, segment_dir / entry["name"])
+        self.cache.discard(path)
+        index["segments"] = segments + [entry]
+
+    def append_log(self, user_id: str, timestamp: str, user_message: str, assistant_response: str):
+        path = self.get_user_dir(user_id) / "log.md"
+        with self.lock(path):
+            index = self.read_state(user_id, "log")
+            month = timestamp[:7]
+            changed = index.get("month") != month
+            stamp = _stamp(path)
+            if stamp is not None and stamp[1] > 0 and (stamp[1] >= self.segment_bytes or changed and "month" in index):
+                self._rotate_log(user_id, index)
+                changed = True
+            if changed:
+                self.write_state(user_id, "log", {**index, "month": month})
+            self.append_text(path, format_log_turn(timestamp, user_message, assistant_response))
+
+    def read_reminders(self, user_id: str) -> str:
+        return self.read_text(self.get_user_dir(user_id) / "reminders.md")
+
+    def list_reminders(self, user_id: str) -> list[dict]:
+        parsed = self.derived(self.get_user_dir(user_id) / "reminders.md", "reminders", parse_reminders)
+        return [dict(r) for r in parsed]
+
+    def add_reminder(self, user_id: str, text: str, due: Optional[str] = None,
+                     every: Optional[str] = None, tz: Optional[str] = None):
+        self.append_text(
+            self.get_user_dir(user_id) / "reminders.md", format_reminder(text, due, every=every, tz=tz)
+        )
+
+    def _update_reminders(self, user_id: str, update: Callable[[str], Optional[str]]) -> bool:
+        path = self.get_user_dir(user_id) / "reminders.md"
+        with self.lock(path):
+            updated = update(self.read_text(path))
+            if updated is None:
+                return False
+            self.write_text(path, updated)
+            return True
+
+    def complete_reminder(self, user_id: str, text: str) -> bool:
+        return self._update_reminders(user_id, lambda content: complete_reminder_line(content, text))
+
+    def reschedule_reminder(self, user_id: str, text: str, due: str) -> bool:
+        return self._update_reminders(user_id, lambda content: reschedule_reminder_line(content, text, due))
+
+    def list_wiki_pages(self, user_id: str) -> list[str]:
+        return sorted(f.name for f in self.get_wiki_dir(user_id).glob("*.md"))
+
+    def read_wiki_page(self, user_id: str, filename: str) -> str:
+        return self.read_text(self.get_wiki_dir(user_id) / wiki_filename(filename))
+
+    def write_wiki_page(self, user_id: str, filename: str, content: str):
+        path = self.get_wiki_dir(user_id) / wiki_filename(filename)
+        with self.lock(path):
+            self.write_text(path, content)
+            manifest = self.read_state(user_id, "wiki")
+            manifest[path.name] = self._wiki_entry(path, content)
+            self.write_state(user_id, "wiki", manifest)
+
+    @staticmethod
+    def _wiki_entry(path: Path, content: str, st: os.stat_result = None) -> dict:
+        title, quotes = parse_wiki_page(content)
+        st = st or path.stat()
+        return {"title": title, "notes": len(quotes), "size": st.st_size, "mtime": st.st_mtime_ns}
+
+    def wiki_manifest(self, user_id: str) -> dict[str, dict]:
+        """The "wiki" state, checked against a stat of each page.
+
+        Pages added, changed or removed outside the bot (e.g. edited in
+        Obsidian) are re-read and the manifest is saved again.
+        """
+        wiki_dir = self.get_wiki_dir(user_id)
+        with self.lock(wiki_dir):
+            saved = self.read_state(user_id, "wiki")
+            manifest = {}
+            changed = False
+            with os.scandir(wiki_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".md") or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    info = saved.get(entry.name)
+                    if info is None or (info["size"], info["mtime"]) != (st.st_size, st.st_mtime_ns):
+                        path = Path(entry.path)
+                        info = self._wiki_entry(path, self.read_text(path), st)
+                        changed = True
+                    manifest[entry.name] = info
+            if changed or len(manifest) != len(saved):
+                self.write_state(user_id, "wiki", manifest)
+        return dict(sorted(manifest.items()))
+
+    def has_memory(self, user_id: str) -> bool:
+        stamp = _stamp(self.get_user_dir(user_id) / "memory.md")
+        return stamp is not None and stamp[1] > 0
+
+    def _state_file(self, user_id: str, name: str) -> Path:
+        return self.get_user_dir(user_id) / ".state" / f"{sanitize_user_id(name)}.json"
+
+    def read_state(self, user_id: str, name: str) -> dict:
+        content = self.read_text(self._state_file(user_id, name))
+        return json.loads(content) if content else {}
+
+    def write_state(self, user_id: str, name: str, state: dict):
+        self.write_text(self._state_file(user_id, name), json.dumps(state))
+
+    def _blob_file(self, user_id: str, name: str) -> Path:
+        return self.get_user_dir(user_id) / ".state" / f"{sanitize_user_id(name)}.bin"
+
+    def read_blob(self, user_id: str, name: str) -> bytes:
+        try:
+            return self._blob_file(user_id, name).read_bytes()
+        except FileNotFoundError:
+            return b""
+
+    def write_blob(self, user_id: str, name: str, data: bytes, start: int = 0):
+        # Blobs are rebuilt from the markdown if lost, so they skip the cache and fsync.
+        path = self._blob_file(user_id, name)
+        with self.lock(path):
+            self._ensure_parent(path)
+            with open(path, "r+b" if path.exists() else "wb") as f:
+                f.seek(start)
+                f.write(data)
+                f.truncate()
+
+def open_storage(settings: dict = None) -> Storage:
+    """Build the backend named by config's `storage.backend` ("files" or "sqlite")."""
+    settings = settings if settings is not None else get_config().get("storage", {})
+    backend = settings.get("backend", "files")
+    if backend == "files":
+        return FileStorage(
+            Path(settings["data_dir"]) if "data_dir" in settings else None,
+            segment_bytes=settings.get("segment_bytes", DEFAULT_SEGMENT_BYTES),
+        )
+    if backend == "sqlite":
+        from src.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(Path(settings.get("path", DEFAULT_DATA_DIR / "copper-golem.db")))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
 # Default instance for production use
-storage = Storage()
+storage = open_storage()
@@ -1,24 +1,89 @@
-"""Consolidate conversation logs into an Obsidian wiki."""
+"""Consolidate conversation logs into an Obsidian wiki.
+
+Only the part of log.md added since the last run is sent, in chunks of whole
+entries, and new quotes are merged into the existing wiki pages. Progress is
+checkpointed per chunk in the user's "consolidate" state.
+
+    python -m src.consolidate --all [--concurrency N] [--tpm N] [--progress PATH]
+
+runs it for every user whose log changed since their last run, e.g. off-peak.
+"""
+import argparse
+import asyncio
 import json
+import os
 import re
+import sys
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from src import metrics, structured
 from src.agent import llm_call
-from src.skills import memory
+from src.common import DEFAULT_DATA_DIR, get_config, estimate_tokens, parse_wiki_page, storage, wiki_filename
+from src.skills import memory, search
+from src.skills.reminders import TokenBucket
+
+# Upper bound on log characters sent per consolidation call.
+DEFAULT_CHUNK_CHARS = 24000
+# Answer budget per consolidation call: room to quote a whole chunk back.
+DEFAULT_MAX_TOKENS = 8192
+
+DEFAULT_PROGRESS = DEFAULT_DATA_DIR / "consolidate-progress.json"
+
+class ConsolidationError(Exception):
+    """No usable plan came back for a chunk; its checkpoint is kept for the next run."""
 
-async def consolidation_llm_call(prompt: str) -> str:
+_LOG_ENTRY = re.compile(r"^## \d{4}-\d{2}-\d{2} \d{2}:\d{2}$", re.MULTILINE)
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string"},
+                    "title": {"type": "string"},
+                    "quotes": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["filename", "title", "quotes"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["files"],
+    "additionalProperties": False,
+}
+
+# Tokens-per-minute budget shared by the calls of a `consolidate_all` run.
+_budget: ContextVar[Optional[TokenBucket]] = ContextVar("consolidation_budget", default=None)
+
+async def consolidation_llm_call(prompt: str, schema: dict = None) -> str:
     """LLM call using consolidation model."""
-    return await llm_call(prompt, "consolidation")
+    budget = _budget.get()
+    if budget is not None:
+        await budget.acquire(estimate_tokens(prompt))
+    max_tokens = get_config().get("consolidation", {}).get("max_tokens", DEFAULT_MAX_TOKENS)
+    answer = await llm_call(prompt, "consolidation", skill="consolidate", schema=schema,
+                            max_tokens=max_tokens, allow_cut_off=False)
+    if budget is not None and answer:
+        budget.charge(estimate_tokens(answer))
+    return answer
 
-async def get_wiki_plan(log_content: str, memory_content: str) -> dict:
-    """Phase 1: Get organization plan from LLM."""
+async def get_wiki_plan(log_content: str, wiki_index: str) -> Optional[dict]:
+    """Phase 1: Get organization plan from LLM. None if no valid plan came back after a repair retry."""
     prompt = f"""Analyze this conversation log and suggest how to organize it into an Obsidian wiki.
 
-## Conversation Log (user's actual words)
+## New Conversation Log (user's actual words)
 {log_content}
 
-## Memory Notes (our interpretation)
-{memory_content}
+## Existing Wiki Pages
+{wiki_index or "(none yet)"}
 
 Create topic files that organize the user's thoughts. For each file, include the user's EXACT quotes from the log.
+If a quote belongs to an existing page, reuse that page's filename and title; new quotes are added to it.
 These are their personal thoughts - preserve their words exactly.
 
 Output as JSON (no markdown code blocks, just raw JSON):
@@ -39,16 +104,7 @@ Rules:
 - Group related thoughts together
 - Common topics: work, family, health, hobbies, goals, ideas, etc."""
 
-    result = await consolidation_llm_call(prompt)
-
-    # Extract JSON from response (handle markdown code blocks)
-    json_match = re.search(r'\{[\s\S]*\}', result)
-    if json_match:
-        try:
-            return json.loads(json_match.group())
-        except json.JSONDecodeError:
-            return {"files": []}
-    return {"files": []}
+    return await structured.request(consolidation_llm_call, prompt, PLAN_SCHEMA)
 
 def generate_wiki_file(title: str, quotes: list[str]) -> str:
     """Generate Obsidian-friendly markdown content."""
@@ -57,25 +113,50 @@ def generate_wiki_file(title: str, quotes: list[str]) -> str:
         content += f"- {quote}\n"
     return content
 
-async def consolidate_user(user_id: str):
-    """Consolidate a single user's logs into wiki."""
-    log_content = memory.read_log(user_id)
-    memory_content = memory.read(user_id)
+def parse_wiki_file(content: str) -> tuple[str, list[str]]:
+    """Inverse of generate_wiki_file: (title, quotes)."""
+    return parse_wiki_page(content)
 
-    if not log_content.strip():
-        return None
+def merge_wiki_file(existing: str, title: str, quotes: list[str]) -> str:
+    """Add new quotes to an existing page, keeping its title and earlier quotes."""
+    old_title, old_quotes = parse_wiki_file(existing)
+    seen = set(old_quotes)
+    merged = list(old_quotes)
+    for quote in quotes:
+        if quote not in seen:
+            seen.add(quote)
+            merged.append(quote)
+    return generate_wiki_file(old_title or title, merged)
 
-    # Phase 1: Get organization plan
-    plan = await get_wiki_plan(log_content, memory_content)
+def get_wiki_index(user_id: str) -> str:
+    """One line per existing page, for the LLM to file new quotes into."""
+    return "\n".join(
+        f"- {name}: {page['title']} ({page['notes']} notes)"
+        for name, page in storage.wiki_manifest(user_id).items()
+    )
 
-    if not plan.get("files"):
-        return None
+def split_log(log_content: str, start: int, max_chars: int) -> list[tuple[str, int]]:
+    """Split log_content[start:] into chunks of whole entries.
 
-    # Phase 2: Generate wiki files
-    wiki_dir = memory.get_wiki_dir(user_id)
+    Returns (chunk, end_offset) pairs; an entry longer than `max_chars` becomes
+    its own chunk rather than being cut.
+    """
+    bounds = [m.start() for m in _LOG_ENTRY.finditer(log_content, start)]
+    bounds = [start] + [b for b in bounds if b > start] + [len(log_content)]
+    chunks = []
+    chunk_start = start
+    for prev, end in zip(bounds, bounds[1:]):
+        if end - chunk_start > max_chars and prev > chunk_start:
+            chunks.append((log_content[chunk_start:prev], prev))
+            chunk_start = prev
+    if chunk_start < len(log_content):
+        chunks.append((log_content[chunk_start:], len(log_content)))
+    return chunks
 
-    created_files = []
-    for file_info in plan["files"]:
+def apply_plan(user_id: str, plan: dict) -> list[str]:
+    """Phase 2: merge the plan's quotes into wiki files."""
+    written = []
+    for file_info in plan.get("files", []):
         filename = file_info.get("filename", "").strip()
         title = file_info.get("title", "").strip()
         quotes = file_info.get("quotes", [])
@@ -84,44 +165,210 @@ async def consolidate_user(user_id: str):
             continue
 
         # Ensure .md extension
-        if not filename.endswith(".md"):
-            filename += ".md"
+        filename = wiki_filename(filename)
+
+        existing = storage.read_wiki_page(user_id, filename)
+        storage.write_wiki_page(user_id, filename, merge_wiki_file(existing, title, quotes))
 
-        content = generate_wiki_file(title, quotes)
+        written.append(filename)
+    return written
 
-        file_path = wiki_dir / filename
-        with open(file_path, "w") as f:
-            f.write(content)
+async def consolidate_user(user_id: str):
+    """Consolidate a single user's new log entries into wiki.
 
-        created_files.append(filename)
+    Returns the wiki files written, or None if there was nothing new to organize.
+    Raises ConsolidationError if a chunk got no usable plan, after saving the chunks before it.
+    """
+    state = storage.read_state(user_id, "consolidate")
+    offset = state.get("log_offset", 0)
+    if offset > storage.log_length(user_id):
+        # the log was rewritten or truncated outside the bot; start over
+        offset = 0
 
-    return created_files
+    # Only the segments holding unconsolidated entries are read.
+    log_content = storage.read_log_from(user_id, offset)
+    if not log_content.strip():
+        return None
+
+    max_chars = get_config().get("consolidation", {}).get("chunk_chars", DEFAULT_CHUNK_CHARS)
+    created_files = []
+    failed = False
+    for chunk, end in split_log(log_content, 0, max_chars):
+        end += offset
+        # Phase 1: Get organization plan
+        with metrics.labels(user=user_id):
+            plan = await get_wiki_plan(chunk, get_wiki_index(user_id))
+
+        # Phase 2: Merge into wiki files
+        if plan is None:
+            # Unparseable or cut-off answer: keep the checkpoint so this chunk is retried next time
+            failed = True
+            break
+        for filename in apply_plan(user_id, plan):
+            if filename not in created_files:
+                created_files.append(filename)
+
+        storage.write_state(user_id, "consolidate", {**state, "log_offset": end})
+
+    if created_files:
+        try:
+            await search.update(user_id, storage)
+        except Exception as e:
+            print(f"Search index update failed for {user_id}: {e!r}")
+    if failed:
+        raise ConsolidationError(f"no usable plan for {user_id}'s log after offset {end - len(chunk)}")
+    return created_files or None
 
 def get_wiki_tree(user_id: str) -> str:
-    """Generate ASCII tree of wiki directory."""
-    wiki_dir = memory.get_wiki_dir(user_id)
-    files = sorted(wiki_dir.glob("*.md"))
+    """Generate ASCII tree of wiki directory from the wiki manifest."""
+    pages = storage.wiki_manifest(user_id)
 
-    if not files:
+    if not pages:
         return "📁 wiki/\n└── (empty)"
 
     lines = ["📁 wiki/"]
-    for i, f in enumerate(files):
-        # Count notes in file
-        content = f.read_text()
-        note_count = content.count("- ")
-
-        prefix = "└── " if i == len(files) - 1 else "├── "
-        lines.append(f"{prefix}{f.name} ({note_count} notes)")
+    for i, (name, page) in enumerate(pages.items()):
+        prefix = "└── " if i == len(pages) - 1 else "├── "
+        lines.append(f"{prefix}{name} ({page['notes']} notes)")
 
     return "\n".join(lines)
 
+async def compact_user(user_id: str) -> int:
+    """Roll old memory.md entries into a summary once there are enough of them."""
+    settings = get_config().get("compaction", {})
+    with metrics.labels(user=user_id):
+        return await memory.compact(
+            consolidation_llm_call, user_id,
+            keep_recent=settings.get("keep_recent", memory.KEEP_RECENT),
+            min_entries=settings.get("min_entries", memory.MIN_COMPACT_ENTRIES),
+            batch_chars=settings.get("batch_chars", memory.COMPACT_BATCH_CHARS),
+            storage=storage,
+        )
+
 async def consolidate_and_tree(user_id: str) -> str:
     """Consolidate and return ASCII tree."""
-    files = await consolidate_user(user_id)
+    try:
+        files = await consolidate_user(user_id)
+    except ConsolidationError as e:
+        print(f"Consolidation failed: {e}")
+        return "⚠️ I couldn't organize your latest notes this time. Please try again later."
+    try:
+        await compact_user(user_id)
+    except Exception as e:
+        print(f"Memory compaction failed for {user_id}: {e!r}")
 
     if files is None:
+        if storage.wiki_manifest(user_id):
+            return f"✅ Notes are up to date!\n\n{get_wiki_tree(user_id)}"
         return "No notes to organize yet."
 
     tree = get_wiki_tree(user_id)
     return f"✅ Notes organized!\n\n{tree}"
+
+
+def needs_consolidation(user_id: str) -> bool:
+    """Whether the log has grown (or been rewritten) since the user's last consolidation."""
+    return storage.read_state(user_id, "consolidate").get("log_offset", 0) != storage.log_length(user_id)
+
+def _read_progress(path: Path) -> dict[str, int]:
+    """User id -> consolidated log offset when the user was finished, from an earlier run."""
+    try:
+        done = json.loads(path.read_text())["done"]
+        return {user_id: int(length) for user_id, length in done.items()}
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        print(f"Ignoring unreadable progress file {path}")
+        return {}
+
+def _write_progress(path: Path, done: dict[str, int]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_suffix(".tmp")
+    temp.write_text(json.dumps({"done": dict(sorted(done.items()))}))
+    os.replace(temp, path)
+
+async def consolidate_all(user_ids: list[str] = None, concurrency: int = 4, tokens_per_minute: int = 0,
+                          progress: Optional[Path] = DEFAULT_PROGRESS) -> dict:
+    """Consolidate (and compact) every user whose log changed, `concurrency` at a time.
+
+    LLM calls share a `tokens_per_minute` budget (0 for none), estimated from
+    prompt and answer sizes. Users finished so far are recorded in `progress`
+    with their log offset, so a rerun skips them unless their log has grown
+    since; the file is removed once a run has no failures. Returns
+    counts and throughput for the run.
+    """
+    user_ids = storage.get_all_user_ids() if user_ids is None else user_ids
+    done = _read_progress(progress) if progress else {}
+    summary = {"users": len(user_ids), "resumed": 0, "unchanged": 0, "consolidated": 0,
+               "failed": 0, "files": 0, "tokens": 0}
+    budget = _budget.set(TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None)
+    semaphore = asyncio.Semaphore(concurrency)
+    tokens = metrics.registry.user_tokens
+    start = time.monotonic()
+
+    async def run(user_id: str):
+        if user_id in done and done[user_id] == storage.log_length(user_id):
+            summary["resumed"] += 1
+            return
+        async with semaphore:
+            if not needs_consolidation(user_id):
+                summary["unchanged"] += 1
+            else:
+                before = tokens.get(user_id, 0)
+                try:
+                    files = await consolidate_user(user_id)
+                    await compact_user(user_id)
+                except Exception as e:
+                    print(f"Consolidation failed for {user_id}: {e!r}")
+                    summary["failed"] += 1
+                    return
+                finally:
+                    summary["tokens"] += tokens.get(user_id, 0) - before
+                summary["consolidated"] += 1
+                summary["files"] += len(files or ())
+        done[user_id] = storage.read_state(user_id, "consolidate").get("log_offset", 0)
+        if progress:
+            _write_progress(progress, done)
+
+    try:
+        await asyncio.gather(*(run(user_id) for user_id in user_ids))
+    finally:
+        _budget.reset(budget)
+    if progress and summary["failed"] == 0:
+        progress.unlink(missing_ok=True)
+
+    elapsed = time.monotonic() - start
+    summary["seconds"] = round(elapsed, 2)
+    summary["users_per_minute"] = round(summary["consolidated"] * 60 / elapsed, 1) if elapsed else 0.0
+    summary["tokens_per_minute"] = round(summary["tokens"] * 60 / elapsed) if elapsed else 0
+    return summary
+
+def main(argv: list[str]):
+    settings = get_config().get("consolidation", {})
+    parser = argparse.ArgumentParser(prog="python -m src.consolidate", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--all", action="store_true", required=True, help="consolidate every user")
+    parser.add_argument("--concurrency", type=int, default=settings.get("concurrency", 4))
+    parser.add_argument("--tpm", type=int, default=settings.get("tokens_per_minute", 0),
+                        help="LLM tokens per minute for the whole run (0 for no limit)")
+    parser.add_argument("--progress", type=Path, default=DEFAULT_PROGRESS,
+                        help="file recording finished users, to resume after a crash")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(consolidate_all(
+        concurrency=args.concurrency, tokens_per_minute=args.tpm, progress=args.progress,
+    ))
+    print(
+        f"Consolidated {summary['consolidated']} of {summary['users']} users "
+        f"({summary['unchanged']} unchanged, {summary['resumed']} done before resuming, {summary['failed']} failed), "
+        f"{summary['files']} wiki files written"
+    )
+    print(
+        f"{summary['seconds']}s, {summary['users_per_minute']} users/min, "
+        f"{summary['tokens']} tokens ({summary['tokens_per_minute']} tokens/min)"
+    )
+    if summary["failed"]:
+        print(f"Progress kept in {args.progress}; run again to retry the failed users")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
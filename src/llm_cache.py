@@ -0,0 +1,141 @@
+"""Cache of LLM answers for deterministic extraction/intent prompts.
+
+Answers are keyed on (model, prompt with whitespace collapsed), held in an
+in-memory LRU with a TTL and optionally persisted to SQLite so they survive
+restarts. Only skills listed in config are cached: chat replies never are,
+and the reminder prompt embeds the current time, so it is left out by default
+(if enabled, the minute-resolution time is part of the key and entries can't
+go stale).
+"""
+import hashlib
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Optional
+from src.common import DEFAULT_DATA_DIR
+
+DEFAULT_SKILLS = ("intent", "memory")
+DEFAULT_PATH = DEFAULT_DATA_DIR / "llm-cache.db"
+# The on-disk table is purged of expired rows, and trimmed to its cap, every this many puts.
+PURGE_EVERY = 1000
+
+def normalize(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400, path: Path = None,
+                 skills: tuple = DEFAULT_SKILLS, max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.skills = set(skills)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._entries = OrderedDict()
+        self.path = Path(path) if path else None
+        self._db = None
+        self._puts = 0
+
+    @property
+    def db(self) -> Optional["sqlite3.Connection"]:
+        """The on-disk store, opened on first use; None when memory-only."""
+        if self._db is None and self.path is not None:
+            import sqlite3
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            self.purge_expired()
+        return self._db
+
+    def allows(self, usage: str, skill: str) -> bool:
+        return usage != "chat" and skill in self.skills
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize(prompt)}".encode()).hexdigest()
+
+    def get(self, key: str, skill: str = "") -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None and self.db is not None:
+            row = self.db.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                entry = (row[1], row[0])
+                self._remember(key, entry)
+        if entry is None or entry[0] < now:
+            if entry is not None:
+                self._entries.pop(key, None)
+            self.misses[skill] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits[skill] += 1
+        return entry[1]
+
+    def put(self, key: str, value: str):
+        entry = (time.time() + self.ttl, value)
+        self._remember(key, entry)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, entry[0]),
+            )
+            self._puts += 1
+            if self._puts % PURGE_EVERY == 0:
+                self.purge_expired()
+
+    def _remember(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self):
+        """Drop expired entries, and the soonest to expire past `max_disk_entries` on disk."""
+        now = time.time()
+        for key in [k for k, (expires, _) in self._entries.items() if expires < now]:
+            del self._entries[key]
+        if self.db is not None:
+            self.db.execute("DELETE FROM responses WHERE expires < ?", (now,))
+            self.db.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY expires
+                    LIMIT max(0, (SELECT count(*) FROM responses) - ?)
+                )""",
+                (self.max_disk_entries,),
+            )
+
+    def stats(self) -> dict:
+        skills = sorted(set(self.hits) | set(self.misses))
+        per_skill = {}
+        for skill in skills:
+            total = self.hits[skill] + self.misses[skill]
+            per_skill[skill] = {
+                "hits": self.hits[skill],
+                "misses": self.misses[skill],
+                "hit_rate": self.hits[skill] / total if total else 0.0,
+            }
+        return {"entries": len(self._entries), "skills": per_skill}
+
+def from_config(settings: dict) -> Optional[ResponseCache]:
+    """Build the cache described by config.json's "llm_cache" section, or None if disabled.
+
+    It is stored in data/llm-cache.db unless `path` says otherwise; a relative
+    `path` is taken from the data directory's parent, not the working
+    directory, and `"path": null` keeps the cache in memory only.
+    """
+    if not settings.get("enabled"):
+        return None
+    path = settings.get("path", DEFAULT_PATH)
+    if path is not None:
+        path = DEFAULT_DATA_DIR.parent / path
+    return ResponseCache(
+        max_entries=settings.get("max_entries", 10000),
+        max_disk_entries=settings.get("max_disk_entries", 100000),
+        ttl=settings.get("ttl", 86400),
+        path=path,
+        skills=tuple(settings.get("skills", DEFAULT_SKILLS)),
+    )
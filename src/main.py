@@ -1,5 +1,7 @@
 import asyncio
-from src.agent import chat
+from src import metrics
+from src.agent import chat_stream, drain
+from src.common import get_config, storage
 from src.skills import reminders
 
 USER_ID = "cli"
@@ -24,20 +26,26 @@ async def input_loop():
         if not user_input.strip():
             continue
 
-        response = await chat(USER_ID, user_input)
-        print(f"Assistant: {response}\n")
+        print("Assistant: ", end="", flush=True)
+        async for chunk in chat_stream(USER_ID, user_input):
+            print(chunk, end="", flush=True)
+        print("\n")
 
 async def main():
     reminder_task = asyncio.create_task(reminders.loop(on_reminder, interval=60))
+    sync_task = asyncio.create_task(storage.sync_loop())
+    await metrics.start(get_config().get("metrics", {}))
 
     try:
         await input_loop()
     finally:
-        reminder_task.cancel()
-        try:
-            await reminder_task
-        except asyncio.CancelledError:
-            pass
+        await drain()
+        for task in (reminder_task, sync_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 if __name__ == "__main__":
     asyncio.run(main())
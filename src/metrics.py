@@ -0,0 +1,273 @@
+"""In-process metrics for LLM calls.
+
+`instrument(client)` wraps an AsyncOpenAI client so every chat completion
+records latency, token usage and errors, labelled by usage ("chat",
+"extraction", "consolidation"), skill and user. Labels come from a context
+variable set with `labels(...)`, so they also apply to tasks created inside
+the block. Results are exposed as Prometheus text (`serve`) or a periodic
+JSON file (`dump_loop`).
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import math
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+_labels = contextvars.ContextVar("metrics_labels", default={})
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+class Registry:
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.first_token = defaultdict(Histogram)
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.prompt_tokens = defaultdict(int)
+        self.completion_tokens = defaultdict(int)
+        self.user_tokens = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.transport = defaultdict(int)
+
+    def record_cache(self, usage: str, skill: str, hit: bool):
+        (self.cache_hits if hit else self.cache_misses)[(usage, skill)] += 1
+
+    def record_transport(self, usage: str, event: str):
+        """Count a retry, failover or hedged request made by `src.transport`."""
+        self.transport[(usage, event)] += 1
+
+    def record(self, usage: str, skill: str, user: Optional[str], latency: float,
+               prompt_tokens: int = 0, completion_tokens: int = 0, error: Optional[str] = None):
+        key = (usage, skill)
+        self.calls[key] += 1
+        self.latency[key].observe(latency)
+        if error:
+            self.errors[key + (error,)] += 1
+        self.prompt_tokens[key] += prompt_tokens
+        self.completion_tokens[key] += completion_tokens
+        if user:
+            self.user_tokens[user] += prompt_tokens + completion_tokens
+
+    def snapshot(self) -> dict:
+        calls = []
+        for (usage, skill), count in sorted(self.calls.items()):
+            hist = self.latency[(usage, skill)]
+            first = self.first_token.get((usage, skill))
+            calls.append({
+                "usage": usage,
+                "skill": skill,
+                "calls": count,
+                "errors": sum(n for k, n in self.errors.items() if k[:2] == (usage, skill)),
+                "prompt_tokens": self.prompt_tokens[(usage, skill)],
+                "completion_tokens": self.completion_tokens[(usage, skill)],
+                "latency_mean": hist.sum / hist.count if hist.count else None,
+                "latency_p50": hist.quantile(0.5),
+                "latency_p99": hist.quantile(0.99),
+                "first_token_p50": first.quantile(0.5) if first else None,
+            })
+        cache = {}
+        for usage, skill in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            hits, misses = self.cache_hits[(usage, skill)], self.cache_misses[(usage, skill)]
+            cache[f"{usage}/{skill}"] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        transport = {f"{usage}/{event}": n for (usage, event), n in sorted(self.transport.items())}
+        top_users = sorted(self.user_tokens.items(), key=lambda kv: -kv[1])[:20]
+        return {
+            "time": time.time(), "calls": calls, "cache": cache, "transport": transport,
+            "top_users_by_tokens": dict(top_users),
+        }
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def histogram(name: str, hists: dict, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (usage, skill), hist in sorted(hists.items()):
+                labels = f'usage="{usage}",skill="{skill}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else bound
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        def counter(name: str, values: dict, help_text: str, label_names=("usage", "skill")):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                labels = ",".join(f'{n}="{v}"' for n, v in zip(label_names, key))
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        histogram("llm_request_seconds", self.latency, "LLM call latency")
+        histogram("llm_first_token_seconds", self.first_token, "Time to first streamed token")
+        counter("llm_requests_total", self.calls, "LLM calls")
+        counter("llm_errors_total", self.errors, "Failed LLM calls", ("usage", "skill", "error"))
+        counter("llm_prompt_tokens_total", self.prompt_tokens, "Prompt tokens")
+        counter("llm_completion_tokens_total", self.completion_tokens, "Completion tokens")
+        counter("llm_cache_hits_total", self.cache_hits, "LLM answers served from the response cache")
+        counter("llm_cache_misses_total", self.cache_misses, "Cacheable LLM calls that missed")
+        counter("llm_transport_events_total", self.transport, "LLM retries, failovers and hedged requests",
+                ("usage", "event"))
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+@contextlib.contextmanager
+def labels(**values):
+    """Tag LLM calls made inside the block, e.g. labels(usage="extraction", skill="memory").
+
+    A None value keeps the enclosing label, so helpers can pass an optional user_id through.
+    """
+    token = _labels.set({**_labels.get(), **{k: v for k, v in values.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+def current_usage() -> str:
+    return _labels.get().get("usage", "unknown")
+
+def current_skill() -> str:
+    return _labels.get().get("skill", "unknown")
+
+def _current() -> tuple[str, str, Optional[str]]:
+    values = _labels.get()
+    return values.get("usage", "unknown"), values.get("skill", "unknown"), values.get("user")
+
+class _Completions:
+    def __init__(self, completions, registry: Registry):
+        self._completions = completions
+        self._registry = registry
+
+    async def create(self, **kwargs):
+        usage, skill, user = _current()
+        start = time.perf_counter()
+        try:
+            response = await self._completions.create(**kwargs)
+        except Exception as e:
+            self._registry.record(usage, skill, user, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        if kwargs.get("stream"):
+            return self._stream(response, usage, skill, user, start)
+        tokens = getattr(response, "usage", None)
+        self._registry.record(
+            usage, skill, user, time.perf_counter() - start,
+            getattr(tokens, "prompt_tokens", 0) or 0,
+            getattr(tokens, "completion_tokens", 0) or 0,
+        )
+        return response
+
+    async def _stream(self, stream, usage: str, skill: str, user: Optional[str], start: float):
+        first = True
+        tokens = None
+        error = None
+        try:
+            async for chunk in stream:
+                if first:
+                    self._registry.first_token[(usage, skill)].observe(time.perf_counter() - start)
+                    first = False
+                tokens = getattr(chunk, "usage", None) or tokens
+                yield chunk
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._registry.record(
+                usage, skill, user, time.perf_counter() - start,
+                getattr(tokens, "prompt_tokens", 0) or 0,
+                getattr(tokens, "completion_tokens", 0) or 0,
+                error,
+            )
+
+class InstrumentedClient:
+    """Proxy for AsyncOpenAI that records every chat completion and embedding request in `registry`."""
+
+    def __init__(self, client, registry: Registry = registry):
+        self._client = client
+        self.chat = SimpleNamespace(completions=_Completions(client.chat.completions, registry))
+        if hasattr(client, "embeddings"):
+            self.embeddings = _Completions(client.embeddings, registry)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def instrument(client, registry: Registry = registry) -> InstrumentedClient:
+    return InstrumentedClient(client, registry)
+
+async def dump_loop(path: Path, interval: float = 60, registry: Registry = registry):
+    """Write `registry.snapshot()` as JSON to `path` every `interval` seconds."""
+    path = Path(path)
+    while True:
+        await asyncio.sleep(interval)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(registry.snapshot(), indent=2))
+        tmp.replace(path)
+
+async def serve(host: str = "127.0.0.1", port: int = 9100, registry: Registry = registry) -> asyncio.AbstractServer:
+    """Serve Prometheus text on GET /metrics and the JSON snapshot on GET /metrics.json."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", registry.render_prometheus()
+            elif path == "/metrics.json":
+                status, content_type, body = "200 OK", "application/json", json.dumps(registry.snapshot())
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+async def start(settings: dict) -> list:
+    """Start whatever exporters `settings` (config.json's "metrics") enables."""
+    started = []
+    if settings.get("port"):
+        started.append(await serve(settings.get("host", "127.0.0.1"), settings["port"]))
+    if settings.get("dump_path"):
+        started.append(asyncio.create_task(dump_loop(Path(settings["dump_path"]), settings.get("dump_interval", 60))))
+    return started
@@ -0,0 +1,187 @@
+"""Recurrence rules for reminders.
+
+A rule is stored as the human-readable text of a reminder's `every:` tag and
+compiled once by `parse_recurrence`:
+
+    daily / every day [at 9:30]     weekdays [at 8am]
+    weekly / every monday and thu   monthly
+    every 2 hours / every 3 days    cron 0 9 * * 1-5
+
+Rules work on naive wall-clock datetimes in the reminder's timezone;
+`to_wall`/`to_local` convert to and from the process's local time, which is
+what the scheduler compares against.
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+# A rule that can't fire within this many days never fires (e.g. "cron 0 9 31 2 *").
+SEARCH_DAYS = 366 * 8
+
+_AT = re.compile(r"\s+at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?$")
+_EVERY_N = re.compile(r"(\d+) (minute|hour|day|week)s?")
+
+class Cron:
+    """Five-field cron rule. `days`, `months` and `weekdays` are None for "any"; weekdays count from Monday = 0."""
+
+    __slots__ = ("minutes", "hours", "days", "months", "weekdays")
+
+    def __init__(self, minutes, hours, days=None, months=None, weekdays=None):
+        self.minutes = tuple(sorted(minutes))
+        self.hours = tuple(sorted(hours))
+        self.days = days
+        self.months = months
+        self.weekdays = weekdays
+
+    def matches(self, day: date) -> bool:
+        if self.months is not None and day.month not in self.months:
+            return False
+        if self.days is None and self.weekdays is None:
+            return True
+        # As in cron, a day matches if either restricted field does.
+        return (self.days is not None and day.day in self.days) or \
+            (self.weekdays is not None and day.weekday() in self.weekdays)
+
+    def after(self, moment: datetime, anchor: Optional[datetime] = None) -> Optional[datetime]:
+        day = moment.date()
+        for _ in range(SEARCH_DAYS):
+            if self.matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day, time(hour, minute))
+                        if candidate > moment:
+                            return candidate
+            day += timedelta(days=1)
+        return None
+
+class Interval:
+    """Every `step`, counted from the reminder's first due time."""
+
+    __slots__ = ("step",)
+
+    def __init__(self, step: timedelta):
+        self.step = step
+
+    def after(self, moment: datetime, anchor: Optional[datetime] = None) -> Optional[datetime]:
+        anchor = anchor or moment
+        if anchor > moment:
+            return anchor
+        return anchor + ((moment - anchor) // self.step + 1) * self.step
+
+Rule = Union[Cron, Interval]
+
+def _cron_field(field: str, low: int, high: int) -> Optional[set]:
+    if field == "*":
+        return None
+    values = set()
+    for part in field.split(","):
+        base, _, step = part.partition("/")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start, end = (int(v) for v in base.split("-", 1))
+        else:
+            start = int(base)
+            end = high if step else start
+        if start < low or end > high or start > end:
+            raise ValueError(part)
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+def _parse_cron(fields: str) -> Optional[Cron]:
+    parts = fields.split()
+    if len(parts) != 5:
+        return None
+    try:
+        minutes = _cron_field(parts[0], 0, 59) or range(60)
+        hours = _cron_field(parts[1], 0, 23) or range(24)
+        days = _cron_field(parts[2], 1, 31)
+        months = _cron_field(parts[3], 1, 12)
+        weekdays = _cron_field(parts[4], 0, 7)
+    except ValueError:
+        return None
+    if weekdays is not None:
+        weekdays = {(d - 1) % 7 for d in weekdays}
+    return Cron(minutes, hours, days, months, weekdays)
+
+def _weekday(word: str) -> Optional[int]:
+    word = word.removesuffix("s")
+    if len(word) < 3:
+        return None
+    for i, name in enumerate(WEEKDAYS):
+        if name.startswith(word):
+            return i
+    return None
+
+def parse_recurrence(rule: str, anchor: Optional[datetime] = None) -> Optional[Rule]:
+    """Compile an `every:` rule; None if it isn't understood.
+
+    `anchor` (the first due time) supplies the time of day, weekday and day of
+    month that the rule doesn't state.
+    """
+    text = " ".join(rule.lower().replace(",", " ").split())
+    if text.startswith("cron "):
+        return _parse_cron(text[5:])
+    hour, minute = (anchor.hour, anchor.minute) if anchor else (9, 0)
+    at = _AT.search(text)
+    if at:
+        hour, minute = int(at.group(1)), int(at.group(2) or 0)
+        if at.group(3):
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if at.group(3) == "pm" else 0)
+        if hour > 23 or minute > 59:
+            return None
+        text = text[:at.start()]
+    for prefix in ("every ", "each "):
+        text = text.removeprefix(prefix)
+
+    match = _EVERY_N.fullmatch(text)
+    if match:
+        return Interval(timedelta(**{match.group(2) + "s": int(match.group(1))}))
+    if text in ("hour", "hourly"):
+        return Interval(timedelta(hours=1))
+    if text in ("day", "daily"):
+        return Cron((minute,), (hour,))
+    if text in ("weekday", "weekdays"):
+        return Cron((minute,), (hour,), weekdays={0, 1, 2, 3, 4})
+    if text in ("month", "monthly"):
+        return Cron((minute,), (hour,), days={anchor.day if anchor else 1})
+    if text in ("week", "weekly"):
+        return Cron((minute,), (hour,), weekdays={anchor.weekday() if anchor else 0})
+
+    weekdays = set()
+    for word in text.removeprefix("weekly").split():
+        if word in ("on", "and"):
+            continue
+        day = _weekday(word)
+        if day is None:
+            return None
+        weekdays.add(day)
+    if not weekdays:
+        return None
+    return Cron((minute,), (hour,), weekdays=weekdays)
+
+def zone(name: Optional[str]) -> Optional[ZoneInfo]:
+    """The IANA timezone `name`, or None (local time) if unset or unknown."""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def to_wall(moment: datetime, tz: Optional[ZoneInfo]) -> datetime:
+    """Local (or aware) `moment` as naive wall-clock time in `tz`."""
+    if tz is None:
+        return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+def to_local(wall: datetime, tz: Optional[ZoneInfo]) -> datetime:
+    """Naive wall-clock time in `tz` as naive local time."""
+    if tz is None:
+        return wall
+    return wall.replace(tzinfo=tz).astimezone().replace(tzinfo=None)
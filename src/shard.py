@@ -0,0 +1,312 @@
+"""Sharding users across worker processes.
+
+With `telegram.workers` above 1, the bot process becomes a front dispatcher.
+It talks to Telegram and forwards each message to the worker that owns the
+user, chosen by `shard_for`, a stable hash of the sanitized id. Each worker
+runs chats, storage writes and the reminder schedule for its own users only,
+and streams replies and due reminders back as JSON lines over a Unix socket.
+The dispatcher starts workers itself:
+
+    python -m src.shard worker <index> <workers> <socket>
+
+A user always lands on the same worker, and the dispatcher forwards their
+messages in arrival order. A worker runs one user's messages one after
+another, so per-user ordering holds while different users run in parallel.
+"""
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from src import metrics
+from src.agent import chat_stream, drain
+from src.common import Storage, get_config, sanitize_user_id, storage as default_storage
+from src.skills import reminders
+
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 60.0
+
+# Replies travel as single JSON lines; lift asyncio's 64 KiB line limit.
+LINE_LIMIT = 1 << 24
+
+class ShardError(Exception):
+    """A worker failed a request, or the dispatcher failed a reminder send."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def shard_for(user_id: str, workers: int) -> int:
+    """The worker (0-based) that owns `user_id`; stable across processes and restarts."""
+    return zlib.crc32(sanitize_user_id(user_id).encode()) % workers
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+class WorkerHandle:
+    """The dispatcher's end of one worker: its process, connection and open reply streams."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.streams: dict[int, asyncio.Queue] = {}
+        self._backlog: list[bytes] = []
+
+    def send(self, message: dict):
+        """Write `message` now, or as soon as the worker (re)connects; order is kept either way."""
+        data = _encode(message)
+        if self.writer is None:
+            self._backlog.append(data)
+        else:
+            self.writer.write(data)
+
+    def attach(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        for data in self._backlog:
+            writer.write(data)
+        self._backlog = []
+
+    def detach(self, writer: asyncio.StreamWriter = None):
+        """Forget the connection and fail the requests it had in flight."""
+        if writer is not None and writer is not self.writer:
+            return
+        self.writer = None
+        for queue in self.streams.values():
+            queue.put_nowait({"op": "error", "error": f"worker {self.index} went away"})
+
+class ShardDispatcher:
+    """Routes chats to worker processes and sends the reminders they report.
+
+    `deliver(user_id, reminder)` sends a due reminder; an exception from it is
+    passed back so the worker's reminder dispatcher retries as usual.
+    """
+
+    def __init__(self, workers: int, deliver: Callable[[str, dict], Awaitable[None]], socket_path: str = None):
+        self.handles = [WorkerHandle(i) for i in range(workers)]
+        self.deliver = deliver
+        self.socket_path = socket_path or os.path.join(tempfile.mkdtemp(prefix="shards-"), "shards.sock")
+        self._ids = itertools.count()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._supervisors: list[asyncio.Task] = []
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def listen(self):
+        self._server = await asyncio.start_unix_server(self._accept, self.socket_path, limit=LINE_LIMIT)
+
+    async def start(self):
+        """Listen and spawn the worker processes, restarting any that exit."""
+        await self.listen()
+        self._supervisors = [asyncio.create_task(self._supervise(handle)) for handle in self.handles]
+
+    async def _supervise(self, handle: WorkerHandle):
+        while not self._stopping:
+            handle.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "src.shard", "worker",
+                str(handle.index), str(len(self.handles)), self.socket_path,
+            )
+            code = await handle.process.wait()
+            handle.detach()
+            if self._stopping:
+                break
+            print(f"Shard worker {handle.index} exited with {code}; restarting")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = json.loads(await reader.readline())
+        handle = self.handles[hello["index"]]
+        handle.attach(writer)
+        try:
+            while line := await reader.readline():
+                self._receive(handle, json.loads(line))
+        finally:
+            handle.detach(writer)
+            writer.close()
+
+    def _receive(self, handle: WorkerHandle, message: dict):
+        if message["op"] == "remind":
+            task = asyncio.create_task(self._remind(handle, message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif (queue := handle.streams.get(message["id"])) is not None:
+            queue.put_nowait(message)
+
+    async def _remind(self, handle: WorkerHandle, message: dict):
+        result = {"op": "delivered", "id": message["id"]}
+        try:
+            await self.deliver(message["user"], message["reminder"])
+        except Exception as e:
+            result["error"] = str(e) or repr(e)
+            result["retry_after"] = reminders._retry_after(e)
+        handle.send(result)
+
+    def chat(self, user_id: str, text: str) -> AsyncIterator[str]:
+        """Forward a message to its user's worker now; iterate the result for the reply."""
+        handle = self.handles[shard_for(user_id, len(self.handles))]
+        request_id = next(self._ids)
+        queue = handle.streams[request_id] = asyncio.Queue()
+        handle.send({"op": "chat", "id": request_id, "user": user_id, "text": text})
+        return self._replies(handle, request_id, queue)
+
+    async def _replies(self, handle: WorkerHandle, request_id: int, queue: asyncio.Queue) -> AsyncIterator[str]:
+        try:
+            while True:
+                message = await queue.get()
+                if message["op"] == "chunk":
+                    yield message["text"]
+                elif message["op"] == "done":
+                    return
+                else:
+                    raise ShardError(message.get("error") or "worker error")
+        finally:
+            handle.streams.pop(request_id, None)
+
+    async def stop(self, timeout: float = STOP_TIMEOUT):
+        """Have the workers finish what they were sent and exit; kill any that don't in time."""
+        self._stopping = True
+        for handle in self.handles:
+            handle.send({"op": "stop"})
+        processes = [handle.process for handle in self.handles if handle.process is not None]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in processes)), timeout)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+        await asyncio.gather(*self._supervisors, *self._tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+class Worker:
+    """A worker's end: runs its users' chats in order and forwards due reminders."""
+
+    def __init__(self, writer: asyncio.StreamWriter, index: int, workers: int,
+                 chat: Callable[[str, str], AsyncIterator[str]] = None):
+        self.writer = writer
+        self.index = index
+        self.workers = workers
+        self.chat = chat or chat_stream
+        self._tails: dict[str, asyncio.Task] = {}
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+
+    def owns(self, user_id: str) -> bool:
+        return shard_for(user_id, self.workers) == self.index
+
+    def send(self, message: dict):
+        self.writer.write(_encode(message))
+
+    def receive(self, message: dict) -> bool:
+        """Handle one message from the dispatcher; False once asked to stop."""
+        if message["op"] == "chat":
+            self.submit(message["id"], message["user"], message["text"])
+        elif message["op"] == "delivered":
+            future = self._pending.get(message["id"])
+            if future is not None and not future.done():
+                future.set_result(message)
+        elif message["op"] == "stop":
+            return False
+        return True
+
+    def submit(self, request_id: int, user_id: str, text: str):
+        """Start a chat once the same user's previous one is done."""
+        task = asyncio.create_task(self._chat(self._tails.get(user_id), request_id, user_id, text))
+        self._tails[user_id] = task
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+
+    def _forget(self, user_id: str, task: asyncio.Task):
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+    async def _chat(self, previous: Optional[asyncio.Task], request_id: int, user_id: str, text: str):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            async for chunk in self.chat(user_id, text):
+                self.send({"op": "chunk", "id": request_id, "text": chunk})
+            self.send({"op": "done", "id": request_id})
+        except Exception as e:
+            print(f"Chat failed for {user_id}: {e!r}")
+            self.send({"op": "error", "id": request_id, "error": str(e) or repr(e)})
+
+    async def remind(self, user_id: str, reminder: dict):
+        """Reminder callback: have the dispatcher send it, raising if that failed."""
+        request_id = next(self._ids)
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        self.send({"op": "remind", "id": request_id, "user": user_id, "reminder": reminder})
+        try:
+            result = await future
+        finally:
+            self._pending.pop(request_id, None)
+        if result.get("error"):
+            raise ShardError(result["error"], result.get("retry_after"))
+
+    async def finish(self):
+        """Wait for every chat received so far and the background work it started."""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+        await drain()
+
+async def run_worker(socket_path: str, index: int, workers: int,
+                     chat: Callable[[str, str], AsyncIterator[str]] = None, storage: Storage = None):
+    """Serve one shard until the dispatcher says stop (or goes away)."""
+    s = storage or default_storage
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=LINE_LIMIT)
+    worker = Worker(writer, index, workers, chat)
+    writer.write(_encode({"op": "hello", "index": index}))
+    settings = dict(get_config().get("reminders", {}))
+    # Telegram's overall limit is shared by every worker.
+    settings["global_rate"] = settings.get("global_rate", 25.0) / workers
+    dispatcher = reminders.Dispatcher(worker.remind, storage, **settings)
+    background = [
+        asyncio.create_task(reminders.loop(worker.remind, storage=storage, dispatcher=dispatcher, owns=worker.owns)),
+        asyncio.create_task(s.sync_loop()),
+    ]
+    try:
+        while line := await reader.readline():
+            if not worker.receive(json.loads(line)):
+                break
+        await worker.finish()
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        s.sync()
+        writer.close()
+
+def worker_metrics(settings: dict, index: int) -> dict:
+    """Worker `index`'s copy of the "metrics" section: its own port and dump file."""
+    settings = dict(settings)
+    if settings.get("port"):
+        settings["port"] += 1 + index
+    if settings.get("dump_path"):
+        path = Path(settings["dump_path"])
+        settings["dump_path"] = str(path.with_name(f"{path.stem}-{index}{path.suffix}"))
+    return settings
+
+async def _serve(socket_path: str, index: int, workers: int):
+    await metrics.start(worker_metrics(get_config().get("metrics", {}), index))
+    await run_worker(socket_path, index, workers)
+
+def main(argv: list[str]):
+    if len(argv) != 4 or argv[0] != "worker":
+        print(__doc__)
+        sys.exit(1)
+    # Ctrl-C reaches the whole process group; the dispatcher decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(argv[3], int(argv[1]), int(argv[2])))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+"""Recent conversation turns per user, kept in memory for the chat prompt.
+
+A user's buffer is seeded on first use from the tail of their log (only the
+last `SEED_CHARS` characters are read) and kept current by `add_turn` as turns
+are logged. Old turns leave the window in blocks rather than one per new
+turn, so the start of the history, and with it the prompt prefix the
+provider can cache, stays the same for several turns in a row.
+"""
+from src.common import (
+    Storage, UserCache, estimate_tokens, parse_entries, parse_log_turn, storage as default_storage,
+)
+
+# Turns kept per user; past this the oldest half is dropped at once.
+MAX_TURNS = 40
+SEED_CHARS = 16000
+# Users whose buffer is held in memory per storage.
+MAX_USERS = 1024
+
+# Role and formatting overhead of one chat message, in tokens.
+MESSAGE_TOKENS = 4
+
+class History:
+    """One user's recent (user_message, assistant_response, tokens) turns and the start of their window."""
+
+    __slots__ = ("turns", "start")
+
+    def __init__(self, turns: list[tuple[str, str]] = ()):
+        self.turns = []
+        self.start = 0
+        for user_message, assistant_response in turns:
+            self.add(user_message, assistant_response)
+
+    def add(self, user_message: str, assistant_response: str, max_turns: int = MAX_TURNS):
+        tokens = estimate_tokens(user_message) + estimate_tokens(assistant_response) + 2 * MESSAGE_TOKENS
+        self.turns.append((user_message, assistant_response, tokens))
+        if len(self.turns) > max_turns:
+            drop = len(self.turns) - max_turns // 2
+            del self.turns[:drop]
+            self.start = max(0, self.start - drop)
+
+    def window(self, max_tokens: int) -> list[tuple[str, str]]:
+        """The turns from the window start on, moving the start forward if they don't fit in `max_tokens`.
+
+        When it has to move, it moves until only half the budget is used,
+        leaving room for the next few turns.
+        """
+        used = sum(tokens for _, _, tokens in self.turns[self.start:])
+        if used > max_tokens:
+            while self.start < len(self.turns) and used > max_tokens // 2:
+                used -= self.turns[self.start][2]
+                self.start += 1
+        return [(user_message, assistant_response) for user_message, assistant_response, _ in self.turns[self.start:]]
+
+_histories = UserCache(MAX_USERS)
+
+def seed(tail: str) -> History:
+    """Build a history from the end of a log; an entry cut off before its header is left out."""
+    return History(parse_log_turn(body) for _, body in parse_entries(tail)[-MAX_TURNS:])
+
+def get(user_id: str, storage: Storage = None) -> History:
+    s = storage or default_storage
+    history = _histories.get(s, user_id)
+    if history is None:
+        history = seed(s.tail_log(user_id, SEED_CHARS))
+    _histories.put(s, user_id, history)
+    return history
+
+def add_turn(user_id: str, user_message: str, assistant_response: str, storage: Storage = None):
+    """Keep an already-seeded buffer current after memory.append_log."""
+    s = storage or default_storage
+    history = _histories.get(s, user_id)
+    if history is not None:
+        history.add(user_message, assistant_response)
+
+def window(user_id: str, max_tokens: int, storage: Storage = None) -> list[tuple[str, str]]:
+    """Recent turns, oldest first, within `max_tokens`."""
+    return get(user_id, storage).window(max_tokens)
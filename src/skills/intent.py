@@ -1,29 +1,147 @@
-"""Intent detection skill using LLM."""
+"""Intent detection skill: local fast path with LLM fallback."""
+import math
+import re
+from collections import Counter
 
 INTENTS = {
     "organize": "User wants to organize, consolidate, or structure their notes/wiki",
     "show_notes": "User wants to see, view, or read their notes or wiki",
     "show_reminders": "User wants to see their reminders or todos",
+    "search": "User wants to find what they said or noted earlier about a topic",
     "chat": "General conversation, questions, or anything else",
 }
 
-async def detect(llm_call, user_message: str) -> str:
-    """Detect user intent from message. Returns one of: organize, show_notes, show_reminders, chat"""
+# Below this confidence the local classifier defers to the LLM.
+CONFIDENCE_THRESHOLD = 0.75
+
+_NOTES = r"(?:notes?|wiki|memory|memories)"
+_REMINDERS = r"(?:reminders?|todos?|to dos?|tasks?)"
+_SHOW = r"(?:show|list|view|see|display|read|open|check|print|what are|what's in|whats in|give me)"
+_ORGANIZE = r"(?:organi[sz]e|consolidate|tidy|clean up|structure|sort|restructure)"
+_RECALL = r"(?:say|said|write|wrote|tell you|told you|mention|mentioned|note|noted)"
+_POLITE = r"(?:please |can you |could you )?"
+# The user's own notes/reminders as the object of a command: "me all of my", "my", "the".
+_MINE = r"(?:me )?(?:all )?(?:of )?(?:my|the) "
+_WHEN = r"(?: for (?:today|tomorrow|this week))?"
+
+# (intent, pattern, confidence). Patterns match short command-style messages.
+# Verbs like "sort" or "check" only count when the whole message is the
+# command ("organize my notes", not "organize a party"); a bare verb scores
+# below the threshold so the LLM decides.
+RULES = [
+    ("organize", re.compile(rf"^{_POLITE}{_ORGANIZE} (?:up )?{_MINE}{_NOTES}(?: please)?$"), 0.95),
+    ("show_reminders", re.compile(rf"^{_POLITE}{_SHOW} {_MINE}{_REMINDERS}{_WHEN}(?: please)?$"), 0.95),
+    ("search", re.compile(rf"^{_POLITE}(?:search|find|look up)\b.*\bmy {_NOTES}\b"), 0.95),
+    ("search", re.compile(rf"^{_POLITE}search\b"), 0.9),
+    ("search", re.compile(rf"^(?:what|when) did i {_RECALL}\b"), 0.9),
+    ("show_notes", re.compile(rf"^{_POLITE}{_SHOW} {_MINE}{_NOTES}(?: please)?$"), 0.95),
+    ("show_reminders", re.compile(rf"^(?:my )?{_REMINDERS}$"), 0.9),
+    ("show_notes", re.compile(rf"^(?:my )?{_NOTES}$"), 0.9),
+    ("organize", re.compile(r"^(?:organi[sz]e|consolidate)$"), 0.9),
+    ("organize", re.compile(rf"^{_ORGANIZE}\b"), 0.6),
+    ("chat", re.compile(r"^remind me\b"), 0.9),
+]
+
+# Words that suggest a non-chat intent; messages without any are chat. The
+# recall verbs let "do you remember what I said about my knee?" reach the LLM.
+_SEARCH_WORDS = r"(?:search|find|look up|remember|recall|said|told|tell you|wrote|mention|mentioned|noted)"
+_COMMAND_WORDS = re.compile(rf"\b(?:{_NOTES}|{_REMINDERS}|{_ORGANIZE}|{_SEARCH_WORDS})\b")
+MAX_COMMAND_WORDS = 8
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+class NaiveBayes:
+    """Multinomial naive Bayes over unigrams and bigrams."""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.word_counts = {}
+        self.class_counts = Counter()
+        self.vocab = set()
+
+    @staticmethod
+    def features(text: str) -> list[str]:
+        words = tokenize(text)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def train(self, examples: list[tuple[str, str]]):
+        for text, label in examples:
+            feats = self.features(text)
+            self.class_counts[label] += 1
+            self.word_counts.setdefault(label, Counter()).update(feats)
+            self.vocab.update(feats)
+
+    def predict(self, text: str) -> tuple[str, float]:
+        if not self.class_counts:
+            return "chat", 0.0
+        feats = self.features(text)
+        total = sum(self.class_counts.values())
+        scores = {}
+        for label, count in self.class_counts.items():
+            words = self.word_counts[label]
+            denom = sum(words.values()) + self.alpha * len(self.vocab)
+            score = math.log(count / total)
+            for f in feats:
+                score += math.log((words[f] + self.alpha) / denom)
+            scores[label] = score
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+class Classifier:
+    """Keyword/regex rules, optionally backed by a trained NaiveBayes model."""
+
+    def __init__(self, model: NaiveBayes = None):
+        self.model = model
+
+    def train(self, examples: list[tuple[str, str]]):
+        self.model = NaiveBayes()
+        self.model.train(examples)
+
+    def classify(self, user_message: str) -> tuple[str, float]:
+        """Return (intent, confidence) without calling the LLM."""
+        text = " ".join(tokenize(user_message))
+        words = text.split()
+
+        if len(words) <= MAX_COMMAND_WORDS:
+            for name, pattern, confidence in RULES:
+                if pattern.search(text):
+                    return name, confidence
+
+        if self.model is not None:
+            return self.model.predict(user_message)
+
+        if not _COMMAND_WORDS.search(text):
+            return "chat", 0.8
+        return "chat", 0.5
+
+classifier = Classifier()
+
+def build_prompt(user_message: str) -> str:
     intent_list = "\n".join(f"- {k}: {v}" for k, v in INTENTS.items())
 
-    prompt = f"""Classify this user message into ONE intent.
+    return f"""Classify this user message into ONE intent.
 
 Intents:
 {intent_list}
 
 User message: {user_message}
 
-Respond with ONLY the intent name (organize, show_notes, show_reminders, or chat). Nothing else."""
+Respond with ONLY the intent name (organize, show_notes, show_reminders, search, or chat). Nothing else."""
 
-    result = await llm_call(prompt)
+async def detect_llm(llm_call, user_message: str) -> str:
+    result = await llm_call(build_prompt(user_message))
     intent = result.strip().lower()
 
     # Validate intent
     if intent in INTENTS:
         return intent
     return "chat"
+
+async def detect(llm_call, user_message: str, threshold: float = CONFIDENCE_THRESHOLD) -> str:
+    """Detect user intent from message. Returns one of: organize, show_notes, show_reminders, search, chat"""
+    intent, confidence = classifier.classify(user_message)
+    if confidence >= threshold:
+        return intent
+    return await detect_llm(llm_call, user_message)
@@ -1,42 +1,58 @@
 from datetime import datetime
-from src.common import Storage, storage as default_storage
+from src.common import FileStorage, Storage, format_memory_entry, parse_entries, storage as default_storage
+from src.skills import history, recall, search
 
-def get_memory_file(user_id: str, storage: Storage = None):
+# Compaction leaves the newest KEEP_RECENT entries alone and only runs once at
+# least MIN_COMPACT_ENTRIES older ones have accumulated.
+KEEP_RECENT = 200
+MIN_COMPACT_ENTRIES = 100
+# Upper bound on note characters sent per compaction call.
+COMPACT_BATCH_CHARS = 24000
+
+def get_memory_file(user_id: str, storage: FileStorage = None):
     s = storage or default_storage
     return s.get_user_dir(user_id) / "memory.md"
 
-def get_log_file(user_id: str, storage: Storage = None):
+def get_log_file(user_id: str, storage: FileStorage = None):
     s = storage or default_storage
     return s.get_user_dir(user_id) / "log.md"
 
-def get_wiki_dir(user_id: str, storage: Storage = None):
+def get_wiki_dir(user_id: str, storage: FileStorage = None):
     s = storage or default_storage
-    wiki_dir = s.get_user_dir(user_id) / "wiki"
-    wiki_dir.mkdir(parents=True, exist_ok=True)
-    return wiki_dir
+    return s.get_wiki_dir(user_id)
 
 def read(user_id: str, storage: Storage = None) -> str:
-    f = get_memory_file(user_id, storage)
-    return f.read_text() if f.exists() else ""
+    s = storage or default_storage
+    return s.read_memory(user_id)
+
+def is_empty(user_id: str, storage: Storage = None) -> bool:
+    s = storage or default_storage
+    return not s.has_memory(user_id)
 
 def read_log(user_id: str, storage: Storage = None) -> str:
-    f = get_log_file(user_id, storage)
-    return f.read_text() if f.exists() else ""
+    s = storage or default_storage
+    return s.read_log(user_id)
 
 def append(user_id: str, content: str, storage: Storage = None):
-    f = get_memory_file(user_id, storage)
+    s = storage or default_storage
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-    with open(f, "a") as file:
-        file.write(f"\n## {timestamp}\n{content}\n")
+    s.append_memory(user_id, timestamp, content)
+    recall.add_entry(user_id, timestamp, content, s)
+
+def read_log_from(user_id: str, start: int, storage: Storage = None) -> str:
+    s = storage or default_storage
+    return s.read_log_from(user_id, start)
+
+def tail_log(user_id: str, max_chars: int, storage: Storage = None) -> str:
+    s = storage or default_storage
+    return s.tail_log(user_id, max_chars)
 
 def append_log(user_id: str, user_message: str, assistant_response: str, storage: Storage = None):
     """Append raw conversation to log file."""
-    f = get_log_file(user_id, storage)
+    s = storage or default_storage
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-    with open(f, "a") as file:
-        file.write(f"\n## {timestamp}\n")
-        file.write(f"**User:** {user_message}\n\n")
-        file.write(f"**Assistant:** {assistant_response}\n")
+    s.append_log(user_id, timestamp, user_message, assistant_response)
+    history.add_turn(user_id, user_message, assistant_response, s)
 
 async def extract_and_store(llm_call, user_id: str, user_message: str, assistant_response: str, storage: Storage = None):
     # Always log raw conversation
@@ -54,3 +70,55 @@ Extracted facts (markdown bullet points, or NOTHING):"""
     result = await llm_call(prompt)
     if result.strip().upper() != "NOTHING":
         append(user_id, result, storage)
+
+    try:
+        await search.update(user_id, storage or default_storage)
+    except Exception as e:
+        print(f"Search index update failed for {user_id}: {e!r}")
+
+async def compact(llm_call, user_id: str, keep_recent: int = KEEP_RECENT, min_entries: int = MIN_COMPACT_ENTRIES,
+                  storage: Storage = None, batch_chars: int = COMPACT_BATCH_CHARS) -> int:
+    """Summarize all but the newest `keep_recent` memory entries into one rolled-up entry.
+
+    Entries are folded in oldest first, about `batch_chars` at a time, each call
+    condensing the summary so far with the next batch. The originals are archived
+    by the storage backend as each batch succeeds; an empty answer (`llm_call`
+    should return None for one cut off at its token limit) stops there with
+    nothing lost. Returns how many entries were rolled up.
+    """
+    s = storage or default_storage
+    entries = parse_entries(s.read_memory(user_id))
+    old = entries[:max(0, len(entries) - keep_recent)]
+    if len(old) < min_entries:
+        return 0
+
+    rolled = 0
+    summary = []
+    while rolled < len(old):
+        batch = list(summary)
+        chars = sum(len(format_memory_entry(*entry)) for entry in batch)
+        # Always take at least one entry, even one over the limit on its own.
+        end = rolled
+        while end < len(old):
+            size = len(format_memory_entry(*old[end]))
+            if end > rolled and chars + size > batch_chars:
+                break
+            chars += size
+            end += 1
+        batch += old[rolled:end]
+
+        notes = "".join(format_memory_entry(timestamp, body) for timestamp, body in batch)
+        prompt = f"""Condense these notes about the user into one concise list. Keep every durable fact, preference, plan and date; drop duplicates and small talk; where notes conflict, keep the most recent.
+
+{notes}
+
+Condensed notes (markdown bullet points):"""
+
+        answer = await llm_call(prompt)
+        if not answer or not answer.strip():
+            break
+        last = batch[-1][0]
+        summary = [(last, f"_Summary of notes up to {last}_\n{answer.strip()}")]
+        s.compact_memory(user_id, len(batch), *summary[0])
+        rolled = end
+    return rolled
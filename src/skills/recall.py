@@ -0,0 +1,102 @@
+"""Pick the memory.md entries relevant to a message so the prompt stays a fixed size."""
+import math
+import re
+from collections import Counter
+from src.common import (
+    Storage, UserCache, estimate_tokens, format_memory_entry, parse_entries, storage as default_storage,
+)
+
+# BM25 indexes held in memory per storage (see UserCache).
+MAX_INDEXED_USERS = 1024
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class BM25Index:
+    """Okapi BM25 over one user's memory entries, appended to as memory grows."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries = []
+        self.terms = []
+        self.df = Counter()
+        self.total_length = 0
+        self.source_length = 0
+
+    @classmethod
+    def from_content(cls, content: str) -> "BM25Index":
+        index = cls()
+        for timestamp, body in parse_entries(content):
+            index.add(timestamp, body)
+        index.source_length = len(content)
+        return index
+
+    def add(self, timestamp: str, content: str):
+        terms = Counter(tokenize(content))
+        self.entries.append((timestamp, content))
+        self.terms.append(terms)
+        self.df.update(terms.keys())
+        self.total_length += sum(terms.values())
+
+    def scores(self, query: str) -> list[float]:
+        n = len(self.entries)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1
+        query_terms = set(tokenize(query))
+        scores = []
+        for terms in self.terms:
+            length = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term)
+                if not tf:
+                    continue
+                idf = math.log(1 + (n - self.df[term] + 0.5) / (self.df[term] + 0.5))
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+            scores.append(score)
+        return scores
+
+_indexes = UserCache(MAX_INDEXED_USERS)
+
+def get_index(user_id: str, storage: Storage = None) -> BM25Index:
+    """Return the user's index, rebuilding it if memory changed outside `add_entry`."""
+    s = storage or default_storage
+    content = s.read_memory(user_id)
+    index = _indexes.get(s, user_id)
+    if index is None or index.source_length != len(content):
+        index = BM25Index.from_content(content)
+    _indexes.put(s, user_id, index)
+    return index
+
+def add_entry(user_id: str, timestamp: str, content: str, storage: Storage = None):
+    """Keep an already-built index current after memory.append."""
+    s = storage or default_storage
+    index = _indexes.get(s, user_id)
+    if index is not None:
+        index.add(timestamp, content)
+        index.source_length += len(format_memory_entry(timestamp, content))
+
+def select(user_id: str, query: str, top_k: int = 8, max_tokens: int = 1000, recent: int = 2,
+           storage: Storage = None) -> str:
+    """Render the most relevant memory entries, in their original order, within `max_tokens`.
+
+    After the `top_k` best matches, the `recent` newest entries are added if
+    they fit, so fresh context isn't lost.
+    """
+    index = get_index(user_id, storage)
+    scores = index.scores(query)
+    ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])[:top_k]
+    newest = range(len(index.entries) - 1, max(-1, len(index.entries) - 1 - recent), -1)
+    candidates = ranked + [i for i in newest if i not in ranked]
+
+    chosen = []
+    used = 0
+    for i in candidates:
+        cost = estimate_tokens(format_memory_entry(*index.entries[i]))
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    return "".join(format_memory_entry(*index.entries[i]) for i in sorted(chosen))
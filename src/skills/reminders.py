@@ -1,103 +1,418 @@
 import asyncio
-import re
-from datetime import datetime
-from typing import Callable, Optional
-from src.common import Storage, storage as default_storage
+import heapq
+import itertools
+import random
+import time
+import weakref
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Union
+from zoneinfo import ZoneInfo
+from src import structured
+from src.recurrence import Rule, parse_recurrence, to_local, to_wall, zone
+from src.common import FileStorage, Storage, get_config, sanitize_user_id, storage as default_storage
 
-def get_reminders_file(user_id: str, storage: Storage = None):
+def get_reminders_file(user_id: str, storage: FileStorage = None):
     s = storage or default_storage
     return s.get_user_dir(user_id) / "reminders.md"
 
 def read(user_id: str, storage: Storage = None) -> str:
-    f = get_reminders_file(user_id, storage)
-    return f.read_text() if f.exists() else ""
+    s = storage or default_storage
+    return s.read_reminders(user_id)
 
 def parse(user_id: str, storage: Storage = None) -> list[dict]:
-    content = read(user_id, storage)
-    reminders = []
-    pattern = r"- \[([ x])\] ([^`\n]+?)(?:\s+`due:([^`]+)`)?\s*$"
-
-    for line in content.split("\n"):
-        match = re.match(pattern, line.strip())
-        if match:
-            reminders.append({
-                "text": match.group(2).strip(),
-                "completed": match.group(1) == "x",
-                "due": match.group(3),
-            })
-    return reminders
-
-def add(user_id: str, text: str, due: Optional[str] = None, storage: Storage = None):
-    f = get_reminders_file(user_id, storage)
-    line = f"- [ ] {text}"
-    if due:
-        line += f" `due:{due}`"
-    with open(f, "a") as file:
-        file.write(f"{line}\n")
+    s = storage or default_storage
+    return s.list_reminders(user_id)
+
+def add(user_id: str, text: str, due: Optional[str] = None, storage: Storage = None,
+        every: Optional[str] = None, tz: Optional[str] = None) -> "Reminder":
+    """Store a reminder. A recurring one without a due time starts at its rule's next time."""
+    s = storage or default_storage
+    reminder = Reminder(text, due, every=every, tz=tz)
+    if reminder.due is None and reminder.rule is not None:
+        reminder = reminder.following(datetime.now())
+    s.add_reminder(user_id, reminder.text, reminder.due, reminder.every, reminder.tz)
+    get_scheduler(s).schedule(sanitize_user_id(user_id), reminder)
+    return reminder
 
 def mark_complete(user_id: str, text: str, storage: Storage = None):
-    f = get_reminders_file(user_id, storage)
-    if not f.exists():
-        return
-    content = f.read_text()
-    lines = content.split("\n")
-    for i, line in enumerate(lines):
-        if text in line and "- [ ]" in line:
-            lines[i] = line.replace("- [ ]", "- [x]")
-            break
-    f.write_text("\n".join(lines))
+    s = storage or default_storage
+    if s.complete_reminder(user_id, text):
+        get_scheduler(s).discard(sanitize_user_id(user_id), text)
+
+def reschedule(user_id: str, reminder: "Reminder", storage: Storage = None,
+               now: datetime = None) -> Optional["Reminder"]:
+    """Move a recurring reminder to its first time after `now` (or after its current time, if later)."""
+    s = storage or default_storage
+    following = reminder.following(now or datetime.now())
+    if following is None:
+        return None
+    if s.reschedule_reminder(user_id, reminder.text, following.due):
+        get_scheduler(s).schedule(sanitize_user_id(user_id), following)
+    return following
 
 def get_due(user_id: str, storage: Storage = None) -> list[dict]:
     now = datetime.now()
     due_reminders = []
     for r in parse(user_id, storage):
-        if r["completed"] or not r["due"]:
-            continue
-        try:
-            if datetime.fromisoformat(r["due"]) <= now:
-                due_reminders.append(r)
-        except ValueError:
+        if r["completed"]:
             continue
+        due_at = parse_due(r["due"], r.get("tz"))
+        if due_at is not None and due_at <= now:
+            due_reminders.append(r)
     return due_reminders
 
-async def extract_and_store(llm_call, user_id: str, user_message: str, storage: Storage = None):
+# Extracted reminders below this confidence are dropped.
+MIN_CONFIDENCE = 0.5
+
+REMINDER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reminders": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"},
+                    "due": {"type": ["string", "null"]},
+                    "recurrence": {"type": ["string", "null"]},
+                    "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                },
+                "required": ["text", "due", "recurrence", "confidence"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["reminders"],
+    "additionalProperties": False,
+}
+
+async def extract_and_store(llm_call, user_id: str, user_message: str, storage: Storage = None) -> list[dict]:
+    """Store every timed or recurring reminder in the message; returns the ones stored."""
     now = datetime.now()
     prompt = f"""Current time: {now.strftime("%Y-%m-%d %H:%M")}
 
-Does this message contain a reminder, todo, or task to remember? If yes, extract it.
-Respond in this exact format:
-REMINDER: <task text>
-DUE: <ISO datetime like 2024-02-01T17:00, or NONE if no specific time>
+List every reminder, todo, or task to remember in this message.
+Respond with ONLY a JSON object:
+{{"reminders": [{{"text": "<task text>", "due": "<ISO datetime like 2024-02-01T17:00 of the first time, or null if no specific time>", "recurrence": "<how it repeats, or null if it doesn't>", "confidence": <0 to 1, how sure you are this is a reminder>}}]}}
 
-If no reminder/todo, respond with just: NONE
+Write recurrence as one of: "daily", "weekdays", "weekly", "every monday and thursday", "monthly", "every 2 hours", "every 3 days", or "cron <minute> <hour> <day> <month> <weekday>"; add " at 9:30" for a time of day.
+
+If there are none, respond with {{"reminders": []}}
 
 User message: {user_message}"""
 
-    result = await llm_call(prompt)
-    if "NONE" in result and "REMINDER:" not in result:
+    result = await structured.request(llm_call, prompt, REMINDER_SCHEMA)
+    stored = []
+    for r in (result or {}).get("reminders", []):
+        text = r["text"].strip()
+        every = r["recurrence"] if r["recurrence"] and parse_recurrence(r["recurrence"]) else None
+        # Only store reminders that have a due time or a schedule
+        if not text or not (r["due"] or every) or r["confidence"] < MIN_CONFIDENCE:
+            continue
+        reminder = add(user_id, text, r["due"], storage, every=every)
+        stored.append({"text": text, "due": reminder.due, "recurrence": every})
+    return stored
+
+@dataclass(slots=True)
+class Reminder:
+    """A parsed reminder with its recurrence rule compiled and first firing precomputed.
+
+    `due` is wall-clock time in `tz` (local time if unset); `fire_at` is the
+    same moment in local time, ready for the scheduler's heap.
+    """
+    text: str
+    due: Optional[str] = None
+    completed: bool = False
+    every: Optional[str] = None
+    tz: Optional[str] = None
+    tzinfo: Optional[ZoneInfo] = field(init=False, repr=False, compare=False)
+    wall_due: Optional[datetime] = field(init=False, repr=False, compare=False)
+    fire_at: Optional[datetime] = field(init=False, repr=False, compare=False)
+    rule: Optional[Rule] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.tzinfo = zone(self.tz)
+        self.wall_due = _parse_wall(self.due, self.tzinfo)
+        self.fire_at = to_local(self.wall_due, self.tzinfo) if self.wall_due else None
+        self.rule = parse_recurrence(self.every, self.wall_due) if self.every else None
+
+    @classmethod
+    def from_dict(cls, r: dict) -> "Reminder":
+        return cls(r["text"], r.get("due"), r.get("completed", False), r.get("every"), r.get("tz"))
+
+    def as_dict(self) -> dict:
+        return {"text": self.text, "completed": self.completed, "due": self.due, "every": self.every, "tz": self.tz}
+
+    def following(self, now: datetime) -> Optional["Reminder"]:
+        """This reminder moved to its next time after `now`; None if it doesn't recur."""
+        if self.rule is None:
+            return None
+        after = to_wall(max(now, self.fire_at) if self.fire_at else now, self.tzinfo)
+        wall = self.rule.after(after, self.wall_due)
+        if wall is None:
+            return None
+        return Reminder(self.text, wall.strftime("%Y-%m-%dT%H:%M"), every=self.every, tz=self.tz)
+
+class Scheduler:
+    """In-memory min-heap of pending reminder due times for one storage.
+
+    Filled once by `load()` and kept current by `add`/`mark_complete`/
+    `reschedule`. Entries carry the parsed `Reminder`, so firing one doesn't
+    touch storage.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._live = {}
+        self._wakeup = None
+
+    def load(self, storage: Storage, owns: Callable[[str], bool] = None):
+        """Rebuild the heap from `storage`, keeping only users `owns` accepts (all by default)."""
+        self._heap = []
+        self._live = {}
+        self._wakeup = asyncio.Event()
+        for user_id, r in storage.pending_reminders():
+            if owns is None or owns(user_id):
+                self.schedule(user_id, Reminder.from_dict(r))
+
+    def push(self, user_id: str, text: str, due: Optional[str], every: Optional[str] = None, tz: Optional[str] = None):
+        self.schedule(user_id, Reminder(text, due, every=every, tz=tz))
+
+    def schedule(self, user_id: str, reminder: "Reminder"):
+        if reminder.fire_at is not None:
+            self.push_at(user_id, reminder.text, reminder.fire_at, reminder)
+
+    def push_at(self, user_id: str, text: str, due_at: datetime, reminder: "Reminder" = None):
+        key = (user_id, text)
+        self._live[key] = self._live.get(key, 0) + 1
+        entry = (due_at, next(self._seq), user_id, text, reminder)
+        heapq.heappush(self._heap, entry)
+        if self._wakeup is not None and self._heap[0] is entry:
+            self._wakeup.set()
+
+    def discard(self, user_id: str, text: str):
+        self._take((user_id, text))
+
+    def _take(self, key) -> bool:
+        count = self._live.get(key, 0)
+        if count <= 0:
+            return False
+        if count == 1:
+            del self._live[key]
+        else:
+            self._live[key] = count - 1
+        return True
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and (self._heap[0][2], self._heap[0][3]) not in self._live:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due_reminders(self, now: datetime) -> list[tuple[str, "Reminder"]]:
+        """Pop every entry due at `now`, returning (user_id, reminder) in due order."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, _, user_id, text, reminder = heapq.heappop(self._heap)
+            if self._take((user_id, text)):
+                due.append((user_id, reminder or Reminder(text, due_at.strftime("%Y-%m-%dT%H:%M"))))
+        return due
+
+    def pop_due(self, now: datetime) -> list[str]:
+        """Pop every entry due at `now` and return the affected user ids in due order."""
+        return list(dict.fromkeys(user_id for user_id, _ in self.pop_due_reminders(now)))
+
+    async def wait(self, timeout: float):
+        """Sleep until the next deadline, `timeout` seconds, or an earlier reminder is added."""
+        next_due = self.next_due()
+        if next_due is not None:
+            timeout = min(timeout, max(0.0, (next_due - datetime.now()).total_seconds()))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+_schedulers = weakref.WeakKeyDictionary()
+
+def get_scheduler(storage: Storage = None) -> Scheduler:
+    s = storage or default_storage
+    if s not in _schedulers:
+        _schedulers[s] = Scheduler()
+    return _schedulers[s]
+
+def _parse_wall(due: Optional[str], tz: Optional[ZoneInfo]) -> Optional[datetime]:
+    if not due:
+        return None
+    try:
+        parsed = datetime.fromisoformat(due)
+    except ValueError:
         return None
+    return to_wall(parsed, tz) if parsed.tzinfo else parsed
+
+def parse_due(due: Optional[str], tz: Optional[str] = None) -> Optional[datetime]:
+    """A `due:` value (wall-clock time in `tz`, or with its own UTC offset) as naive local time."""
+    zone_info = zone(tz)
+    wall = _parse_wall(due, zone_info)
+    return to_local(wall, zone_info) if wall else None
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second, with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Wait for `amount` tokens (at most `capacity`) and take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def charge(self, amount: float):
+        """Take `amount` tokens after the fact; later acquisitions wait until the debt refills."""
+        self._refill()
+        self.tokens -= amount
+
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (telegram.error.RetryAfter), if any."""
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return retry_after
+
+class Dispatcher:
+    """Deliver due reminders through a bounded pool of workers.
+
+    Sends are paced by a global and a per-chat token bucket (Telegram allows
+    roughly 30 messages/s overall and 1/s per chat). A failed send is retried
+    with jittered exponential backoff; a reminder is marked complete (or, if
+    it recurs, moved to its next time) only after its callback returns, and
+    one that keeps failing is retried `retry_later` seconds out.
+    """
+
+    def __init__(self, callback: Callable[[str, dict], None], storage: Storage = None, concurrency: int = 16,
+                 global_rate: float = 25.0, per_chat_rate: float = 1.0, retries: int = 3,
+                 backoff: float = 1.0, retry_later: float = 300):
+        self.callback = callback
+        self.storage = storage
+        self.concurrency = concurrency
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_later = retry_later
+        self.queue = asyncio.Queue()
+        self.in_flight = set()
+        self.sent = 0
+        self.failed = 0
+        self._chat_buckets = {}
+
+    def submit(self, user_id: str, reminder: Union["Reminder", dict]) -> bool:
+        """Queue a reminder unless it is already queued or being sent."""
+        if isinstance(reminder, dict):
+            reminder = Reminder.from_dict(reminder)
+        key = (user_id, reminder.text, reminder.due)
+        if key in self.in_flight:
+            return False
+        self.in_flight.add(key)
+        self.queue.put_nowait((user_id, reminder))
+        return True
+
+    def _chat_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(user_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.idle()}
+            bucket = self._chat_buckets[user_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    async def run(self):
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def join(self):
+        """Wait until everything submitted so far has been delivered or given up on."""
+        await self.queue.join()
+
+    async def _worker(self):
+        while True:
+            user_id, reminder = await self.queue.get()
+            try:
+                await self.deliver(user_id, reminder)
+            finally:
+                self.in_flight.discard((user_id, reminder.text, reminder.due))
+                self.queue.task_done()
+
+    async def deliver(self, user_id: str, reminder: "Reminder") -> bool:
+        for attempt in range(self.retries + 1):
+            await self._chat_bucket(user_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.callback(user_id, reminder.as_dict())
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Giving up on reminder for {user_id} after {attempt + 1} attempts: {e}")
+                    self.failed += 1
+                    get_scheduler(self.storage).push_at(
+                        user_id, reminder.text, datetime.now() + timedelta(seconds=self.retry_later), reminder
+                    )
+                    return False
+                delay = _retry_after(e) or self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                await asyncio.sleep(delay)
+                continue
+            if reminder.rule is not None:
+                reschedule(user_id, reminder, self.storage)
+            else:
+                # Not mark_complete: the scheduler already dropped this entry when it popped it,
+                # and discarding again would drop another open reminder with the same text.
+                (self.storage or default_storage).complete_reminder(user_id, reminder.text)
+            self.sent += 1
+            return True
+        return False
+
+async def loop(callback: Callable[[str, dict], None], interval: int = 60, storage: Storage = None,
+               dispatcher: Dispatcher = None, owns: Callable[[str], bool] = None):
+    """Fire reminders as they come due.
 
-    reminder_match = re.search(r"REMINDER:\s*(.+?)(?:\n|$)", result)
-    due_match = re.search(r"DUE:\s*(.+?)(?:\n|$)", result)
-
-    if reminder_match:
-        text = reminder_match.group(1).strip()
-        due = None
-        if due_match:
-            due_str = due_match.group(1).strip()
-            if due_str.upper() != "NONE":
-                due = due_str
-        # Only store reminders that have a due time
-        if due:
-            add(user_id, text, due, storage)
-            return {"text": text, "due": due}
-    return None
-
-async def loop(callback: Callable[[str, dict], None], interval: int = 60, storage: Storage = None):
+    The schedule is loaded from disk once; afterwards only `add`/`mark_complete`
+    update it, so edits made to reminders.md outside the bot need a restart.
+    `interval` caps how long the loop sleeps between checks. Delivery goes
+    through `dispatcher` (by default one configured from config.json's
+    "reminders" section); `callback` should raise if a send fails. `owns`
+    limits the schedule to some users, e.g. one shard's.
+    """
     s = storage or default_storage
-    while True:
-        for user_id in s.get_all_user_ids():
-            for r in get_due(user_id, storage):
-                await callback(user_id, r)
-                mark_complete(user_id, r["text"], storage)
-        await asyncio.sleep(interval)
+    scheduler = get_scheduler(s)
+    scheduler.load(s, owns)
+    dispatcher = dispatcher or Dispatcher(callback, storage, **get_config().get("reminders", {}))
+    workers = asyncio.create_task(dispatcher.run())
+    try:
+        while True:
+            for user_id, reminder in scheduler.pop_due_reminders(datetime.now()):
+                dispatcher.submit(user_id, reminder)
+            await scheduler.wait(interval)
+    finally:
+        workers.cancel()
@@ -0,0 +1,255 @@
+"""Semantic search over a user's memory entries, conversation turns and wiki quotes.
+
+Each user's index lives in two blobs beside their data: "search-vectors", a
+flat float32 array with one unit vector per item (readable as-is with
+numpy.memmap), and "search-items", one JSON line per item. The "search" state
+records how far each source is indexed, so `update` only embeds what was
+added since: new memory entries, log turns past the indexed offset and quotes
+appended to wiki pages. If memory, the log or a page was rewritten
+(compaction, edits) the index is rebuilt. New items are written out
+`PERSIST_EVERY` at a time (off the event loop for FileStorage); ones not
+written yet when the process stops are indexed again on the next load.
+
+Embeddings come from the OpenAI-compatible endpoint when config.json's
+`search.embedding_model` is set, otherwise from hashed words and character
+trigrams, which need no API call. A query is a brute-force dot product with
+every vector, over the query's non-zero dimensions.
+"""
+import asyncio
+import heapq
+import json
+import math
+import operator
+import re
+import weakref
+import zlib
+from array import array
+from typing import Optional
+from src import metrics
+from src.common import (
+    FileStorage, Storage, UserCache, get_config, parse_entries, parse_log_turn, parse_wiki_page, sanitize_user_id,
+    storage as default_storage,
+)
+from src.skills.recall import tokenize
+
+VECTORS = "search-vectors"
+ITEMS = "search-items"
+
+HASHED_DIMENSIONS = 256
+# Texts per embeddings request.
+EMBED_BATCH = 64
+# Start of memory.md remembered to notice compaction rewriting it.
+HEAD_CHARS = 200
+# Vector indexes held in memory per storage; they are larger than recall's.
+MAX_INDEXED_USERS = 256
+# Items added in memory before the blobs and state are written.
+PERSIST_EVERY = 16
+
+STOP_WORDS = frozenset(
+    "a about an and are at be did do for from i in is it me my of on or say said that the this to was "
+    "what when where with you".split()
+)
+
+_QUERY_PREFIX = re.compile(
+    r"^(?:please |can you |could you )?(?:"
+    r"search(?: (?:in )?(?:my )?(?:notes|memory|memories|wiki))?(?: for)?"
+    r"|find(?: in my (?:notes|memory|memories|wiki))?"
+    r"|look up"
+    r"|(?:what|when) did i (?:say|said|write|wrote|tell you|told you|mention|mentioned|note|noted)(?: about)?"
+    r")\b[\s:]*",
+    re.IGNORECASE,
+)
+
+def query_text(message: str) -> str:
+    """The topic of a search request: the message without its "what did I say about" lead-in."""
+    text = message.strip().rstrip("?!. ")
+    return _QUERY_PREFIX.sub("", text, count=1) or text
+
+def _unit(vector) -> array:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return array("f", [x / norm for x in vector] if norm else vector)
+
+def hashed_embedding(text: str, dimensions: int = HASHED_DIMENSIONS) -> array:
+    """Signed feature hashing of the words (minus stop words) and their character trigrams."""
+    vector = [0.0] * dimensions
+    for word in tokenize(text):
+        if word in STOP_WORDS:
+            continue
+        padded = f"<{word}>"
+        features = [(word, 1.0)] + [(padded[i:i + 3], 0.5) for i in range(len(padded) - 2)]
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % dimensions] += weight if h & 0x80000000 else -weight
+    return _unit(vector)
+
+def embedding_model() -> str:
+    """The configured embeddings model, or "hashed" for the local fallback."""
+    return get_config().get("search", {}).get("embedding_model") or "hashed"
+
+async def embed(texts: list[str], model: str, user_id: str = None) -> list[array]:
+    """Unit vectors for `texts`."""
+    if model == "hashed":
+        return [hashed_embedding(text) for text in texts]
+    from src.agent import get_client
+    client = get_client()
+    vectors = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        with metrics.labels(usage="embedding", skill="search", user=user_id):
+            response = await client.embeddings.create(model=model, input=texts[i:i + EMBED_BATCH])
+        vectors.extend(_unit(item.embedding) for item in response.data)
+    return vectors
+
+class VectorIndex:
+    """One user's items and their unit vectors, one row after another in a flat float32 array."""
+
+    def __init__(self, state: dict, items: list[dict] = None, vectors: array = None, saved: dict = None):
+        self.state = state
+        self.items = items or []
+        self.vectors = vectors if vectors is not None else array("f")
+        # The state as last written to storage; items past its count are only in memory.
+        self.saved = saved or {}
+
+    def add(self, items: list[dict], vectors: list[array]):
+        self.items.extend(items)
+        for vector in vectors:
+            self.vectors.extend(vector)
+
+    def search(self, query: array, top_k: int) -> list[tuple[float, dict]]:
+        """The `top_k` items closest to `query`, best first."""
+        if not self.items:
+            return []
+        dimensions = len(self.vectors) // len(self.items)
+        nonzero = [(j, w) for j, w in enumerate(query) if w]
+        vectors = self.vectors
+        if len(nonzero) * 4 < dimensions:
+            scores = [
+                sum(vectors[base + j] * w for j, w in nonzero)
+                for base in range(0, len(vectors), dimensions)
+            ]
+        else:
+            scores = [
+                sum(map(operator.mul, query, vectors[base:base + dimensions]))
+                for base in range(0, len(vectors), dimensions)
+            ]
+        best = heapq.nlargest(top_k, range(len(scores)), key=scores.__getitem__)
+        return [(scores[i], self.items[i]) for i in best if scores[i] > 0]
+
+def _load(user_id: str, s: Storage) -> VectorIndex:
+    state = s.read_state(user_id, "search")
+    vectors = array("f")
+    vectors.frombytes(s.read_blob(user_id, VECTORS)[:state.get("vector_bytes", 0)])
+    lines = s.read_blob(user_id, ITEMS)[:state.get("item_bytes", 0)].decode().splitlines()
+    items = [json.loads(line) for line in lines]
+    if len(items) != state.get("count", 0) or (items and len(vectors) % len(items)):
+        return VectorIndex({})
+    return VectorIndex(state, items, vectors, saved=state)
+
+def _save(user_id: str, index: VectorIndex, s: Storage):
+    """Append the items added since the last save to the blobs, then record them in the state."""
+    saved = index.saved
+    count = saved.get("count", 0)
+    dimensions = len(index.vectors) // len(index.items) if index.items else 0
+    vector_bytes = index.vectors[count * dimensions:].tobytes()
+    item_bytes = "".join(json.dumps(item) + "\n" for item in index.items[count:]).encode()
+    s.write_blob(user_id, VECTORS, vector_bytes, saved.get("vector_bytes", 0))
+    s.write_blob(user_id, ITEMS, item_bytes, saved.get("item_bytes", 0))
+    state = {
+        **index.state,
+        "count": len(index.items),
+        "vector_bytes": saved.get("vector_bytes", 0) + len(vector_bytes),
+        "item_bytes": saved.get("item_bytes", 0) + len(item_bytes),
+    }
+    s.write_state(user_id, "search", state)
+    index.state = index.saved = state
+
+def _new_items(user_id: str, state: dict, s: Storage) -> Optional[tuple[list[dict], dict]]:
+    """Items added since `state` was indexed and the state after them; None if a source was rewritten."""
+    memory = s.read_memory(user_id)
+    head = state.get("memory_head", "")
+    if len(memory) < state.get("memory", 0) or not memory.startswith(head):
+        return None
+    items = [
+        {"source": "memory", "when": timestamp, "text": body}
+        for timestamp, body in parse_entries(memory[state.get("memory", 0):])
+    ]
+
+    offset = state.get("log", 0)
+    log_length = s.log_length(user_id)
+    if log_length < offset:
+        return None
+    for timestamp, body in parse_entries(s.read_log_from(user_id, offset) if log_length > offset else ""):
+        items.append({"source": "log", "when": timestamp, "text": parse_log_turn(body)[0]})
+
+    wiki = dict(state.get("wiki", {}))
+    for filename, page in s.wiki_manifest(user_id).items():
+        indexed = wiki.get(filename, 0)
+        if page["notes"] < indexed:
+            return None
+        if page["notes"] > indexed:
+            title, quotes = parse_wiki_page(s.read_wiki_page(user_id, filename))
+            items.extend({"source": "wiki", "page": title or filename, "text": q} for q in quotes[indexed:])
+            wiki[filename] = len(quotes)
+
+    progress = {"memory": len(memory), "memory_head": memory[:HEAD_CHARS], "log": log_length, "wiki": wiki}
+    return [item for item in items if item["text"].strip()], progress
+
+_indexes = UserCache(MAX_INDEXED_USERS)
+_locks = weakref.WeakValueDictionary()
+
+def _lock(storage: Storage, key: str) -> asyncio.Lock:
+    lock = _locks.get((id(storage), key))
+    if lock is None:
+        lock = _locks[(id(storage), key)] = asyncio.Lock()
+    return lock
+
+async def update(user_id: str, storage: Storage = None) -> VectorIndex:
+    """Embed what was added to the user's notes since the last update, and return their index."""
+    s = storage or default_storage
+    key = sanitize_user_id(user_id)
+    model = embedding_model()
+    async with _lock(s, key):
+        index = _indexes.get(s, user_id)
+        if index is None or index.saved.get("count", 0) != s.read_state(user_id, "search").get("count", 0):
+            # Not loaded yet, or another process (e.g. a consolidation run) added to it.
+            index = _load(user_id, s)
+        if index.state.get("model") != model:
+            index = VectorIndex({"model": model})
+        found = _new_items(user_id, index.state, s)
+        if found is None:
+            index = VectorIndex({"model": model})
+            found = _new_items(user_id, index.state, s)
+        items, progress = found
+
+        vectors = await embed([item["text"] for item in items], model, user_id) if items else []
+        index.add(items, vectors)
+        # New items and source offsets stay in memory until PERSIST_EVERY items have piled up.
+        index.state = {**index.state, **progress, "count": len(index.items)}
+        if "count" not in index.saved or len(index.items) - index.saved["count"] >= PERSIST_EVERY:
+            if isinstance(s, FileStorage):
+                # atomic_write fsyncs; keep that off the event loop.
+                await asyncio.to_thread(_save, user_id, index, s)
+            else:
+                # SQLiteStorage shares one connection with the loop thread, whose explicit
+                # transactions a write from another thread could land inside.
+                _save(user_id, index, s)
+
+        _indexes.put(s, user_id, index)
+        return index
+
+async def search(user_id: str, query: str, top_k: int = 5, storage: Storage = None) -> list[tuple[float, dict]]:
+    """(score, item) for the user's notes closest to `query`, best first."""
+    index = await update(user_id, storage)
+    if not index.items:
+        return []
+    [vector] = await embed([query], index.state["model"], user_id)
+    return index.search(vector, top_k)
+
+def format_item(item: dict, max_chars: int = 200) -> str:
+    text = item["text"].strip().replace("\n", " ")
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+    if item["source"] == "wiki":
+        return f"- {text} ({item['page']})"
+    if item["source"] == "log":
+        return f"- You said on {item['when']}: \"{text}\""
+    return f"- {text} (noted {item['when']})"
@@ -0,0 +1,404 @@
+"""SQLite storage backend.
+
+    python -m src.sqlite_storage migrate [DATA_DIR] [DB]   # data/ tree -> SQLite
+    python -m src.sqlite_storage export [DB] [DATA_DIR]    # SQLite -> Obsidian markdown
+"""
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+from src.common import (
+    DEFAULT_DATA_DIR, FileStorage, Storage, format_log_turn, format_memory_entry,
+    format_reminder, parse_entries, parse_log_turn, parse_wiki_page, sanitize_user_id, wiki_filename,
+)
+
+DEFAULT_DB = DEFAULT_DATA_DIR / "copper-golem.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS memory_entries (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_entries_user ON memory_entries (user_id, id);
+CREATE TABLE IF NOT EXISTS memory_archive (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_turns (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    assistant_response TEXT NOT NULL,
+    start INTEGER NOT NULL DEFAULT 0,
+    chars INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS log_turns_user ON log_turns (user_id, id);
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    due TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    every TEXT,
+    tz TEXT
+);
+CREATE INDEX IF NOT EXISTS reminders_user ON reminders (user_id, completed, id);
+CREATE INDEX IF NOT EXISTS reminders_due ON reminders (completed, due);
+CREATE TABLE IF NOT EXISTS wiki_pages (
+    user_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content TEXT NOT NULL,
+    title TEXT,
+    notes INTEGER,
+    updated REAL,
+    PRIMARY KEY (user_id, filename)
+);
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, name)
+);
+CREATE TABLE IF NOT EXISTS user_blobs (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (user_id, name)
+);
+"""
+
+class SQLiteStorage(Storage):
+    """All users in one SQLite database (WAL mode), one row per entry/turn/reminder/page."""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or DEFAULT_DB)
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._users = set(row[0] for row in self.db.execute("SELECT id FROM users"))
+        self._add_columns("reminders", {"every": "TEXT", "tz": "TEXT"})
+        if self._add_columns("log_turns", {"start": "INTEGER NOT NULL DEFAULT 0", "chars": "INTEGER NOT NULL DEFAULT 0"}):
+            self._index_log_turns()
+        self.db.execute("CREATE INDEX IF NOT EXISTS log_turns_start ON log_turns (user_id, start)")
+        if self._add_columns("wiki_pages", {"title": "TEXT", "notes": "INTEGER", "updated": "REAL"}):
+            for user_id, filename, content in self.db.execute(
+                "SELECT user_id, filename, content FROM wiki_pages"
+            ).fetchall():
+                self.write_wiki_page(user_id, filename, content)
+
+    def close(self):
+        self.db.close()
+
+    def _add_columns(self, table: str, columns: dict) -> bool:
+        """Add columns missing from a database created by an older version; True if any were."""
+        existing = {row[1] for row in self.db.execute(f"PRAGMA table_info({table})")}
+        missing = [name for name in columns if name not in existing]
+        for name in missing:
+            self.db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]}")
+        return bool(missing)
+
+    def _index_log_turns(self):
+        """Fill in each turn's offset and formatted length in a database created before they were stored."""
+        ends = {}
+        self.db.execute("BEGIN")
+        for turn_id, user, *turn in self.db.execute(
+            "SELECT id, user_id, timestamp, user_message, assistant_response FROM log_turns ORDER BY id"
+        ).fetchall():
+            chars = len(format_log_turn(*turn))
+            start = ends.get(user, 0)
+            self.db.execute("UPDATE log_turns SET start = ?, chars = ? WHERE id = ?", (start, chars, turn_id))
+            ends[user] = start + chars
+        self.db.execute("COMMIT")
+
+    def _user(self, user_id: str) -> str:
+        safe_id = sanitize_user_id(user_id)
+        if safe_id not in self._users:
+            self.db.execute("INSERT OR IGNORE INTO users (id) VALUES (?)", (safe_id,))
+            self._users.add(safe_id)
+        return safe_id
+
+    def get_all_user_ids(self) -> list[str]:
+        return [row[0] for row in self.db.execute("SELECT id FROM users")]
+
+    def read_memory(self, user_id: str) -> str:
+        rows = self.db.execute(
+            "SELECT timestamp, content FROM memory_entries WHERE user_id = ? ORDER BY id",
+            (self._user(user_id),),
+        )
+        return "".join(format_memory_entry(ts, content) for ts, content in rows)
+
+    def append_memory(self, user_id: str, timestamp: str, content: str):
+        self.db.execute(
+            "INSERT INTO memory_entries (user_id, timestamp, content) VALUES (?, ?, ?)",
+            (self._user(user_id), timestamp, content),
+        )
+
+    def compact_memory(self, user_id: str, count: int, timestamp: str, summary: str):
+        user = self._user(user_id)
+        ids = [row[0] for row in self.db.execute(
+            "SELECT id FROM memory_entries WHERE user_id = ? ORDER BY id LIMIT ?", (user, count)
+        )]
+        if not ids:
+            return
+        self.db.execute("BEGIN")
+        try:
+            self.db.execute(
+                """INSERT INTO memory_archive (user_id, timestamp, content)
+                SELECT user_id, timestamp, content FROM memory_entries WHERE user_id = ? AND id <= ? ORDER BY id""",
+                (user, ids[-1]),
+            )
+            self.db.execute("DELETE FROM memory_entries WHERE user_id = ? AND id <= ?", (user, ids[-1]))
+            # Reusing the oldest id keeps the summary first.
+            self.db.execute(
+                "INSERT INTO memory_entries (id, user_id, timestamp, content) VALUES (?, ?, ?, ?)",
+                (ids[0], user, timestamp, summary),
+            )
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def read_log(self, user_id: str) -> str:
+        rows = self.db.execute(
+            "SELECT timestamp, user_message, assistant_response FROM log_turns WHERE user_id = ? ORDER BY id",
+            (self._user(user_id),),
+        )
+        return "".join(format_log_turn(*row) for row in rows)
+
+    def append_log(self, user_id: str, timestamp: str, user_message: str, assistant_response: str):
+        user = self._user(user_id)
+        chars = len(format_log_turn(timestamp, user_message, assistant_response))
+        # One statement, so the offset can't race another append for the same user.
+        self.db.execute(
+            """INSERT INTO log_turns (user_id, timestamp, user_message, assistant_response, start, chars)
+            VALUES (?, ?, ?, ?, coalesce((
+                SELECT start + chars FROM log_turns WHERE user_id = ? ORDER BY id DESC LIMIT 1
+            ), 0), ?)""",
+            (user, timestamp, user_message, assistant_response, user, chars),
+        )
+
+    def iter_log(self, user_id: str, start: int = 0) -> Iterator[tuple[int, str]]:
+        user = self._user(user_id)
+        rows = self.db.execute(
+            """SELECT start, timestamp, user_message, assistant_response FROM log_turns
+            WHERE user_id = ? AND start >= coalesce((
+                SELECT max(start) FROM log_turns WHERE user_id = ? AND start <= ?
+            ), 0) ORDER BY start""",
+            (user, user, start),
+        )
+        for offset, *turn in rows:
+            yield offset, format_log_turn(*turn)
+
+    def log_length(self, user_id: str) -> int:
+        row = self.db.execute(
+            "SELECT start + chars FROM log_turns WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+            (self._user(user_id),),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def tail_log(self, user_id: str, max_chars: int) -> str:
+        if max_chars <= 0:
+            return ""
+        rows = self.db.execute(
+            "SELECT timestamp, user_message, assistant_response FROM log_turns WHERE user_id = ? ORDER BY id DESC",
+            (self._user(user_id),),
+        )
+        pieces = []
+        chars = 0
+        for turn in rows:
+            pieces.append(format_log_turn(*turn))
+            chars += len(pieces[-1])
+            if chars >= max_chars:
+                break
+        rows.close()
+        return "".join(reversed(pieces))[-max_chars:]
+
+    def read_reminders(self, user_id: str) -> str:
+        return "".join(
+            format_reminder(r["text"], r["due"], r["completed"], r["every"], r["tz"])
+            for r in self.list_reminders(user_id)
+        )
+
+    def list_reminders(self, user_id: str) -> list[dict]:
+        rows = self.db.execute(
+            "SELECT text, completed, due, every, tz FROM reminders WHERE user_id = ? ORDER BY id",
+            (self._user(user_id),),
+        )
+        return [
+            {"text": text, "completed": bool(completed), "due": due, "every": every, "tz": tz}
+            for text, completed, due, every, tz in rows
+        ]
+
+    def add_reminder(self, user_id: str, text: str, due: Optional[str] = None,
+                     every: Optional[str] = None, tz: Optional[str] = None):
+        self.db.execute(
+            "INSERT INTO reminders (user_id, text, due, every, tz) VALUES (?, ?, ?, ?, ?)",
+            (self._user(user_id), text, due, every, tz),
+        )
+
+    def complete_reminder(self, user_id: str, text: str) -> bool:
+        cursor = self.db.execute(
+            """UPDATE reminders SET completed = 1 WHERE id = (
+                SELECT id FROM reminders
+                WHERE user_id = ? AND completed = 0 AND instr(text, ?) > 0
+                ORDER BY id LIMIT 1
+            )""",
+            (self._user(user_id), text),
+        )
+        return cursor.rowcount > 0
+
+    def reschedule_reminder(self, user_id: str, text: str, due: str) -> bool:
+        cursor = self.db.execute(
+            """UPDATE reminders SET due = ? WHERE id = (
+                SELECT id FROM reminders
+                WHERE user_id = ? AND completed = 0 AND instr(text, ?) > 0
+                ORDER BY id LIMIT 1
+            )""",
+            (due, self._user(user_id), text),
+        )
+        return cursor.rowcount > 0
+
+    def pending_reminders(self) -> Iterator[tuple[str, dict]]:
+        rows = self.db.execute(
+            "SELECT user_id, text, due, every, tz FROM reminders WHERE completed = 0 ORDER BY due"
+        )
+        for user_id, text, due, every, tz in rows:
+            yield user_id, {"text": text, "completed": False, "due": due, "every": every, "tz": tz}
+
+    def list_wiki_pages(self, user_id: str) -> list[str]:
+        rows = self.db.execute(
+            "SELECT filename FROM wiki_pages WHERE user_id = ? ORDER BY filename",
+            (self._user(user_id),),
+        )
+        return [row[0] for row in rows]
+
+    def read_wiki_page(self, user_id: str, filename: str) -> str:
+        row = self.db.execute(
+            "SELECT content FROM wiki_pages WHERE user_id = ? AND filename = ?",
+            (self._user(user_id), wiki_filename(filename)),
+        ).fetchone()
+        return row[0] if row else ""
+
+    def write_wiki_page(self, user_id: str, filename: str, content: str):
+        title, quotes = parse_wiki_page(content)
+        self.db.execute(
+            """INSERT OR REPLACE INTO wiki_pages (user_id, filename, content, title, notes, updated)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            (self._user(user_id), wiki_filename(filename), content, title, len(quotes), time.time()),
+        )
+
+    def wiki_manifest(self, user_id: str) -> dict[str, dict]:
+        rows = self.db.execute(
+            "SELECT filename, title, notes, length(content), updated FROM wiki_pages WHERE user_id = ? ORDER BY filename",
+            (self._user(user_id),),
+        )
+        return {
+            filename: {"title": title, "notes": notes, "size": size, "mtime": int(updated * 1e9)}
+            for filename, title, notes, size, updated in rows
+        }
+
+    def has_memory(self, user_id: str) -> bool:
+        row = self.db.execute(
+            "SELECT 1 FROM memory_entries WHERE user_id = ? LIMIT 1", (self._user(user_id),)
+        ).fetchone()
+        return row is not None
+
+    def read_state(self, user_id: str, name: str) -> dict:
+        row = self.db.execute(
+            "SELECT value FROM user_state WHERE user_id = ? AND name = ?",
+            (self._user(user_id), name),
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def write_state(self, user_id: str, name: str, state: dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO user_state (user_id, name, value) VALUES (?, ?, ?)",
+            (self._user(user_id), name, json.dumps(state)),
+        )
+
+    def read_blob(self, user_id: str, name: str) -> bytes:
+        row = self.db.execute(
+            "SELECT value FROM user_blobs WHERE user_id = ? AND name = ?",
+            (self._user(user_id), name),
+        ).fetchone()
+        return bytes(row[0]) if row else b""
+
+    def write_blob(self, user_id: str, name: str, data: bytes, start: int = 0):
+        value = self.read_blob(user_id, name)[:start] + data if start else data
+        self.db.execute(
+            "INSERT OR REPLACE INTO user_blobs (user_id, name, value) VALUES (?, ?, ?)",
+            (self._user(user_id), name, value),
+        )
+
+def export(source: SQLiteStorage, data_dir: Path) -> int:
+    """Write every user as the Obsidian-compatible markdown tree FileStorage uses."""
+    target = FileStorage(data_dir)
+    users = source.get_all_user_ids()
+    for user_id in users:
+        user_dir = target.get_user_dir(user_id)
+        for name, content in (
+            ("memory.md", source.read_memory(user_id)),
+            ("log.md", source.read_log(user_id)),
+            ("reminders.md", source.read_reminders(user_id)),
+        ):
+            if content:
+                target.write_text(user_dir / name, content)
+        for filename in source.list_wiki_pages(user_id):
+            target.write_wiki_page(user_id, filename, source.read_wiki_page(user_id, filename))
+    return len(users)
+
+def migrate(source: FileStorage, target: SQLiteStorage) -> int:
+    """Copy an existing data/ tree into SQLite. Returns the number of users copied."""
+    users = source.get_all_user_ids()
+    target.db.execute("BEGIN")
+    try:
+        for user_id in users:
+            target._user(user_id)
+            for timestamp, content in parse_entries(source.read_memory(user_id)):
+                target.append_memory(user_id, timestamp, content)
+            for timestamp, body in parse_entries(source.read_log(user_id)):
+                target.append_log(user_id, timestamp, *parse_log_turn(body))
+            for r in source.list_reminders(user_id):
+                target.db.execute(
+                    "INSERT INTO reminders (user_id, text, due, completed, every, tz) VALUES (?, ?, ?, ?, ?, ?)",
+                    (target._user(user_id), r["text"], r["due"], int(r["completed"]), r["every"], r["tz"]),
+                )
+            for filename in source.list_wiki_pages(user_id):
+                target.write_wiki_page(user_id, filename, source.read_wiki_page(user_id, filename))
+    except BaseException:
+        target.db.execute("ROLLBACK")
+        target._users = set(row[0] for row in target.db.execute("SELECT id FROM users"))
+        raise
+    target.db.execute("COMMIT")
+    return len(users)
+
+def main(argv: list[str]):
+    if len(argv) < 1 or argv[0] not in ("migrate", "export"):
+        print(__doc__)
+        sys.exit(1)
+    if argv[0] == "migrate":
+        data_dir = Path(argv[1]) if len(argv) > 1 else DEFAULT_DATA_DIR
+        db = Path(argv[2]) if len(argv) > 2 else DEFAULT_DB
+        count = migrate(FileStorage(data_dir), SQLiteStorage(db))
+        print(f"Migrated {count} users from {data_dir} to {db}")
+    else:
+        db = Path(argv[1]) if len(argv) > 1 else DEFAULT_DB
+        data_dir = Path(argv[2]) if len(argv) > 2 else DEFAULT_DATA_DIR
+        count = export(SQLiteStorage(db), data_dir)
+        print(f"Exported {count} users from {db} to {data_dir}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""Schema-constrained LLM answers.
+
+`request(llm_call, prompt, schema)` asks for JSON matching `schema` (sent to
+the API as an OpenAI-style `response_format`), parses and validates the
+answer, and re-asks with the validation errors a bounded number of times.
+Prompts should still describe the format in words: batched calls and some
+providers ignore `response_format`.
+"""
+import json
+import re
+from typing import Any, Optional
+
+REPAIR_RETRIES = 1
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+def response_format(name: str, schema: dict) -> dict:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+def parse_json(text: str) -> Optional[Any]:
+    """The JSON value in an answer, tolerating code fences or chatter around one object."""
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    text = _FENCE.sub("", text)
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+def _is(value, type_name: str) -> bool:
+    if isinstance(value, bool) and type_name in ("integer", "number"):
+        return False
+    return isinstance(value, _TYPES[type_name])
+
+def validate(value, schema: dict, path: str = "$") -> list[str]:
+    """Errors for `value` against the subset of JSON Schema the extraction schemas use."""
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(_is(value, t) for t in types):
+            return [f"{path}: expected {' or '.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: must be one of {schema['enum']}"]
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", ()):
+            if name not in value:
+                errors.append(f"{path}.{name}: missing")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(validate(item, properties[name], f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{name}: unexpected")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: below {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: above {schema['maximum']}")
+    return errors
+
+def repair_prompt(prompt: str, answer: str, errors: list[str]) -> str:
+    problems = "\n".join(f"- {e}" for e in errors[:10])
+    return f"""{prompt}
+
+Your previous answer was not valid:
+{answer}
+
+Problems:
+{problems}
+
+Respond again with ONLY the corrected JSON."""
+
+async def request(llm_call, prompt: str, schema: dict, retries: int = REPAIR_RETRIES) -> Optional[Any]:
+    """Ask `llm_call` for JSON matching `schema`; None if it's still invalid after `retries` repairs."""
+    attempt = prompt
+    for _ in range(retries + 1):
+        answer = await llm_call(attempt, schema=schema)
+        value = parse_json(answer)
+        errors = ["answer is not JSON"] if value is None else validate(value, schema)
+        if not errors:
+            return value
+        attempt = repair_prompt(prompt, answer, errors)
+    print(f"Giving up on structured answer after {retries + 1} attempts: {errors[0]}")
+    return None
@@ -0,0 +1,196 @@
+"""LLM transport: connection pooling, timeouts, retries, hedging and failover.
+
+`Transport` stands in for an AsyncOpenAI client (only `chat.completions.create`
+and `embeddings.create` are used) and spreads each call over one or more
+OpenAI-compatible endpoints:
+
+- every endpoint has its own pooled keep-alive HTTP client;
+- each usage ("chat", "extraction", ...) gets its own timeout;
+- timeouts, connection errors, 429s and 5xx answers are retried with jittered
+  exponential backoff. An endpoint that fails is skipped for `cooldown`
+  seconds, so retries fail over to the next one (e.g. a local server);
+- for hedged usages, a non-streaming call still running after the usage's
+  p95 latency gets a second, identical request, and the first answer wins.
+  Batched extraction (skill "batch") is neither hedged nor counted towards
+  that p95: its prompts are several times larger than a single extraction.
+
+Streaming calls are retried only until the stream opens. The usage comes from
+`metrics.labels`, which `agent` sets around every call.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from src import metrics
+
+DEFAULT_TIMEOUTS = {"chat": 60.0, "extraction": 30.0, "consolidation": 120.0}
+
+# Latencies kept per usage for the hedging percentile.
+LATENCY_WINDOW = 200
+
+def retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+class Endpoint:
+    """One OpenAI-compatible API. `models` overrides the model per usage, for servers with other model names."""
+
+    def __init__(self, name: str, client, models: dict = None):
+        self.name = name
+        self.client = client
+        self.models = models or {}
+        self.down_until = 0.0
+
+class Transport:
+    def __init__(self, endpoints: list[Endpoint], timeouts: dict = None, connect_timeout: float = 10.0,
+                 retries: int = 2, backoff: float = 0.5, max_backoff: float = 8.0, cooldown: float = 30.0,
+                 hedge_usages: tuple = ("extraction",), hedge_percentile: float = 95, hedge_delay: float = 2.0,
+                 hedge_min_samples: int = 20, registry: metrics.Registry = metrics.registry):
+        self.endpoints = endpoints
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cooldown = cooldown
+        self.hedge_usages = set(hedge_usages)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.registry = registry
+        self._latency = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.embeddings = SimpleNamespace(create=self.create_embeddings)
+
+    def timeout(self, usage: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts.get(usage, self.timeouts.get("default", 60.0)), connect=self.connect_timeout)
+
+    def hedge_after(self, usage: str) -> float:
+        """Seconds to wait before hedging: the usage's recent p95, or `hedge_delay` until enough calls are seen."""
+        samples = self._latency[usage]
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+
+    def _pick(self, attempt: int) -> Endpoint:
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.down_until <= now] or self.endpoints
+        return healthy[attempt % len(healthy)]
+
+    async def create(self, **kwargs):
+        usage = metrics.current_usage()
+        kwargs.setdefault("timeout", self.timeout(usage))
+        if metrics.current_skill() == "batch":
+            return await self._with_retries(usage, lambda endpoint: self._send(endpoint, usage, kwargs, sample=False))
+        if usage in self.hedge_usages and not kwargs.get("stream"):
+            return await self._with_retries(usage, lambda endpoint: self._hedged(endpoint, usage, kwargs))
+        return await self._with_retries(usage, lambda endpoint: self._send(endpoint, usage, kwargs))
+
+    async def create_embeddings(self, **kwargs):
+        """Embeddings through the same endpoints, timeouts and retries (never hedged)."""
+        usage = metrics.current_usage()
+        kwargs.setdefault("timeout", self.timeout(usage))
+
+        def send(endpoint: Endpoint):
+            model = endpoint.models.get(usage, kwargs["model"])
+            return endpoint.client.embeddings.create(**{**kwargs, "model": model})
+        return await self._with_retries(usage, send)
+
+    async def _with_retries(self, usage: str, send):
+        for attempt in range(self.retries + 1):
+            endpoint = self._pick(attempt)
+            try:
+                return await send(endpoint)
+            except Exception as e:
+                if not retryable(e) or attempt == self.retries:
+                    raise
+                endpoint.down_until = time.monotonic() + self.cooldown
+                following = self._pick(attempt + 1)
+                if following is endpoint or following.down_until > time.monotonic():
+                    delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    print(f"LLM {usage} call to {endpoint.name} failed ({e!r}); retrying in {delay:.1f}s")
+                    self.registry.record_transport(usage, "retry")
+                    await asyncio.sleep(delay)
+                else:
+                    print(f"LLM {usage} call to {endpoint.name} failed ({e!r}); failing over to {following.name}")
+                    self.registry.record_transport(usage, "failover")
+
+    async def _send(self, endpoint: Endpoint, usage: str, kwargs: dict, sample: bool = True):
+        if usage in endpoint.models:
+            kwargs = {**kwargs, "model": endpoint.models[usage]}
+        start = time.perf_counter()
+        response = await endpoint.client.chat.completions.create(**kwargs)
+        if sample and not kwargs.get("stream"):
+            self._latency[usage].append(time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, endpoint: Endpoint, usage: str, kwargs: dict):
+        first = asyncio.create_task(self._send(endpoint, usage, kwargs))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after(usage))
+            if not done:
+                self.registry.record_transport(usage, "hedge")
+                pending.add(asyncio.create_task(self._send(endpoint, usage, kwargs)))
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    raise first.exception()
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+def make_client(base_url: str, api_key: Optional[str], settings: dict) -> AsyncOpenAI:
+    """An AsyncOpenAI client with a sized keep-alive pool and no retries of its own."""
+    limits = httpx.Limits(
+        max_connections=settings.get("pool_size", 100),
+        max_keepalive_connections=settings.get("keepalive", 20),
+        keepalive_expiry=settings.get("keepalive_expiry", 30.0),
+    )
+    return AsyncOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=limits),
+    )
+
+def from_config(settings: dict, base_url: str, api_key: Optional[str]) -> Transport:
+    """Build the transport described by config.json's "llm" section.
+
+    The fallback endpoint comes from LLM_FALLBACK_BASE_URL (or
+    `fallback_base_url`) and uses LLM_FALLBACK_API_KEY if set.
+    """
+    endpoints = [Endpoint("primary", make_client(base_url, api_key, settings))]
+    fallback_url = os.environ.get("LLM_FALLBACK_BASE_URL", settings.get("fallback_base_url"))
+    if fallback_url:
+        fallback_key = os.environ.get("LLM_FALLBACK_API_KEY", api_key or "none")
+        endpoints.append(Endpoint("fallback", make_client(fallback_url, fallback_key, settings),
+                                  settings.get("fallback_models")))
+    hedge = settings.get("hedge", {})
+    return Transport(
+        endpoints,
+        timeouts=settings.get("timeouts"),
+        connect_timeout=settings.get("connect_timeout", 10.0),
+        retries=settings.get("retries", 2),
+        backoff=settings.get("backoff", 0.5),
+        max_backoff=settings.get("max_backoff", 8.0),
+        cooldown=settings.get("cooldown", 30.0),
+        hedge_usages=tuple(hedge.get("usages", ("extraction",))),
+        hedge_percentile=hedge.get("percentile", 95),
+        hedge_delay=hedge.get("delay", 2.0),
+        hedge_min_samples=hedge.get("min_samples", 20),
+    )
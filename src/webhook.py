@@ -0,0 +1,153 @@
+"""Webhook deployment for the Telegram bot.
+
+Telegram POSTs each update to `path`; it is checked against the secret token,
+queued on the application's update queue and acknowledged at once, so slow
+LLM calls never hold the request open. GET /healthz reports liveness and
+queue depth, GET /readyz is 503 until the bot is started and again once it
+starts draining for shutdown.
+
+To try it locally, run the bot with BOT_MODE=webhook and POST a recorded
+update:
+
+    curl -X POST localhost:8443/telegram \\
+        -H "X-Telegram-Bot-Api-Secret-Token: $TELEGRAM_WEBHOOK_SECRET" \\
+        -H "Content-Type: application/json" -d @update.json
+"""
+import asyncio
+import hmac
+import json
+import os
+import signal
+from typing import Optional
+from telegram import Update
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+# Telegram updates are small; anything bigger isn't one.
+MAX_BODY_BYTES = 1 << 20
+
+class WebhookServer:
+    def __init__(self, app, path: str = "/telegram", secret_token: Optional[str] = None):
+        self.app = app
+        self.path = path
+        self.secret_token = secret_token
+        self.ready = False
+        self.received = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "0.0.0.0", port: int = 8443) -> asyncio.AbstractServer:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    async def close(self):
+        """Stop accepting requests; updates already queued are still processed."""
+        self.ready = False
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def _secret_ok(self, headers: dict) -> bool:
+        if not self.secret_token:
+            return True
+        return hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret_token)
+
+    def health(self) -> dict:
+        return {"ready": self.ready, "received": self.received, "queued": self.app.update_queue.qsize()}
+
+    async def handle(self, method: str, path: str, headers: dict, body: bytes) -> tuple[str, str]:
+        """Route one request; returns (status, JSON body)."""
+        if method == "GET" and path == "/healthz":
+            return "200 OK", json.dumps(self.health())
+        if method == "GET" and path == "/readyz":
+            return ("200 OK" if self.ready else "503 Service Unavailable"), json.dumps({"ready": self.ready})
+        if path != self.path:
+            return "404 Not Found", '{"error": "not found"}'
+        if method != "POST":
+            return "405 Method Not Allowed", '{"error": "POST only"}'
+        if not self._secret_ok(headers):
+            return "403 Forbidden", '{"error": "bad secret token"}'
+        if not self.ready:
+            # Telegram retries non-2xx answers, so nothing is lost while we restart.
+            return "503 Service Unavailable", '{"error": "shutting down"}'
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            return "400 Bad Request", json.dumps({"error": f"invalid update: {e}"})
+        await self.app.update_queue.put(update)
+        self.received += 1
+        return "200 OK", "{}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request.decode("latin-1").split()
+            method, path = (parts[0], parts[1]) if len(parts) > 1 else ("GET", "/")
+            length = int(headers.get("content-length", 0) or 0)
+            if length > MAX_BODY_BYTES:
+                status, body = "413 Payload Too Large", '{"error": "too large"}'
+            else:
+                status, body = await self.handle(method, path.split("?")[0], headers, await reader.readexactly(length))
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def settings_from_env(settings: dict) -> dict:
+    """config.json's "telegram"."webhook" section with environment overrides applied."""
+    return {
+        "host": os.environ.get("WEBHOOK_HOST", settings.get("host", "0.0.0.0")),
+        "port": int(os.environ.get("WEBHOOK_PORT", settings.get("port", 8443))),
+        "path": settings.get("path", "/telegram"),
+        "url": os.environ.get("WEBHOOK_URL", settings.get("url")),
+        "secret_token": os.environ.get("TELEGRAM_WEBHOOK_SECRET"),
+    }
+
+async def run(app, settings: dict, drain=None):
+    """Serve `app` by webhook until SIGINT/SIGTERM, then drain and shut down.
+
+    `url` is the public HTTPS address Telegram should call; without it the
+    webhook is assumed to be registered already (e.g. by a load balancer
+    setup). `drain` awaits work that outlives update handlers, such as
+    background extraction.
+    """
+    server = WebhookServer(app, settings["path"], settings["secret_token"])
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    await server.start(settings["host"], settings["port"])
+    if settings.get("url"):
+        await app.bot.set_webhook(
+            url=settings["url"].rstrip("/") + settings["path"],
+            secret_token=settings["secret_token"],
+            allowed_updates=Update.ALL_TYPES,
+        )
+    server.ready = True
+    print(f"Webhook listening on {settings['host']}:{settings['port']}{settings['path']}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        print("Draining...")
+        await server.close()
+        # Application.stop() waits for updates already queued to be handled.
+        await app.stop()
+        if drain is not None:
+            await drain()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import pytest
+from src.common import FileStorage
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+@pytest.fixture
+def storage(monkeypatch):
+    from src.skills import history, memory, recall, reminders
+    temp_dir = Path(tempfile.mkdtemp())
+    s = FileStorage(data_dir=temp_dir)
+    monkeypatch.setattr(memory, "default_storage", s)
+    monkeypatch.setattr(recall, "default_storage", s)
+    monkeypatch.setattr(reminders, "default_storage", s)
+    monkeypatch.setattr(history, "default_storage", s)
+    yield s
+    shutil.rmtree(temp_dir)
+
+def fake_completion(content):
+    async def chunks():
+        for word in content.split(" "):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+    async def create(stream=False, **kwargs):
+        if stream:
+            return chunks()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+@pytest.mark.asyncio
+async def test_chat_runs_extractions(storage, monkeypatch):
+    from src import agent
+    from src.skills import memory, reminders
+
+    async def fake_llm(prompt, usage="extraction", **tags):
+        if "Classify" in prompt:
+            return "chat"
+        if prompt.startswith("Current time:"):
+            return '{"reminders": [{"text": "call mom", "due": "2024-02-01T17:00", "recurrence": null, "confidence": 0.9}]}'
+        return "- likes tea"
+
+    monkeypatch.setattr(agent, "llm_call", fake_llm)
+    monkeypatch.setattr(agent, "client", fake_completion("Sure!"))
+
+    assert await agent.chat("user1", "I like tea, remind me to call mom at 5pm") == "Sure!"
+    assert "likes tea" in memory.read("user1", storage)
+    assert "call mom" in reminders.read("user1", storage)
+
+@pytest.mark.asyncio
+async def test_chat_isolates_extraction_failures(storage, monkeypatch):
+    from src import agent
+    from src.skills import memory
+
+    async def fake_llm(prompt, usage="extraction", **tags):
+        if "Classify" in prompt:
+            return "chat"
+        if prompt.startswith("Current time:"):
+            raise RuntimeError("upstream error")
+        return "- likes tea"
+
+    monkeypatch.setattr(agent, "llm_call", fake_llm)
+    monkeypatch.setattr(agent, "client", fake_completion("Sure!"))
+
+    assert await agent.chat("user1", "I like tea", background=True) == "Sure!"
+    await agent.drain()
+    assert "likes tea" in memory.read("user1", storage)
+    assert "I like tea" in memory.read_log("user1", storage)
+
+@pytest.mark.asyncio
+async def test_chat_stream_yields_chunks(storage, monkeypatch):
+    from src import agent
+    from src.skills import memory
+
+    async def fake_llm(prompt, usage="extraction", **tags):
+        if prompt.startswith("Current time:"):
+            return '{"reminders": []}'
+        return "- likes tea"
+
+    monkeypatch.setattr(agent, "llm_call", fake_llm)
+    monkeypatch.setattr(agent, "client", fake_completion("Sure, noted that"))
+
+    chunks = [c async for c in agent.chat_stream("user1", "I like tea")]
+    await agent.drain()
+
+    assert chunks == ["Sure, ", "noted ", "that "]
+    assert "Sure, noted that" in memory.read_log("user1", storage)
+    assert "likes tea" in memory.read("user1", storage)
+
+@pytest.mark.asyncio
+async def test_chat_stream_special_intent(storage, monkeypatch):
+    from src import agent
+
+    monkeypatch.setattr(agent, "llm_call", AsyncMock(return_value="NONE"))
+    monkeypatch.setattr(agent, "client", None)
+    chunks = [c async for c in agent.chat_stream("user1", "show my reminders")]
+    assert len(chunks) == 1
+    assert "don't have any reminders" in chunks[0]
+
+def test_build_messages_keeps_stable_prefix(storage):
+    from src import agent
+    from src.skills import memory
+
+    memory.append("user1", "- likes tea", storage)
+    memory.append_log("user1", "hello", "hi there", storage)
+    first = agent.build_messages("user1", "how are you?")
+    assert first[0] == {"role": "system", "content": agent.SYSTEM_PROMPT}
+    assert first[1:3] == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi there"}]
+    assert "likes tea" in first[3]["content"]
+    assert first[-1] == {"role": "user", "content": "how are you?"}
+
+    memory.append_log("user1", "how are you?", "great", storage)
+    second = agent.build_messages("user1", "bye")
+    assert second[:3] == first[:3]
+    assert second[3:5] == [{"role": "user", "content": "how are you?"}, {"role": "assistant", "content": "great"}]
+
+def test_build_messages_fits_budget(storage, monkeypatch):
+    from src import agent
+    from src.common import estimate_tokens, get_config
+    from src.skills import memory
+
+    for i in range(30):
+        memory.append_log("user1", f"message {i} " + "word " * 100, "reply " * 100, storage)
+    monkeypatch.setitem(get_config(), "context", {"budgets": {"default": 3000}, "history_tokens": 5000})
+    messages = agent.build_messages("user1", "hi")
+    assert sum(estimate_tokens(m["content"]) for m in messages) <= 3000 - agent.CHAT_REPLY_TOKENS
+    assert "message 29" in messages[-4]["content"]
+    assert "message 0 " not in str(messages)
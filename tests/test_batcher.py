@@ -0,0 +1,107 @@
+import asyncio
+import json
+import pytest
+from src.batcher import Batcher, batch_schema, build_prompt, parse_answers
+
+class FakeLLM:
+    """Answers single prompts with "single:<prompt>" and batches with `batch_reply(prompts)`."""
+
+    def __init__(self, batch_reply=None):
+        self.calls = []
+        self.batch_reply = batch_reply or (lambda prompts: json.dumps({str(i): f"batched:{p}" for i, p in enumerate(prompts, 1)}))
+
+    async def __call__(self, prompt, skill=None, user_id=None, max_tokens=None, schema=None):
+        self.calls.append((skill, user_id, max_tokens))
+        if skill == "batch":
+            prompts = [block.split("\n", 1)[1] for block in prompt.split("### Task ")[1:]]
+            prompts[-1] = prompts[-1].split("\n\nRespond with ONLY")[0]
+            return self.batch_reply([p.strip() for p in prompts])
+        return f"single:{prompt}"
+
+def test_parse_answers():
+    assert parse_answers('{"1": "a", "2": "b"}', 2) == {1: "a", 2: "b"}
+    assert parse_answers('```json\n{"1": "a", "3": "c"}\n```', 2) == {1: "a"}
+    assert parse_answers("Sure! {\"2\": \"b\"}", 2) == {2: "b"}
+    assert parse_answers("not json", 2) is None
+    assert parse_answers("[1, 2]", 2) is None
+
+def test_build_prompt_numbers_tasks():
+    prompt = build_prompt(["first", "second"])
+    assert "2 independent tasks" in prompt
+    assert "### Task 1\nfirst" in prompt
+    assert "### Task 2\nsecond" in prompt
+
+@pytest.mark.asyncio
+async def test_batches_prompts_across_users():
+    llm = FakeLLM()
+    batcher = Batcher(llm, window=0.01)
+    results = await asyncio.gather(
+        batcher.submit("a", "memory", "user1"),
+        batcher.submit("b", "reminders", "user2"),
+        batcher.submit("c", "memory", "user3"),
+    )
+    assert results == ["batched:a", "batched:b", "batched:c"]
+    assert llm.calls == [("batch", None, 1500)]
+
+@pytest.mark.asyncio
+async def test_single_prompt_sent_directly():
+    llm = FakeLLM()
+    batcher = Batcher(llm, window=0.01)
+    assert await batcher.submit("a", "memory", "user1") == "single:a"
+    assert llm.calls == [("memory", "user1", 500)]
+
+@pytest.mark.asyncio
+async def test_max_items_flushes_immediately():
+    llm = FakeLLM()
+    batcher = Batcher(llm, window=60, max_items=2)
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.submit("a", "memory"), batcher.submit("b", "memory")), timeout=1
+    )
+    assert results == ["batched:a", "batched:b"]
+
+@pytest.mark.asyncio
+async def test_unparseable_batch_falls_back_to_single_calls():
+    llm = FakeLLM(batch_reply=lambda prompts: "I can't do that")
+    batcher = Batcher(llm, window=0.01)
+    results = await asyncio.gather(batcher.submit("a", "memory", "user1"), batcher.submit("b", "memory", "user2"))
+    assert results == ["single:a", "single:b"]
+    assert [skill for skill, _, _ in llm.calls] == ["batch", "memory", "memory"]
+
+@pytest.mark.asyncio
+async def test_missing_answers_retried_individually():
+    llm = FakeLLM(batch_reply=lambda prompts: json.dumps({"1": "only first"}))
+    batcher = Batcher(llm, window=0.01)
+    results = await asyncio.gather(batcher.submit("a", "memory"), batcher.submit("b", "memory"))
+    assert results == ["only first", "single:b"]
+
+@pytest.mark.asyncio
+async def test_batch_error_reaches_every_caller():
+    async def failing(prompt, **kwargs):
+        raise RuntimeError("upstream error")
+
+    batcher = Batcher(failing, window=0.01)
+    results = await asyncio.gather(
+        batcher.submit("a", "memory"), batcher.submit("b", "memory"), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+def test_allows_only_configured_extraction_skills():
+    batcher = Batcher(FakeLLM(), skills=("memory",))
+    assert batcher.allows("extraction", "memory")
+    assert not batcher.allows("extraction", "intent")
+    assert not batcher.allows("chat", "memory")
+
+@pytest.mark.asyncio
+async def test_structured_answers_reserialized():
+    schema = {"type": "object", "properties": {"n": {"type": "integer"}}}
+    llm = FakeLLM(batch_reply=lambda prompts: json.dumps({"1": {"n": 1}, "2": "plain"}))
+    batcher = Batcher(llm, window=0.01)
+    results = await asyncio.gather(batcher.submit("a", "reminders", schema=schema), batcher.submit("b", "memory"))
+    assert json.loads(results[0]) == {"n": 1}
+    assert results[1] == "plain"
+
+def test_batch_schema_slots():
+    schema = {"type": "object"}
+    combined = batch_schema([schema, None])
+    assert combined["properties"] == {"1": schema, "2": {"type": "string"}}
+    assert combined["required"] == ["1", "2"]
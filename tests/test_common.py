@@ -1,14 +1,14 @@
 import tempfile
 import shutil
+import threading
 from pathlib import Path
 import pytest
-from src.common import Storage, sanitize_user_id
-from telegram.helpers import escape_markdown
+from src.common import FileCache, FileStorage, UserCache, escape_markdown, sanitize_user_id
 
 @pytest.fixture
 def storage():
     temp_dir = Path(tempfile.mkdtemp())
-    s = Storage(data_dir=temp_dir)
+    s = FileStorage(data_dir=temp_dir)
     yield s
     shutil.rmtree(temp_dir)
 
@@ -34,6 +34,48 @@ def test_get_all_user_ids(storage):
     users = storage.get_all_user_ids()
     assert set(users) == {"user1", "user2", "user3"}
 
+# Cache tests
+
+def test_read_text_cached(storage):
+    path = storage.get_user_dir("user1") / "memory.md"
+    storage.append_text(path, "hello\n")
+    assert storage.read_text(path) == "hello\n"
+    assert storage.read_text(path) == "hello\n"
+    assert storage.cache.stats()["hits"] >= 1
+
+def test_append_writes_through_cache(storage):
+    path = storage.get_user_dir("user1") / "memory.md"
+    storage.append_text(path, "one\n")
+    storage.read_text(path)
+    storage.append_text(path, "two\n")
+    misses = storage.cache.misses
+    assert storage.read_text(path) == "one\ntwo\n"
+    assert storage.cache.misses == misses
+
+def test_external_edit_invalidates_cache(storage):
+    path = storage.get_user_dir("user1") / "memory.md"
+    storage.write_text(path, "old")
+    assert storage.read_text(path) == "old"
+    path.write_text("edited in obsidian")
+    assert storage.read_text(path) == "edited in obsidian"
+
+def test_derived_rebuilt_on_change(storage):
+    path = storage.get_user_dir("user1") / "reminders.md"
+    storage.write_text(path, "a\nb")
+    assert storage.derived(path, "lines", lambda c: c.split("\n")) == ["a", "b"]
+    storage.append_text(path, "\nc")
+    assert storage.derived(path, "lines", lambda c: c.split("\n")) == ["a", "b", "c"]
+
+def test_cache_lru_eviction(storage):
+    cache = FileCache(max_entries=2)
+    s = FileStorage(data_dir=storage.data_dir, cache=cache)
+    user_dir = s.get_user_dir("user1")
+    for name in ("a.md", "b.md", "c.md"):
+        s.write_text(user_dir / name, name)
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
+    assert s.read_text(user_dir / "a.md") == "a.md"
+
 # Sanitization tests
 
 def test_sanitize_user_id_valid():
@@ -41,6 +83,67 @@ def test_sanitize_user_id_valid():
     assert sanitize_user_id("user-name_1") == "user-name_1"
     assert sanitize_user_id("12345") == "12345"
 
+# Write serialization tests
+
+def test_write_text_is_atomic(storage):
+    path = storage.get_user_dir("user1") / "reminders.md"
+    storage.write_text(path, "- [ ] a\n")
+    storage.write_text(path, "- [x] a\n")
+    assert path.read_text() == "- [x] a\n"
+    assert [p.name for p in path.parent.iterdir()] == ["reminders.md"]
+
+def test_concurrent_reminder_updates_not_lost(storage):
+    for i in range(20):
+        storage.add_reminder("user1", f"task {i}")
+
+    def worker(start):
+        for i in range(start, 20, 4):
+            storage.complete_reminder("user1", f"task {i}")
+            storage.add_reminder("user1", f"new {i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    storage.cache.clear()
+    reminders = storage.list_reminders("user1")
+    assert len(reminders) == 40
+    assert all(r["completed"] for r in reminders if r["text"].startswith("task"))
+    assert not any(r["completed"] for r in reminders if r["text"].startswith("new"))
+
+def test_sync_flushes_appended_files_once(storage, monkeypatch):
+    import os
+    storage.append_log("user1", "2024-01-01 09:00", "morning", "hi")
+    storage.sync()
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or real_fsync(fd))
+    for i in range(5):
+        storage.append_memory("user1", "2024-01-01 10:00", f"fact {i}")
+    storage.append_log("user1", "2024-01-01 10:00", "hi", "hello")
+    storage.sync()
+    assert len(synced) == 2
+    storage.sync()
+    assert len(synced) == 2
+
+def test_read_tail_reads_only_the_end(storage):
+    path = storage.data_dir / "big.md"
+    path.write_text("é" * 1000 + "end")
+    assert storage.read_tail(path, 5) == "ééend"
+    assert storage.read_tail(path, 10000) == "é" * 1000 + "end"
+    assert storage.read_tail(storage.data_dir / "missing.md", 5) == ""
+
+def test_tail_log_spans_segments(storage):
+    storage.segment_bytes = 150
+    for i in range(6):
+        storage.append_log("user1", f"2024-01-0{i + 1} 10:00", f"message {i}", "ok")
+    assert storage.read_state("user1", "log")["segments"]
+    tail = storage.tail_log("user1", 200)
+    assert len(tail) == 200
+    assert storage.read_log("user1").endswith(tail)
+
 def test_sanitize_user_id_path_traversal():
     assert sanitize_user_id("../../../etc") == "etc"
     assert sanitize_user_id("user/../admin") == "useradmin"
@@ -57,7 +160,6 @@ def test_sanitize_user_id_empty_raises():
         sanitize_user_id("///")
 
 def test_escape_markdown_v2_special_chars():
-    # Using telegram's escape_markdown with version=2
     assert escape_markdown("*bold*", version=2) == "\\*bold\\*"
     assert escape_markdown("`code`", version=2) == "\\`code\\`"
     assert escape_markdown("[link](url)", version=2) == "\\[link\\]\\(url\\)"
@@ -65,3 +167,21 @@ def test_escape_markdown_v2_special_chars():
 def test_escape_markdown_v2_preserves_alphanumeric():
     content = "User likes pizza and coffee 123"
     assert escape_markdown(content, version=2) == content
+
+def test_escape_markdown_matches_telegram():
+    from telegram.helpers import escape_markdown as telegram_escape
+    text = "a_b*c[d](e)~f`g>h#i+j-k=l|m{n}o.p!q\\r"
+    for version, entity_type in ((1, None), (2, None), (2, "code"), (2, "text_link")):
+        assert escape_markdown(text, version, entity_type) == telegram_escape(text, version, entity_type)
+
+def test_user_cache_is_per_storage_and_bounded(storage):
+    cache = UserCache(max_users=2)
+    other = FileStorage(data_dir=storage.data_dir / "other")
+    cache.put(storage, "user1", "a")
+    cache.put(other, "user1", "b")
+    assert (cache.get(storage, "user1"), cache.get(other, "user1")) == ("a", "b")
+    cache.put(storage, "user2", "c")
+    cache.put(storage, "user1", "a")
+    cache.put(storage, "user3", "d")
+    assert cache.get(storage, "user2") is None
+    assert cache.get(storage, "user1") == "a"
@@ -0,0 +1,239 @@
+import os
+import json
+import tempfile
+import shutil
+from pathlib import Path
+import pytest
+from src.common import FileStorage
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+@pytest.fixture
+def storage(monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+    temp_dir = Path(tempfile.mkdtemp())
+    s = FileStorage(data_dir=temp_dir)
+    monkeypatch.setattr(memory, "default_storage", s)
+    monkeypatch.setattr(consolidate, "storage", s)
+    yield s
+    shutil.rmtree(temp_dir)
+
+def plan(filename, title, *quotes):
+    return json.dumps({"files": [{"filename": filename, "title": title, "quotes": list(quotes)}]})
+
+def test_split_log_keeps_whole_entries():
+    from src import consolidate
+    from src.common import format_log_turn
+    log = "".join(format_log_turn("2024-02-01 10:00", f"message {i}", "ok") for i in range(10))
+    chunks = consolidate.split_log(log, 0, 120)
+    assert len(chunks) > 1
+    assert "".join(chunk for chunk, _ in chunks) == log
+    assert all(chunk.lstrip("\n").startswith("## ") for chunk, _ in chunks)
+    assert chunks[-1][1] == len(log)
+
+def test_merge_wiki_file_appends_new_quotes():
+    from src import consolidate
+    existing = consolidate.generate_wiki_file("Food", ["I like pizza"])
+    merged = consolidate.merge_wiki_file(existing, "Ignored", ["I like pizza", "I hate olives"])
+    assert merged == "# Food\n\n- I like pizza\n- I hate olives\n"
+
+@pytest.mark.asyncio
+async def test_consolidate_only_sends_new_entries(storage, monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+    prompts = []
+    answers = [plan("food.md", "Food", "I like pizza"), plan("food.md", "Food", "I hate olives")]
+
+    async def fake_llm(prompt, schema=None):
+        prompts.append(prompt)
+        return answers[len(prompts) - 1]
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+
+    memory.append_log("user1", "I like pizza", "Nice!", storage)
+    assert await consolidate.consolidate_user("user1") == ["food.md"]
+    assert await consolidate.consolidate_user("user1") is None
+
+    memory.append_log("user1", "I hate olives", "Noted.", storage)
+    assert await consolidate.consolidate_user("user1") == ["food.md"]
+
+    assert len(prompts) == 2
+    assert "I like pizza" not in prompts[1].split("## Existing Wiki Pages")[0]
+    assert "food.md: Food (1 notes)" in prompts[1]
+    assert storage.read_wiki_page("user1", "food.md") == "# Food\n\n- I like pizza\n- I hate olives\n"
+
+@pytest.mark.asyncio
+async def test_consolidate_retries_chunk_after_bad_answer(storage, monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+    answers = ["not json", "still not json", plan("food.md", "Food", "I like pizza")]
+
+    async def fake_llm(prompt, schema=None):
+        return answers.pop(0)
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+
+    memory.append_log("user1", "I like pizza", "Nice!", storage)
+    with pytest.raises(consolidate.ConsolidationError):
+        await consolidate.consolidate_user("user1")
+    assert await consolidate.consolidate_user("user1") == ["food.md"]
+
+@pytest.mark.asyncio
+async def test_cut_off_plan_reported_as_failure(storage, monkeypatch):
+    from types import SimpleNamespace
+    from src import agent, consolidate
+    from src.skills import memory
+    requests = []
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        message = SimpleNamespace(content='{"files": [{"filename": "food.md", "quotes": ["I li')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="length")])
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(agent, "client", fake)
+    memory.append_log("user1", "I like pizza", "Nice!", storage)
+    storage.write_wiki_page("user1", "old.md", "# Old\n\n- hello\n")
+
+    reply = await consolidate.consolidate_and_tree("user1")
+    assert "couldn't organize" in reply
+    assert requests[0]["max_tokens"] == consolidate.DEFAULT_MAX_TOKENS
+    assert consolidate.needs_consolidation("user1")
+
+@pytest.mark.asyncio
+async def test_wiki_plan_repairs_invalid_answer(monkeypatch):
+    from src import consolidate
+    prompts = []
+    answers = ['{"files": [{"filename": "food.md"}]}', plan("food.md", "Food", "I like pizza")]
+
+    async def fake_llm(prompt, schema=None):
+        prompts.append(prompt)
+        return answers.pop(0)
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+
+    result = await consolidate.get_wiki_plan("I like pizza", "")
+    assert result["files"][0]["quotes"] == ["I like pizza"]
+    assert "$.files[0].title: missing" in prompts[1]
+
+def test_wiki_tree_counts_quotes(storage, monkeypatch):
+    from src import consolidate
+    assert consolidate.get_wiki_tree("user1") == "📁 wiki/\n└── (empty)"
+    storage.write_wiki_page("user1", "food.md", "# Food\n\n- I like pizza\n- pasta - with pesto\n")
+    storage.write_wiki_page("user1", "work.md", "# Work\n\n- busy week\n")
+    assert consolidate.get_wiki_tree("user1") == "📁 wiki/\n├── food.md (2 notes)\n└── work.md (1 notes)"
+
+@pytest.mark.asyncio
+async def test_consolidate_reads_only_unconsolidated_segments(storage, monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+    storage.segment_bytes = 150
+    prompts = []
+
+    async def fake_llm(prompt, schema=None):
+        prompts.append(prompt)
+        return plan("food.md", "Food", "I like pizza")
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+
+    memory.append_log("user1", "I like pizza " + "x" * 100, "Nice!", storage)
+    assert await consolidate.consolidate_user("user1") == ["food.md"]
+    for i in range(3):
+        memory.append_log("user1", f"new message {i}", "ok", storage)
+    assert len(storage.read_state("user1", "log")["segments"]) >= 1
+
+    assert await consolidate.consolidate_user("user1") == ["food.md"]
+    assert "I like pizza" not in prompts[1].split("## Existing Wiki Pages")[0]
+    assert all(f"new message {i}" in prompts[1] for i in range(3))
+    assert storage.read_state("user1", "consolidate")["log_offset"] == storage.log_length("user1")
+
+@pytest.mark.asyncio
+async def test_consolidate_all_skips_unchanged_and_resumes(storage, monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+    calls = []
+    failing = {"user3"}
+
+    async def fake_llm(prompt, schema=None):
+        calls.append(prompt)
+        if any(f"{user_id} says" in prompt for user_id in failing):
+            raise RuntimeError("upstream error")
+        return plan("notes.md", "Notes", prompt.split("**User:** ")[1].split("\n")[0])
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+    for user_id in ("user1", "user2", "user3"):
+        memory.append_log(user_id, f"{user_id} says hi", "Hello!", storage)
+    await consolidate.consolidate_user("user1")
+    calls.clear()
+
+    progress = storage.data_dir / "progress.json"
+    summary = await consolidate.consolidate_all(concurrency=2, progress=progress)
+    assert (summary["unchanged"], summary["consolidated"], summary["failed"]) == (1, 1, 1)
+    assert len(calls) == 2
+    assert set(json.loads(progress.read_text())["done"]) == {"user1", "user2"}
+
+    # A user whose log grew is consolidated again even while another keeps failing.
+    memory.append_log("user2", "user2 says bye", "Bye!", storage)
+    calls.clear()
+    summary = await consolidate.consolidate_all(progress=progress)
+    assert (summary["resumed"], summary["consolidated"], summary["failed"]) == (1, 1, 1)
+    assert not consolidate.needs_consolidation("user2")
+
+    # A rerun only retries the user that failed, and clears the progress file once all succeed.
+    failing.clear()
+    calls.clear()
+    summary = await consolidate.consolidate_all(progress=progress)
+    assert (summary["resumed"], summary["consolidated"], summary["failed"]) == (2, 1, 0)
+    assert len(calls) == 1
+    assert not progress.exists()
+
+@pytest.mark.asyncio
+async def test_consolidate_all_counts_missing_plan_as_failure(storage, monkeypatch):
+    from src import consolidate
+    from src.skills import memory
+
+    async def fake_llm(prompt, schema=None):
+        return "not json"
+
+    monkeypatch.setattr(consolidate, "consolidation_llm_call", fake_llm)
+    memory.append_log("user1", "I like pizza", "Nice!", storage)
+    summary = await consolidate.consolidate_all(progress=None)
+    assert (summary["consolidated"], summary["failed"]) == (0, 1)
+
+@pytest.mark.asyncio
+async def test_consolidate_all_counts_tokens(storage, monkeypatch):
+    from types import SimpleNamespace
+    from src import agent, consolidate, metrics
+    from src.skills import memory
+
+    async def create(messages, **kwargs):
+        quote = messages[0]["content"].split("**User:** ")[1].split("\n")[0]
+        message = SimpleNamespace(content=plan("notes.md", "Notes", quote))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")],
+                               usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(agent, "client", metrics.instrument(fake))
+    memory.append_log("user1", "user1 says hi", "Hello!", storage)
+
+    summary = await consolidate.consolidate_all(progress=None)
+    assert summary["consolidated"] == 1
+    assert summary["tokens"] > 0 and summary["tokens"] % 120 == 0
+
+@pytest.mark.asyncio
+async def test_consolidation_calls_share_token_budget(monkeypatch):
+    from src import consolidate
+    from src.skills.reminders import TokenBucket
+    prompts = []
+
+    async def fake_llm(prompt, usage, **kwargs):
+        prompts.append(prompt)
+        return "x" * 400
+
+    monkeypatch.setattr(consolidate, "llm_call", fake_llm)
+    bucket = TokenBucket(1000 / 60, 1000)
+    consolidate._budget.set(bucket)
+    await consolidate.consolidation_llm_call("p" * 400)
+    assert bucket.tokens == pytest.approx(800, abs=1)
+    consolidate._budget.set(None)
@@ -0,0 +1,65 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pytest
+from src.common import FileStorage
+from src.skills import history, memory
+from src.sqlite_storage import SQLiteStorage
+
+@pytest.fixture
+def storage():
+    temp_dir = Path(tempfile.mkdtemp())
+    s = FileStorage(data_dir=temp_dir)
+    yield s
+    shutil.rmtree(temp_dir)
+
+@pytest.fixture(params=["files", "sqlite"])
+def any_storage(request, storage):
+    if request.param == "files":
+        yield storage
+    else:
+        s = SQLiteStorage(storage.data_dir / "test.db")
+        yield s
+        s.close()
+
+def test_seeded_from_log_tail(any_storage):
+    for i in range(3):
+        any_storage.append_log("user1", f"2024-01-0{i + 1} 10:00", f"message {i}", f"reply {i}")
+    assert history.window("user1", 1000, any_storage) == [(f"message {i}", f"reply {i}") for i in range(3)]
+
+def test_seed_skips_cut_off_entry(any_storage, monkeypatch):
+    monkeypatch.setattr(history, "SEED_CHARS", 120)
+    for i in range(5):
+        any_storage.append_log("user1", f"2024-01-0{i + 1} 10:00", f"message {i}", f"reply {i}")
+    monkeypatch.setattr(any_storage, "read_log", lambda user_id: pytest.fail("seeding read the whole log"))
+    turns = history.window("user1", 1000, any_storage)
+    assert turns and turns[-1] == ("message 4", "reply 4")
+    assert ("message 0", "reply 0") not in turns
+    assert all(message.startswith("message ") for message, _ in turns)
+
+def test_append_log_updates_seeded_buffer(storage):
+    assert history.window("user1", 1000, storage) == []
+    memory.append_log("user1", "hello", "hi", storage)
+    assert history.window("user1", 1000, storage) == [("hello", "hi")]
+    # Another storage keeps its own buffers.
+    other = FileStorage(data_dir=storage.data_dir / "other")
+    assert history.window("user1", 1000, other) == []
+
+def test_old_turns_dropped_in_bulk():
+    h = history.History()
+    for i in range(history.MAX_TURNS + 1):
+        h.add(f"message {i}", "ok")
+    assert len(h.turns) == history.MAX_TURNS // 2
+    assert h.turns[-1][0] == f"message {history.MAX_TURNS}"
+
+def test_window_start_moves_in_steps():
+    h = history.History([(f"m{i}", "ok") for i in range(10)])
+    per_turn = h.turns[0][2]
+    first = h.window(10 * per_turn)
+    assert len(first) == 10
+    h.add("m10", "ok")
+    second = h.window(10 * per_turn)
+    assert len(second) <= 6
+    # The start holds while the following turns still fit.
+    h.add("m11", "ok")
+    assert h.window(10 * per_turn)[0] == second[0]
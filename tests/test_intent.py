@@ -0,0 +1,65 @@
+from unittest.mock import AsyncMock
+import pytest
+from src.skills import intent
+
+def test_classify_obvious_commands():
+    assert intent.classifier.classify("show my reminders") == ("show_reminders", 0.95)
+    assert intent.classifier.classify("Organize my notes!")[0] == "organize"
+    assert intent.classifier.classify("show me my wiki")[0] == "show_notes"
+    assert intent.classifier.classify("search my notes for knee")[0] == "search"
+    assert intent.classifier.classify("When did I mention the dentist?")[0] == "search"
+
+def test_classify_reminder_request_is_chat():
+    name, confidence = intent.classifier.classify("remind me to check my notes at 5pm")
+    assert name == "chat"
+    assert confidence >= intent.CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("message", [
+    "clean up the kitchen tomorrow",
+    "sort of tired today",
+    "Organize a party for Friday",
+    "what are your thoughts on pizza",
+    "check my memory of yesterday",
+])
+def test_command_verbs_in_chat_are_not_commands(message):
+    name, confidence = intent.classifier.classify(message)
+    assert name == "chat" or confidence < intent.CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("message", [
+    "do you remember what I said about my knee?",
+    "what do you remember about me?",
+    "I told you about the dentist last week, right?",
+])
+def test_recall_questions_go_to_llm(message):
+    assert intent.classifier.classify(message)[1] < intent.CONFIDENCE_THRESHOLD
+
+def test_classify_ambiguous_is_low_confidence():
+    _, confidence = intent.classifier.classify("I wrote some notes about my trip, what do you think?")
+    assert confidence < intent.CONFIDENCE_THRESHOLD
+
+def test_naive_bayes_predicts_trained_label():
+    classifier = intent.Classifier()
+    classifier.train([
+        ("what's on my todo list", "show_reminders"),
+        ("anything on my todo list", "show_reminders"),
+        ("I love pizza", "chat"),
+        ("the weather is nice", "chat"),
+    ])
+    assert classifier.model.predict("what is on my todo list")[0] == "show_reminders"
+
+@pytest.mark.asyncio
+async def test_detect_skips_llm_when_confident():
+    mock_llm = AsyncMock(return_value="chat")
+    assert await intent.detect(mock_llm, "show my reminders") == "show_reminders"
+    mock_llm.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_detect_falls_back_to_llm():
+    mock_llm = AsyncMock(return_value="show_notes")
+    assert await intent.detect(mock_llm, "I wrote some notes about my trip, what do you think?") == "show_notes"
+    mock_llm.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_detect_llm_invalid_intent_is_chat():
+    mock_llm = AsyncMock(return_value="dance")
+    assert await intent.detect_llm(mock_llm, "anything") == "chat"
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from src import llm_cache
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+@pytest.fixture
+def temp_dir():
+    d = Path(tempfile.mkdtemp())
+    yield d
+    shutil.rmtree(d)
+
+def test_key_ignores_whitespace():
+    assert llm_cache.ResponseCache.key("m", "hello   world\n") == llm_cache.ResponseCache.key("m", "hello world")
+    assert llm_cache.ResponseCache.key("m", "hi") != llm_cache.ResponseCache.key("other", "hi")
+
+def test_get_put_and_hit_rate():
+    cache = llm_cache.ResponseCache()
+    key = cache.key("m", "thanks")
+    assert cache.get(key, "intent") is None
+    cache.put(key, "chat")
+    assert cache.get(key, "intent") == "chat"
+    assert cache.stats()["skills"]["intent"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+def test_ttl_expiry():
+    cache = llm_cache.ResponseCache(ttl=-1)
+    cache.put("k", "v")
+    assert cache.get("k") is None
+
+def test_lru_eviction():
+    cache = llm_cache.ResponseCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    assert cache.get("a") is None
+    assert cache.get("c") == "c"
+
+def test_disk_store_survives_restart(temp_dir):
+    cache = llm_cache.ResponseCache(path=temp_dir / "cache.db")
+    cache.put("k", "v")
+    assert llm_cache.ResponseCache(path=temp_dir / "cache.db").get("k") == "v"
+
+def test_disk_store_purged_and_capped(temp_dir, monkeypatch):
+    monkeypatch.setattr(llm_cache, "PURGE_EVERY", 2)
+    expired = llm_cache.ResponseCache(ttl=-1, path=temp_dir / "cache.db")
+    expired.put("old", "v")
+    cache = llm_cache.ResponseCache(path=temp_dir / "cache.db", max_disk_entries=3)
+    assert cache.db.execute("SELECT count(*) FROM responses").fetchone()[0] == 0
+    for key in "abcdef":
+        cache.put(key, key)
+    keys = [row[0] for row in cache.db.execute("SELECT key FROM responses ORDER BY expires")]
+    assert keys == ["d", "e", "f"]
+
+def test_chat_and_unlisted_skills_not_cached():
+    cache = llm_cache.ResponseCache()
+    assert cache.allows("extraction", "intent")
+    assert not cache.allows("chat", "intent")
+    assert not cache.allows("extraction", "reminders")
+
+@pytest.mark.asyncio
+async def test_llm_call_uses_cache(monkeypatch):
+    from src import agent
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="chat"))], usage=None)
+
+    monkeypatch.setattr(agent, "response_cache", llm_cache.ResponseCache())
+    monkeypatch.setattr(agent, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    assert await agent.llm_call("classify: thanks", skill="intent") == "chat"
+    assert await agent.llm_call("classify:  thanks", skill="intent") == "chat"
+    assert await agent.llm_call("Current time: now", skill="reminders") == "chat"
+    assert len(calls) == 2
+
+def test_from_config_path_is_not_relative_to_cwd(monkeypatch, tmp_path):
+    from src.common import DEFAULT_DATA_DIR
+    monkeypatch.chdir(tmp_path)
+    assert llm_cache.from_config({"enabled": True}).path == DEFAULT_DATA_DIR / "llm-cache.db"
+    assert llm_cache.from_config({"enabled": True, "path": "data/other.db"}).path == DEFAULT_DATA_DIR / "other.db"
+    assert llm_cache.from_config({"enabled": True, "path": None}).path is None
@@ -3,12 +3,12 @@ import shutil
 from pathlib import Path
 from unittest.mock import AsyncMock
 import pytest
-from src.common import Storage
+from src.common import FileStorage
 
 @pytest.fixture
 def storage():
     temp_dir = Path(tempfile.mkdtemp())
-    s = Storage(data_dir=temp_dir)
+    s = FileStorage(data_dir=temp_dir)
     yield s
     shutil.rmtree(temp_dir)
 
@@ -68,3 +68,87 @@ def test_wiki_dir_creates_directory(storage):
     wiki_dir = memory.get_wiki_dir("user1", storage)
     assert wiki_dir.exists()
     assert wiki_dir.name == "wiki"
+
+def test_log_rotates_into_segments(storage):
+    from src.common import format_log_turn
+    storage.segment_bytes = 300
+    turns = [("2024-01-30 10:00", "january"), ("2024-02-01 10:00", "february")]
+    turns += [(f"2024-02-02 10:{i:02d}", f"message {i} " + "x" * 80) for i in range(6)]
+    for timestamp, message in turns:
+        storage.append_log("user1", timestamp, message, "ok")
+
+    segments = storage.read_state("user1", "log")["segments"]
+    assert segments[0]["name"] == "2024-01-001.md"
+    assert (segments[0]["first"], segments[0]["last"]) == ("2024-01-30 10:00", "2024-01-30 10:00")
+    assert [s["name"] for s in segments[1:]] == [f"2024-02-{n:03d}.md" for n in range(1, len(segments))]
+
+    full = "".join(format_log_turn(timestamp, message, "ok") for timestamp, message in turns)
+    assert storage.read_log("user1") == full
+    assert storage.log_length("user1") == len(full)
+    for s in segments:
+        assert full[s["start"]:s["start"] + s["chars"]].startswith("\n## ")
+
+def test_read_log_from_skips_old_segments(storage, monkeypatch):
+    storage.segment_bytes = 200
+    for i in range(8):
+        storage.append_log("user1", f"2024-02-01 10:{i:02d}", f"message {i} " + "x" * 80, "ok")
+    full = storage.read_log("user1")
+    start = storage.read_state("user1", "log")["segments"][-1]["start"] + 5
+
+    read = []
+    read_text = storage.read_text
+    monkeypatch.setattr(storage, "read_text", lambda path: read.append(path.name) or read_text(path))
+    assert storage.read_log_from("user1", start) == full[start:]
+    assert [name for name in read if name.endswith(".md")] == ["log.md", read[-1]]
+    assert storage.tail_log("user1", 50) == full[-50:]
+    assert storage.tail_log("user1", 10 ** 6) == full
+
+def test_log_index_rebuilt_from_segment_files(storage):
+    storage.segment_bytes = 200
+    for i in range(6):
+        storage.append_log("user1", f"2024-02-01 10:{i:02d}", f"message {i} " + "x" * 80, "ok")
+    full = storage.read_log("user1")
+    storage.write_state("user1", "log", {"month": "2024-02"})
+    assert storage.read_log("user1") == full
+    assert len(storage.read_state("user1", "log")["segments"]) > 1
+
+@pytest.mark.asyncio
+async def test_compact_rolls_up_old_entries(storage):
+    from src.common import parse_entries
+    from src.skills import memory
+    for i in range(6):
+        storage.append_memory("user1", f"2024-01-0{i + 1} 10:00", f"- fact {i}")
+
+    mock_llm = AsyncMock(return_value="- facts 0 to 3")
+    assert await memory.compact(mock_llm, "user1", keep_recent=2, min_entries=5, storage=storage) == 0
+    assert await memory.compact(mock_llm, "user1", keep_recent=2, min_entries=3, storage=storage) == 4
+
+    assert "- fact 3" in mock_llm.call_args.args[0]
+    assert "- fact 4" not in mock_llm.call_args.args[0]
+    entries = parse_entries(memory.read("user1", storage))
+    assert entries[0] == ("2024-01-04 10:00", "_Summary of notes up to 2024-01-04 10:00_\n- facts 0 to 3")
+    assert [body for _, body in entries[1:]] == ["- fact 4", "- fact 5"]
+    archive = parse_entries(storage.read_text(storage.get_user_dir("user1") / "memory-archive.md"))
+    assert [body for _, body in archive] == [f"- fact {i}" for i in range(4)]
+
+@pytest.mark.asyncio
+async def test_compact_folds_in_bounded_batches(storage):
+    from src.common import parse_entries
+    from src.skills import memory
+    for i in range(6):
+        storage.append_memory("user1", f"2024-01-0{i + 1} 10:00", f"- fact {i} " + "x" * 40)
+    answers = ["- facts 0 to 1", "- facts 0 to 2", None]
+    prompts = []
+
+    async def llm(prompt):
+        prompts.append(prompt)
+        return answers.pop(0)
+
+    assert await memory.compact(llm, "user1", keep_recent=0, min_entries=1, storage=storage, batch_chars=150) == 3
+    assert len(prompts) == 3
+    assert "- fact 1 " in prompts[0] and "- fact 2 " not in prompts[0]
+    assert "- facts 0 to 1" in prompts[1] and "- fact 2 " in prompts[1] and "- fact 0 " not in prompts[1]
+    # The cut-off third answer archived nothing: facts 3 to 5 are still there.
+    entries = parse_entries(memory.read("user1", storage))
+    assert entries[0][1] == "_Summary of notes up to 2024-01-03 10:00_\n- facts 0 to 2"
+    assert [body.split(" x")[0] for _, body in entries[1:]] == ["- fact 3", "- fact 4", "- fact 5"]
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from src import metrics
+
+def fake_client(fail=False):
+    async def create(stream=False, **kwargs):
+        if fail:
+            raise TimeoutError("slow upstream")
+        usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+        if stream:
+            async def chunks():
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"))], usage=None)
+                yield SimpleNamespace(choices=[], usage=usage)
+            return chunks()
+        return SimpleNamespace(choices=[], usage=usage)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+@pytest.mark.asyncio
+async def test_records_usage_and_labels():
+    registry = metrics.Registry()
+    client = metrics.instrument(fake_client(), registry)
+    with metrics.labels(usage="extraction", skill="memory", user="user1"):
+        await client.chat.completions.create(model="m", messages=[])
+
+    assert registry.calls[("extraction", "memory")] == 1
+    assert registry.prompt_tokens[("extraction", "memory")] == 12
+    assert registry.user_tokens["user1"] == 15
+
+@pytest.mark.asyncio
+async def test_none_label_keeps_enclosing_user():
+    registry = metrics.Registry()
+    client = metrics.instrument(fake_client(), registry)
+    with metrics.labels(user="user1"):
+        with metrics.labels(usage="extraction", skill="consolidation", user=None):
+            await client.chat.completions.create(model="m", messages=[])
+
+    assert registry.user_tokens["user1"] == 15
+
+@pytest.mark.asyncio
+async def test_records_streamed_usage_and_first_token():
+    registry = metrics.Registry()
+    client = metrics.instrument(fake_client(), registry)
+    with metrics.labels(usage="chat", skill="chat"):
+        stream = await client.chat.completions.create(model="m", messages=[], stream=True)
+    _ = [chunk async for chunk in stream]
+
+    assert registry.completion_tokens[("chat", "chat")] == 3
+    assert registry.first_token[("chat", "chat")].count == 1
+
+@pytest.mark.asyncio
+async def test_records_errors():
+    registry = metrics.Registry()
+    client = metrics.instrument(fake_client(fail=True), registry)
+    with pytest.raises(TimeoutError):
+        await client.chat.completions.create(model="m", messages=[])
+    assert registry.errors[("unknown", "unknown", "TimeoutError")] == 1
+    assert registry.snapshot()["calls"][0]["errors"] == 1
+
+def test_prometheus_text():
+    registry = metrics.Registry()
+    registry.record("chat", "chat", "user1", 0.3, 100, 20)
+    text = registry.render_prometheus()
+    assert 'llm_request_seconds_bucket{usage="chat",skill="chat",le="0.5"} 1' in text
+    assert 'llm_prompt_tokens_total{usage="chat",skill="chat"} 100' in text
+
+@pytest.mark.asyncio
+async def test_serve_metrics_endpoint():
+    registry = metrics.Registry()
+    registry.record("chat", "chat", None, 0.3)
+    server = await metrics.serve("127.0.0.1", 0, registry)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = (await reader.read()).decode()
+    writer.close()
+    server.close()
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert "llm_requests_total" in response
@@ -0,0 +1,55 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pytest
+from src.common import FileStorage
+
+@pytest.fixture
+def storage():
+    temp_dir = Path(tempfile.mkdtemp())
+    s = FileStorage(data_dir=temp_dir)
+    yield s
+    shutil.rmtree(temp_dir)
+
+def test_select_ranks_relevant_entries(storage):
+    from src.skills import memory, recall
+    memory.append("user1", "- has a sore knee from running", storage)
+    for i in range(20):
+        memory.append("user1", f"- unrelated fact number {i}", storage)
+
+    context = recall.select("user1", "how is my knee doing?", top_k=3, recent=0, storage=storage)
+    assert "sore knee" in context
+    assert "unrelated" not in context
+
+def test_select_respects_token_budget(storage):
+    from src.skills import memory, recall
+    for i in range(200):
+        memory.append("user1", f"- the user likes coffee variety {i}", storage)
+
+    context = recall.select("user1", "coffee", top_k=200, max_tokens=100, storage=storage)
+    assert 0 < len(context) <= 400
+
+def test_select_includes_recent_entries(storage):
+    from src.skills import memory, recall
+    memory.append("user1", "- old fact", storage)
+    memory.append("user1", "- newest fact", storage)
+
+    context = recall.select("user1", "nothing matches", recent=1, storage=storage)
+    assert "newest fact" in context
+    assert "old fact" not in context
+
+def test_index_updated_on_append(storage):
+    from src.skills import memory, recall
+    memory.append("user1", "- likes tea", storage)
+    index = recall.get_index("user1", storage)
+    memory.append("user1", "- plays chess", storage)
+    assert recall.get_index("user1", storage) is index
+    assert len(index.entries) == 2
+
+def test_index_rebuilt_after_external_edit(storage):
+    from src.skills import memory, recall
+    memory.append("user1", "- likes tea", storage)
+    recall.get_index("user1", storage)
+    with open(memory.get_memory_file("user1", storage), "a") as f:
+        f.write("\n## 2024-02-01 10:00\n- edited in obsidian\n")
+    assert "edited in obsidian" in recall.select("user1", "obsidian", storage=storage)
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from src.recurrence import Cron, Interval, parse_recurrence, to_local, to_wall, zone
+
+MONDAY_9 = datetime(2024, 2, 5, 9, 0)
+
+def test_daily_uses_anchor_time():
+    rule = parse_recurrence("daily", MONDAY_9)
+    assert rule.after(MONDAY_9) == datetime(2024, 2, 6, 9, 0)
+    assert rule.after(datetime(2024, 2, 6, 8, 59)) == datetime(2024, 2, 6, 9, 0)
+
+def test_at_overrides_anchor_time():
+    assert parse_recurrence("every day at 7:30pm", MONDAY_9).after(MONDAY_9) == datetime(2024, 2, 5, 19, 30)
+    assert parse_recurrence("every day at 12am").after(MONDAY_9) == datetime(2024, 2, 6, 0, 0)
+    assert parse_recurrence("daily at 25") is None
+
+def test_weekly_and_named_days():
+    assert parse_recurrence("weekly", MONDAY_9).after(MONDAY_9) == datetime(2024, 2, 12, 9, 0)
+    rule = parse_recurrence("every Monday and Thu at 9")
+    assert rule.weekdays == {0, 3}
+    assert rule.after(MONDAY_9) == datetime(2024, 2, 8, 9, 0)
+    assert parse_recurrence("weekly on tuesdays, fridays", MONDAY_9).weekdays == {1, 4}
+    assert parse_recurrence("every blue moon") is None
+
+def test_weekdays_skip_weekend():
+    rule = parse_recurrence("weekdays", MONDAY_9)
+    assert rule.after(datetime(2024, 2, 9, 10, 0)) == datetime(2024, 2, 12, 9, 0)
+
+def test_monthly_keeps_day_of_month():
+    rule = parse_recurrence("monthly", datetime(2024, 1, 31, 8, 0))
+    assert rule.after(datetime(2024, 1, 31, 8, 0)) == datetime(2024, 3, 31, 8, 0)
+
+def test_intervals_count_from_anchor():
+    rule = parse_recurrence("every 3 hours", MONDAY_9)
+    assert isinstance(rule, Interval)
+    assert rule.after(datetime(2024, 2, 5, 13, 0), MONDAY_9) == datetime(2024, 2, 5, 15, 0)
+    assert rule.after(datetime(2024, 2, 5, 8, 0), MONDAY_9) == MONDAY_9
+    assert parse_recurrence("hourly").step == timedelta(hours=1)
+
+def test_cron():
+    rule = parse_recurrence("cron */15 9-10 * * 1-5")
+    assert isinstance(rule, Cron)
+    assert rule.after(datetime(2024, 2, 9, 10, 50)) == datetime(2024, 2, 12, 9, 0)
+    assert rule.after(datetime(2024, 2, 5, 9, 20)) == datetime(2024, 2, 5, 9, 30)
+    assert parse_recurrence("cron 0 9 * * 0").after(MONDAY_9) == datetime(2024, 2, 11, 9, 0)
+    assert parse_recurrence("cron 0 9 31 2 *").after(MONDAY_9) is None
+    assert parse_recurrence("cron 61 * * * *") is None
+    assert parse_recurrence("cron 0 9 * *") is None
+
+def test_wall_clock_conversion_round_trips():
+    berlin = zone("Europe/Berlin")
+    wall = datetime(2024, 7, 1, 9, 0)
+    local = to_local(wall, berlin)
+    assert to_wall(local, berlin) == wall
+    assert local.replace(tzinfo=None).astimezone(ZoneInfo("UTC")).hour == 7
+    assert zone("Not/AZone") is None
+    assert to_local(wall, None) == wall
@@ -1,15 +1,17 @@
+import json
 import tempfile
 import shutil
 from pathlib import Path
 from datetime import datetime, timedelta
 from unittest.mock import AsyncMock
+from zoneinfo import ZoneInfo
 import pytest
-from src.common import Storage
+from src.common import FileStorage
 
 @pytest.fixture
 def storage():
     temp_dir = Path(tempfile.mkdtemp())
-    s = Storage(data_dir=temp_dir)
+    s = FileStorage(data_dir=temp_dir)
     yield s
     shutil.rmtree(temp_dir)
 
@@ -78,23 +80,244 @@ def test_user_isolation(storage):
     assert "user2 task" in reminders.read("user2", storage)
     assert "user2 task" not in reminders.read("user1", storage)
 
+def reminder_answer(*items):
+    return json.dumps({"reminders": [
+        {"text": text, "due": due, "recurrence": None, "confidence": confidence} for text, due, confidence in items
+    ]})
+
 @pytest.mark.asyncio
 async def test_extract_and_store(storage):
     from src.skills import reminders
 
-    mock_llm = AsyncMock(return_value="REMINDER: call dentist\nDUE: 2024-02-01T14:00")
+    mock_llm = AsyncMock(return_value=reminder_answer(("call dentist", "2024-02-01T14:00", 0.9)))
     result = await reminders.extract_and_store(mock_llm, "user1", "remind me to call dentist tomorrow at 2pm", storage)
 
-    assert result["text"] == "call dentist"
-    assert result["due"] == "2024-02-01T14:00"
+    assert result == [{"text": "call dentist", "due": "2024-02-01T14:00", "recurrence": None}]
     assert "call dentist" in reminders.read("user1", storage)
+    assert mock_llm.call_args.kwargs["schema"] is reminders.REMINDER_SCHEMA
+
+@pytest.mark.asyncio
+async def test_extract_multiple_skips_untimed_and_unsure(storage):
+    from src.skills import reminders
+
+    mock_llm = AsyncMock(return_value=reminder_answer(
+        ("call dentist", "2024-02-01T14:00", 0.9),
+        ("buy milk", "2024-02-01T18:00", 0.8),
+        ("renew passport", None, 0.9),
+        ("maybe go running", "2024-02-02T07:00", 0.2),
+    ))
+    result = await reminders.extract_and_store(mock_llm, "user1", "remind me to call the dentist at 2 and buy milk at 6", storage)
+
+    assert [r["text"] for r in result] == ["call dentist", "buy milk"]
+    assert [r["text"] for r in reminders.parse("user1", storage)] == ["call dentist", "buy milk"]
+
+@pytest.mark.asyncio
+async def test_extract_repairs_invalid_answer(storage):
+    from src.skills import reminders
+
+    mock_llm = AsyncMock(side_effect=["REMINDER: call dentist", reminder_answer(("call dentist", "2024-02-01T14:00", 0.9))])
+    result = await reminders.extract_and_store(mock_llm, "user1", "remind me to call dentist at 2pm", storage)
+
+    assert len(result) == 1
+    assert mock_llm.call_count == 2
+    assert "not valid" in mock_llm.call_args.args[0]
 
 @pytest.mark.asyncio
 async def test_extract_none(storage):
     from src.skills import reminders
 
-    mock_llm = AsyncMock(return_value="NONE")
+    mock_llm = AsyncMock(return_value='{"reminders": []}')
     result = await reminders.extract_and_store(mock_llm, "user1", "hello there", storage)
 
-    assert result is None
+    assert result == []
+    assert mock_llm.call_count == 1
     assert reminders.read("user1", storage) == ""
+
+def test_scheduler_load_and_pop_due(storage):
+    from src.skills import reminders
+    past = (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M")
+    future = (datetime.now() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+    reminders.add("user1", "past task", past, storage)
+    reminders.add("user2", "future task", future, storage)
+    reminders.add("user3", "no due", None, storage)
+
+    scheduler = reminders.get_scheduler(storage)
+    scheduler.load(storage)
+    assert scheduler.pop_due(datetime.now()) == ["user1"]
+    assert scheduler.pop_due(datetime.now()) == []
+    assert scheduler.next_due() == datetime.fromisoformat(future)
+
+def test_scheduler_mark_complete_discards(storage):
+    from src.skills import reminders
+    past = (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M")
+    reminders.add("user1", "past task", past, storage)
+    reminders.mark_complete("user1", "past task", storage)
+
+    scheduler = reminders.get_scheduler(storage)
+    assert scheduler.next_due() is None
+    assert scheduler.pop_due(datetime.now()) == []
+
+@pytest.mark.asyncio
+async def test_loop_fires_added_reminder(storage):
+    import asyncio
+    from src.skills import reminders
+    fired = []
+
+    async def callback(user_id, r):
+        fired.append((user_id, r["text"]))
+
+    task = asyncio.create_task(reminders.loop(callback, interval=60, storage=storage))
+    await asyncio.sleep(0.01)
+    past = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M")
+    reminders.add("user1", "wake up", past, storage)
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    assert fired == [("user1", "wake up")]
+    assert reminders.parse("user1", storage)[0]["completed"] == True
+
+@pytest.mark.asyncio
+async def test_dispatcher_retries_then_marks_complete(storage):
+    import asyncio
+    from src.skills import reminders
+    reminders.add("user1", "flaky", "2024-02-01T10:00", storage)
+    attempts = []
+
+    async def callback(user_id, r):
+        attempts.append(r["text"])
+        if len(attempts) < 3:
+            raise RuntimeError("network down")
+
+    dispatcher = reminders.Dispatcher(callback, storage, per_chat_rate=1000, retries=3, backoff=0.001)
+    workers = asyncio.create_task(dispatcher.run())
+    dispatcher.submit("user1", reminders.get_due("user1", storage)[0])
+    await dispatcher.join()
+    workers.cancel()
+
+    assert len(attempts) == 3
+    assert dispatcher.sent == 1
+    assert reminders.parse("user1", storage)[0]["completed"] == True
+
+@pytest.mark.asyncio
+async def test_dispatcher_gives_up_without_completing(storage):
+    import asyncio
+    from src.skills import reminders
+    reminders.add("user1", "never sent", "2024-02-01T10:00", storage)
+
+    async def callback(user_id, r):
+        raise RuntimeError("blocked by user")
+
+    dispatcher = reminders.Dispatcher(callback, storage, per_chat_rate=1000, retries=1, backoff=0.001, retry_later=60)
+    workers = asyncio.create_task(dispatcher.run())
+    assert reminders.get_scheduler(storage).pop_due(datetime.now()) == ["user1"]
+    dispatcher.submit("user1", reminders.get_due("user1", storage)[0])
+    await dispatcher.join()
+    workers.cancel()
+
+    assert dispatcher.failed == 1
+    assert reminders.parse("user1", storage)[0]["completed"] == False
+    assert reminders.get_scheduler(storage).next_due() > datetime.now()
+
+@pytest.mark.asyncio
+async def test_dispatcher_skips_in_flight_duplicates(storage):
+    from src.skills import reminders
+
+    async def callback(user_id, r):
+        pass
+
+    dispatcher = reminders.Dispatcher(callback, storage)
+    reminder = {"text": "once", "completed": False, "due": "2024-02-01T10:00"}
+    assert dispatcher.submit("user1", reminder)
+    assert not dispatcher.submit("user1", reminder)
+
+@pytest.mark.asyncio
+async def test_fired_reminder_keeps_others_with_same_text(storage):
+    import asyncio
+    from src.skills import reminders
+    past = (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M")
+    earlier = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M")
+    later = (datetime.now() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+    for due in (past, earlier, later):
+        reminders.add("user1", "take pills", due, storage)
+    delivered = []
+
+    async def callback(user_id, r):
+        delivered.append(r["due"])
+
+    scheduler = reminders.get_scheduler(storage)
+    dispatcher = reminders.Dispatcher(callback, storage, per_chat_rate=1000)
+    workers = asyncio.create_task(dispatcher.run())
+    for due in scheduler.pop_due_reminders(datetime.now()):
+        assert dispatcher.submit(*due)
+    await dispatcher.join()
+    workers.cancel()
+
+    assert delivered == [past, earlier]
+    assert scheduler.next_due() == datetime.fromisoformat(later)
+    assert [r["completed"] for r in reminders.parse("user1", storage)] == [True, True, False]
+
+def from_utc(wall):
+    return wall.replace(tzinfo=ZoneInfo("UTC")).astimezone().replace(tzinfo=None)
+
+def test_reminder_model_precomputes_fire_time():
+    from src.skills import reminders
+    r = reminders.Reminder("standup", "2024-02-05T09:00", every="weekdays at 9", tz="UTC")
+    assert r.fire_at == from_utc(datetime(2024, 2, 5, 9, 0))
+    assert r.following(from_utc(datetime(2024, 2, 9, 12, 0))).due == "2024-02-12T09:00"
+    assert not hasattr(r, "__dict__")
+    assert reminders.Reminder("once", "2024-02-05T09:00").following(datetime.now()) is None
+
+def test_parse_due_handles_offsets_and_zones():
+    from src.skills import reminders
+    utc = from_utc(datetime(2024, 2, 1, 12, 0))
+    assert reminders.parse_due("2024-02-01T12:00+00:00") == utc
+    assert reminders.parse_due("2024-02-01T12:00", "UTC") == utc
+    assert reminders.parse_due("2024-02-01T12:00") == datetime(2024, 2, 1, 12, 0)
+    assert reminders.parse_due("tomorrow") is None
+
+def test_add_recurring_without_due_starts_at_next_time(storage):
+    from src.skills import reminders
+    r = reminders.add("user1", "stretch", None, storage, every="daily at 23:59")
+    assert r.due is not None
+    assert reminders.parse("user1", storage)[0]["due"] == r.due
+    assert reminders.get_scheduler(storage).next_due() == r.fire_at
+
+@pytest.mark.asyncio
+async def test_dispatcher_reschedules_recurring_reminder(storage):
+    import asyncio
+    from src.skills import reminders
+    reminders.add("user1", "water plants", "2024-02-01T08:00", storage, every="daily")
+    delivered = []
+
+    async def callback(user_id, r):
+        delivered.append(r)
+
+    dispatcher = reminders.Dispatcher(callback, storage, per_chat_rate=1000)
+    workers = asyncio.create_task(dispatcher.run())
+    due = reminders.get_scheduler(storage).pop_due_reminders(datetime.now())
+    assert [(user_id, r.text) for user_id, r in due] == [("user1", "water plants")]
+    dispatcher.submit(*due[0])
+    await dispatcher.join()
+    workers.cancel()
+
+    assert delivered[0]["every"] == "daily"
+    r = reminders.parse("user1", storage)[0]
+    assert r["completed"] == False
+    next_due = reminders.parse_due(r["due"])
+    assert next_due > datetime.now()
+    assert next_due.strftime("%H:%M") == "08:00"
+    assert reminders.get_scheduler(storage).next_due() == next_due
+
+@pytest.mark.asyncio
+async def test_extract_stores_recurring_reminder(storage):
+    from src.skills import reminders
+
+    mock_llm = AsyncMock(return_value=json.dumps({"reminders": [
+        {"text": "team sync", "due": None, "recurrence": "every monday at 10", "confidence": 0.9},
+        {"text": "vague", "due": None, "recurrence": "now and then", "confidence": 0.9},
+    ]}))
+    result = await reminders.extract_and_store(mock_llm, "user1", "remind me about team sync every monday at 10", storage)
+
+    assert [(r["text"], r["recurrence"]) for r in result] == [("team sync", "every monday at 10")]
+    assert reminders.parse_due(result[0]["due"]).weekday() == 0
+    assert "`every:every monday at 10`" in reminders.read("user1", storage)
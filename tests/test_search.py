@@ -0,0 +1,120 @@
+import os
+import tempfile
+import shutil
+import time
+from pathlib import Path
+import pytest
+from src.common import FileStorage
+from src.skills import memory, search
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+@pytest.fixture
+def storage():
+    temp_dir = Path(tempfile.mkdtemp())
+    s = FileStorage(data_dir=temp_dir)
+    yield s
+    shutil.rmtree(temp_dir)
+
+def test_query_text_strips_lead_in():
+    assert search.query_text("What did I say about my knee?") == "my knee"
+    assert search.query_text("search my notes for knee pain") == "knee pain"
+    assert search.query_text("knee") == "knee"
+
+def test_hashed_embedding_matches_related_text():
+    knee = search.hashed_embedding("my knee hurts after running")
+    query = search.hashed_embedding("knee")
+    other = search.hashed_embedding("booked flights to Lisbon")
+    assert sum(a * b for a, b in zip(knee, query)) > sum(a * b for a, b in zip(other, query))
+
+@pytest.mark.asyncio
+async def test_search_covers_memory_log_and_wiki(storage):
+    memory.append("user1", "- twisted left knee while running", storage)
+    memory.append_log("user1", "my knee is still sore today", "Sorry to hear that", storage)
+    memory.append_log("user1", "booked flights to Lisbon", "Nice!", storage)
+    storage.write_wiki_page("user1", "health.md", "# Health\n\n- physio for the knee on tuesdays\n")
+
+    hits = await search.search("user1", "knee", storage=storage)
+    sources = {item["source"] for _, item in hits}
+    assert sources == {"memory", "log", "wiki"}
+    assert all("Lisbon" not in item["text"] for _, item in hits)
+    assert search.format_item(hits[0][1]).startswith("- ")
+
+@pytest.mark.asyncio
+async def test_update_is_incremental_and_persistent(storage, monkeypatch):
+    monkeypatch.setattr(search, "PERSIST_EVERY", 1)
+    memory.append("user1", "- likes tea", storage)
+    index = await search.update("user1", storage)
+    assert len(index.items) == 1
+
+    memory.append("user1", "- allergic to shellfish", storage)
+    storage.write_wiki_page("user1", "food.md", "# Food\n\n- tea\n")
+    index = await search.update("user1", storage)
+    assert [item["text"] for item in index.items] == ["- likes tea", "- allergic to shellfish", "tea"]
+    assert len(storage.read_blob("user1", search.VECTORS)) == 3 * search.HASHED_DIMENSIONS * 4
+
+    # A fresh process loads the vectors instead of re-embedding.
+    search._indexes.clear()
+    reloaded = search._load("user1", storage)
+    assert reloaded.items == index.items
+    assert reloaded.vectors == index.vectors
+
+@pytest.mark.asyncio
+async def test_turns_are_persisted_in_batches(storage, monkeypatch):
+    monkeypatch.setattr(search, "PERSIST_EVERY", 3)
+    await search.update("user1", storage)
+    writes = []
+    write_state = storage.write_state
+    monkeypatch.setattr(storage, "write_state", lambda *args: writes.append(args) or write_state(*args))
+    for i in range(4):
+        memory.append_log("user1", f"turn {i}", "ok", storage)
+        await search.update("user1", storage)
+    assert [name for _, name, _ in writes].count("search") == 1
+    assert storage.read_state("user1", "search")["count"] == 3
+
+    # A fresh process indexes the unsaved turn again from the log, once.
+    search._indexes.clear()
+    index = await search.update("user1", storage)
+    assert [item["text"] for item in index.items] == [f"turn {i}" for i in range(4)]
+
+@pytest.mark.asyncio
+async def test_sqlite_index_saved_on_loop_thread(storage, monkeypatch):
+    import asyncio
+    from src.sqlite_storage import SQLiteStorage
+    s = SQLiteStorage(storage.data_dir / "test.db")
+    monkeypatch.setattr(asyncio, "to_thread", lambda *args: pytest.fail("saved from a worker thread"))
+    memory.append("user1", "- likes tea", s)
+    index = await search.update("user1", s)
+    assert s.read_state("user1", "search")["count"] == len(index.items) == 1
+    s.close()
+
+@pytest.mark.asyncio
+async def test_rewritten_memory_rebuilds_index(storage):
+    for fact in ("- likes tea", "- likes coffee", "- runs on sundays"):
+        memory.append("user1", fact, storage)
+    await search.update("user1", storage)
+    storage.compact_memory("user1", 2, "2024-01-01 10:00", "likes hot drinks")
+    index = await search.update("user1", storage)
+    assert [item["text"] for item in index.items] == ["likes hot drinks", "- runs on sundays"]
+
+def test_brute_force_search_is_fast():
+    index = search.VectorIndex({})
+    texts = [f"note {i} about topic{i % 500} and more words" for i in range(5000)]
+    index.add([{"source": "memory", "when": "", "text": t} for t in texts], [search.hashed_embedding(t) for t in texts])
+    query = search.hashed_embedding("topic42")
+    start = time.perf_counter()
+    hits = index.search(query, 5)
+    assert time.perf_counter() - start < 0.5
+    assert "topic42 " in hits[0][1]["text"]
+
+@pytest.mark.asyncio
+async def test_search_intent(storage, monkeypatch):
+    from src import agent
+    from src.skills import history, intent, recall, reminders
+    for module in (memory, recall, reminders, history, search):
+        monkeypatch.setattr(module, "default_storage", storage)
+    memory.append("user1", "- twisted left knee while running", storage)
+
+    assert intent.classifier.classify("what did I say about my knee?")[0] == "search"
+    reply = await agent.handle_intent("user1", "search", "what did I say about my knee?")
+    assert "twisted left knee" in reply
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+import pytest
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from src.common import FileStorage
+from src.shard import ShardDispatcher, ShardError, run_worker, shard_for, worker_metrics
+
+def test_shard_for_is_stable_and_spread():
+    assert shard_for("12345", 4) == shard_for("12345", 4)
+    assert shard_for("../12345", 4) == shard_for("12345", 4)
+    counts = Counter(shard_for(str(user), 4) for user in range(4000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 800
+
+def test_worker_metrics_ports_and_dumps():
+    settings = worker_metrics({"port": 9100, "dump_path": "data/metrics.json"}, 1)
+    assert settings["port"] == 9102
+    assert settings["dump_path"].endswith("metrics-1.json")
+    assert worker_metrics({"port": None}, 0)["port"] is None
+
+async def fake_chat(user_id, text):
+    if text == "slow":
+        await asyncio.sleep(0.05)
+    yield f"{user_id} "
+    yield f"got {text}"
+
+async def collect(stream):
+    return "".join([chunk async for chunk in stream])
+
+async def start(tmp_path, workers=2, deliver=None, chat=fake_chat):
+    async def record(user_id, reminder):
+        pass
+    shards = ShardDispatcher(workers, deliver or record)
+    await shards.listen()
+    tasks = [
+        asyncio.create_task(run_worker(shards.socket_path, i, workers, chat, FileStorage(tmp_path)))
+        for i in range(workers)
+    ]
+    return shards, tasks
+
+async def stop(shards, tasks):
+    await shards.stop(timeout=1)
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+
+@pytest.mark.asyncio
+async def test_chats_routed_and_ordered_per_user(tmp_path):
+    shards, tasks = await start(tmp_path)
+    finished = []
+
+    async def tracked(stream, label):
+        reply = await collect(stream)
+        finished.append(label)
+        return reply
+
+    # Sent in order: the same user's second message waits for the slow first one,
+    # another user's doesn't.
+    replies = await asyncio.gather(
+        tracked(shards.chat("1", "slow"), "1:slow"),
+        tracked(shards.chat("1", "fast"), "1:fast"),
+        tracked(shards.chat("2", "fast"), "2:fast"),
+    )
+    await stop(shards, tasks)
+    assert replies == ["1 got slow", "1 got fast", "2 got fast"]
+    assert finished.index("1:slow") < finished.index("1:fast")
+    assert finished[0] == "2:fast"
+
+@pytest.mark.asyncio
+async def test_chat_error_reaches_dispatcher(tmp_path):
+    async def failing(user_id, text):
+        raise RuntimeError("upstream down")
+        yield
+
+    shards, tasks = await start(tmp_path, chat=failing)
+    with pytest.raises(ShardError, match="upstream down"):
+        await collect(shards.chat("1", "hi"))
+    await stop(shards, tasks)
+
+@pytest.mark.asyncio
+async def test_each_worker_delivers_only_its_reminders(tmp_path):
+    storage = FileStorage(tmp_path)
+    due = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M")
+    users = [str(user) for user in range(6)]
+    for user in users:
+        storage.add_reminder(user, f"ping {user}", due)
+    storage.sync()
+
+    delivered = []
+    done = asyncio.Event()
+
+    async def deliver(user_id, reminder):
+        delivered.append((user_id, reminder["text"]))
+        if len(delivered) == len(users):
+            done.set()
+
+    shards, tasks = await start(tmp_path, deliver=deliver)
+    await asyncio.wait_for(done.wait(), timeout=2)
+    await stop(shards, tasks)
+    assert sorted(delivered) == sorted((user, f"ping {user}") for user in users)
+    assert not any(r for _, r in FileStorage(tmp_path).pending_reminders())
+
+@pytest.mark.asyncio
+async def test_failed_reminder_send_is_retried(tmp_path):
+    storage = FileStorage(tmp_path)
+    storage.add_reminder("1", "ping", (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M"))
+    storage.sync()
+    attempts = []
+    done = asyncio.Event()
+
+    async def deliver(user_id, reminder):
+        attempts.append(reminder["text"])
+        if len(attempts) == 1:
+            error = RuntimeError("flood control")
+            error.retry_after = 0.01
+            raise error
+        done.set()
+
+    shards, tasks = await start(tmp_path, workers=1, deliver=deliver)
+    await asyncio.wait_for(done.wait(), timeout=2)
+    await stop(shards, tasks)
+    assert attempts == ["ping", "ping"]
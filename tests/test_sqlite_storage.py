@@ -0,0 +1,228 @@
+import tempfile
+import shutil
+from pathlib import Path
+from datetime import datetime, timedelta
+import pytest
+from src.common import FileStorage
+from src.sqlite_storage import SQLiteStorage, export, migrate
+
+@pytest.fixture
+def temp_dir():
+    d = Path(tempfile.mkdtemp())
+    yield d
+    shutil.rmtree(d)
+
+@pytest.fixture(params=["files", "sqlite"])
+def storage(request, temp_dir):
+    if request.param == "files":
+        yield FileStorage(data_dir=temp_dir / "data")
+    else:
+        s = SQLiteStorage(temp_dir / "test.db")
+        yield s
+        s.close()
+
+def test_memory_roundtrip(storage):
+    from src.skills import memory
+    memory.append("user1", "- likes pizza", storage)
+    memory.append_log("user1", "hi", "hello!", storage)
+    assert "likes pizza" in memory.read("user1", storage)
+    assert "**User:** hi" in memory.read_log("user1", storage)
+    assert memory.read("user2", storage) == ""
+
+def test_reminders_roundtrip(storage):
+    from src.skills import reminders
+    past = (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M")
+    reminders.add("user1", "call mom", past, storage)
+    reminders.add("user1", "buy milk", None, storage)
+    assert [r["text"] for r in reminders.get_due("user1", storage)] == ["call mom"]
+    assert "- [ ] call mom `due:" in reminders.read("user1", storage)
+
+    reminders.mark_complete("user1", "call mom", storage)
+    assert reminders.parse("user1", storage)[0]["completed"] == True
+    assert [r["text"] for _, r in storage.pending_reminders()] == ["buy milk"]
+
+def test_recurring_reminder_roundtrip(storage):
+    from src.skills import reminders
+    reminders.add("user1", "standup", "2024-02-05T09:00", storage, every="weekdays", tz="Europe/Berlin")
+    assert "`every:weekdays` `tz:Europe/Berlin`" in reminders.read("user1", storage)
+
+    reminder = reminders.Reminder.from_dict(reminders.parse("user1", storage)[0])
+    reminders.reschedule("user1", reminder, storage, now=datetime(2024, 2, 9, 12, 0))
+    r = reminders.parse("user1", storage)[0]
+    assert (r["due"], r["every"], r["tz"], r["completed"]) == ("2024-02-12T09:00", "weekdays", "Europe/Berlin", False)
+
+def test_sqlite_adds_recurrence_columns_to_old_db(temp_dir):
+    import sqlite3
+    db = sqlite3.connect(str(temp_dir / "old.db"))
+    db.execute("CREATE TABLE reminders (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, text TEXT NOT NULL, "
+               "due TEXT, completed INTEGER NOT NULL DEFAULT 0)")
+    db.execute("INSERT INTO reminders (user_id, text, due) VALUES ('user1', 'call mom', '2024-02-01T17:00')")
+    db.commit()
+    db.close()
+
+    s = SQLiteStorage(temp_dir / "old.db")
+    assert s.list_reminders("user1") == [
+        {"text": "call mom", "completed": False, "due": "2024-02-01T17:00", "every": None, "tz": None}
+    ]
+    s.close()
+
+def test_wiki_pages(storage):
+    storage.write_wiki_page("user1", "../health", "# Health\n")
+    assert storage.list_wiki_pages("user1") == ["health.md"]
+    assert storage.read_wiki_page("user1", "health.md") == "# Health\n"
+
+def test_wiki_manifest_tracks_writes(storage):
+    assert storage.wiki_manifest("user1") == {}
+    storage.write_wiki_page("user1", "food.md", "# Food\n\n- I like pizza\n- I hate olives\n")
+    storage.write_wiki_page("user1", "work.md", "# Work\n\n- busy week\n")
+    manifest = storage.wiki_manifest("user1")
+    assert list(manifest) == ["food.md", "work.md"]
+    assert (manifest["food.md"]["title"], manifest["food.md"]["notes"]) == ("Food", 2)
+    assert manifest["work.md"]["size"] == len("# Work\n\n- busy week\n")
+
+def test_compact_memory(storage):
+    from src.skills import memory
+    for i in range(4):
+        storage.append_memory("user1", f"2024-01-0{i + 1} 10:00", f"- fact {i}")
+    storage.compact_memory("user1", 3, "2024-01-03 10:00", "- facts 0 to 2")
+    storage.append_memory("user1", "2024-01-05 10:00", "- fact 4")
+    assert memory.read("user1", storage) == (
+        "\n## 2024-01-03 10:00\n- facts 0 to 2\n\n## 2024-01-04 10:00\n- fact 3\n\n## 2024-01-05 10:00\n- fact 4\n"
+    )
+    storage.compact_memory("user1", 2, "2024-01-04 10:00", "- facts 0 to 3")
+    assert memory.read("user1", storage).startswith("\n## 2024-01-04 10:00\n- facts 0 to 3\n")
+
+def test_has_memory(storage):
+    from src.skills import memory
+    assert not storage.has_memory("user1")
+    memory.append("user1", "- likes pizza", storage)
+    assert storage.has_memory("user1")
+
+def test_all_user_ids(storage):
+    from src.skills import memory
+    memory.append("user1", "- a", storage)
+    memory.append("user2", "- b", storage)
+    assert set(storage.get_all_user_ids()) == {"user1", "user2"}
+
+def test_migrate_and_export_roundtrip(temp_dir):
+    from src.skills import memory, reminders
+    source = FileStorage(data_dir=temp_dir / "data")
+    memory.append("user1", "- likes pizza\n- allergic to shellfish", source)
+    memory.append_log("user1", "I like pizza", "Noted!\n\nAnything else?", source)
+    reminders.add("user1", "call mom", "2024-02-01T17:00", source)
+    reminders.add("user1", "water plants", "2024-02-03T08:00", source, every="every 3 days", tz="UTC")
+    reminders.add("user1", "done task", None, source)
+    reminders.mark_complete("user1", "done task", source)
+    source.write_wiki_page("user1", "food.md", "# Food\n\n- I like pizza\n")
+
+    db = SQLiteStorage(temp_dir / "test.db")
+    assert migrate(source, db) == 1
+    assert export(db, temp_dir / "export") == 1
+    db.close()
+
+    exported = FileStorage(data_dir=temp_dir / "export")
+    for read in (memory.read, memory.read_log, reminders.read):
+        assert read("user1", exported) == read("user1", source)
+    assert exported.read_wiki_page("user1", "food.md") == "# Food\n\n- I like pizza\n"
+
+def test_open_storage_backends(temp_dir):
+    from src.common import open_storage
+    assert isinstance(open_storage({"backend": "files", "data_dir": str(temp_dir)}), FileStorage)
+    s = open_storage({"backend": "sqlite", "path": str(temp_dir / "x.db")})
+    assert isinstance(s, SQLiteStorage)
+    s.close()
+    with pytest.raises(ValueError):
+        open_storage({"backend": "redis"})
+
+def test_file_wiki_manifest_notices_outside_edits(temp_dir, monkeypatch):
+    s = FileStorage(data_dir=temp_dir / "data")
+    s.write_wiki_page("user1", "food.md", "# Food\n\n- I like pizza\n")
+    s.write_wiki_page("user1", "old.md", "# Old\n\n- gone soon\n")
+    wiki_dir = s.get_wiki_dir("user1")
+
+    reads = []
+    read_text = s.read_text
+    monkeypatch.setattr(s, "read_text", lambda path: reads.append(path.name) or read_text(path))
+    assert s.wiki_manifest("user1")["food.md"]["notes"] == 1
+    assert reads == ["wiki.json"]
+
+    (wiki_dir / "food.md").write_text("# Food & Drink\n\n- I like pizza\n- and tea\n")
+    (wiki_dir / "old.md").unlink()
+    (wiki_dir / "new.md").write_text("# New\n")
+    (wiki_dir / "notes.txt").write_text("not a page")
+    reads.clear()
+    manifest = s.wiki_manifest("user1")
+    assert sorted(reads) == ["food.md", "new.md", "wiki.json"]
+    assert list(manifest) == ["food.md", "new.md"]
+    assert (manifest["food.md"]["title"], manifest["food.md"]["notes"]) == ("Food & Drink", 2)
+    assert set(s.read_state("user1", "wiki")) == {"food.md", "new.md"}
+
+def test_sqlite_backfills_wiki_manifest_for_old_db(temp_dir):
+    import sqlite3
+    db = sqlite3.connect(str(temp_dir / "old.db"))
+    db.execute("CREATE TABLE wiki_pages (user_id TEXT NOT NULL, filename TEXT NOT NULL, content TEXT NOT NULL, "
+               "PRIMARY KEY (user_id, filename))")
+    db.execute("INSERT INTO wiki_pages VALUES ('user1', 'food.md', '# Food\n\n- I like pizza\n')")
+    db.commit()
+    db.close()
+
+    s = SQLiteStorage(temp_dir / "old.db")
+    assert s.wiki_manifest("user1")["food.md"]["notes"] == 1
+    s.close()
+
+def test_blob_append_and_replace(storage):
+    assert storage.read_blob("user1", "vectors") == b""
+    storage.write_blob("user1", "vectors", b"abc")
+    storage.write_blob("user1", "vectors", b"def", 3)
+    assert storage.read_blob("user1", "vectors") == b"abcdef"
+    storage.write_blob("user1", "vectors", b"X", 2)
+    assert storage.read_blob("user1", "vectors") == b"abX"
+    storage.write_blob("user1", "vectors", b"")
+    assert storage.read_blob("user1", "vectors") == b""
+
+def test_log_offsets(storage):
+    from src.common import format_log_turn
+    turns = [(f"2024-02-01 10:{i:02d}", f"message {i} ü " + "x" * i, "ok") for i in range(10)]
+    for turn in turns:
+        storage.append_log("user1", *turn)
+    storage.append_log("user2", "2024-02-01 11:00", "other user", "ok")
+    full = "".join(format_log_turn(*turn) for turn in turns)
+
+    assert storage.log_length("user1") == len(full)
+    assert storage.log_length("nobody") == 0
+    for start in (0, 1, len(full) // 2, len(full) - 1, len(full)):
+        assert storage.read_log_from("user1", start) == full[start:]
+    for max_chars in (0, 1, 60, len(full), 10 ** 6):
+        assert storage.tail_log("user1", max_chars) == full[len(full) - min(max_chars, len(full)):]
+
+def test_sqlite_reads_only_the_log_it_needs(temp_dir):
+    s = SQLiteStorage(temp_dir / "test.db")
+    for i in range(50):
+        s.append_log("user1", f"2024-02-01 10:{i:02d}", f"message {i}", "ok")
+    statements = []
+    s.db.set_trace_callback(statements.append)
+    length = s.log_length("user1")
+    last = list(s.iter_log("user1", length - 5))
+    s.close()
+
+    assert len(last) == 1 and "message 49" in last[0][1]
+    # Every query seeks through an index instead of reading the whole log.
+    assert statements and all("LIMIT 1" in sql or "start >=" in sql for sql in statements)
+
+def test_sqlite_indexes_log_of_old_db(temp_dir):
+    import sqlite3
+    from src.common import format_log_turn
+    db = sqlite3.connect(str(temp_dir / "old.db"))
+    db.execute("CREATE TABLE log_turns (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+               "user_message TEXT NOT NULL, assistant_response TEXT NOT NULL)")
+    db.execute("INSERT INTO log_turns (user_id, timestamp, user_message, assistant_response) "
+               "VALUES ('user1', '2024-02-01 10:00', 'hi', 'hello')")
+    db.commit()
+    db.close()
+
+    s = SQLiteStorage(temp_dir / "old.db")
+    s.append_log("user1", "2024-02-01 10:01", "again", "hello")
+    full = format_log_turn("2024-02-01 10:00", "hi", "hello") + format_log_turn("2024-02-01 10:01", "again", "hello")
+    assert s.log_length("user1") == len(full)
+    assert s.read_log_from("user1", 10) == full[10:]
+    s.close()
@@ -0,0 +1,29 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from benchmarks.import_bench import parse_importtime
+
+ROOT = Path(__file__).parent.parent
+
+def imported_after(statement: str) -> set[str]:
+    code = f"import sys, json; {statement}; print(json.dumps(sorted(sys.modules)))"
+    env = {"PATH": "", "PYTHONPATH": str(ROOT)}
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return {name.split(".")[0] for name in json.loads(result.stdout)}
+
+def test_cli_paths_skip_telegram_and_openai():
+    # No OPENROUTER_API_KEY either: the client is only built on first use.
+    modules = imported_after("import src.main, src.consolidate, src.shard")
+    assert not modules & {"telegram", "openai", "httpx"}
+
+def test_client_built_on_first_use():
+    modules = imported_after("import src.agent")
+    assert "openai" not in modules
+    assert "openai" in imported_after(
+        "import os; os.environ['OPENROUTER_API_KEY'] = 'test'; import src.agent; src.agent.get_client()"
+    )
+
+def test_parse_importtime():
+    output = "import time: self [us] | cumulative | imported package\nimport time:       120 |        350 |   src.common\n"
+    assert parse_importtime(output) == [("src.common", 120, 350)]
@@ -0,0 +1,52 @@
+import json
+from unittest.mock import AsyncMock
+import pytest
+from src import structured
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {"type": "array", "items": {"type": "string"}},
+        "score": {"type": ["number", "null"], "minimum": 0, "maximum": 1},
+    },
+    "required": ["items", "score"],
+    "additionalProperties": False,
+}
+
+def test_parse_json_tolerates_fences_and_chatter():
+    assert structured.parse_json('{"a": 1}') == {"a": 1}
+    assert structured.parse_json('```json\n{"a": 1}\n```') == {"a": 1}
+    assert structured.parse_json('Here you go: {"a": 1}') == {"a": 1}
+    assert structured.parse_json("NONE") is None
+    assert structured.parse_json(None) is None
+
+def test_validate():
+    assert structured.validate({"items": ["x"], "score": 0.5}, SCHEMA) == []
+    assert structured.validate({"items": ["x"], "score": None}, SCHEMA) == []
+    assert structured.validate({"items": [1], "score": 2}, SCHEMA) == [
+        "$.items[0]: expected string",
+        "$.score: above 1",
+    ]
+    assert structured.validate({"items": [], "extra": True}, SCHEMA) == ["$.score: missing", "$.extra: unexpected"]
+    assert structured.validate({"items": [], "score": True}, SCHEMA) == ["$.score: expected number or null"]
+    assert structured.validate([], SCHEMA) == ["$: expected object"]
+
+def test_response_format():
+    fmt = structured.response_format("reminders", SCHEMA)
+    assert fmt["type"] == "json_schema"
+    assert fmt["json_schema"]["schema"] is SCHEMA
+
+@pytest.mark.asyncio
+async def test_request_passes_schema_and_repairs_once():
+    llm = AsyncMock(side_effect=['{"items": "x"}', json.dumps({"items": ["x"], "score": 1})])
+    assert await structured.request(llm, "prompt", SCHEMA) == {"items": ["x"], "score": 1}
+    assert llm.call_args_list[0].kwargs["schema"] is SCHEMA
+    repair = llm.call_args_list[1].args[0]
+    assert repair.startswith("prompt")
+    assert "$.items: expected array" in repair
+
+@pytest.mark.asyncio
+async def test_request_gives_up_after_bounded_retries():
+    llm = AsyncMock(return_value="nope")
+    assert await structured.request(llm, "prompt", SCHEMA, retries=2) is None
+    assert llm.call_count == 3
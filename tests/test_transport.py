@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+import openai
+import pytest
+from src import metrics
+from src.transport import Endpoint, Transport, from_config, make_client, retryable
+
+class FakeOpenAI:
+    """A local OpenAI-compatible server answering POST /v1/chat/completions.
+
+    Each request takes the next entry of `script` (status, delay, content);
+    once it runs out, requests get a plain 200 answer.
+    """
+
+    def __init__(self, script=None, content="ok"):
+        self.script = list(script or [])
+        self.content = content
+        self.requests = []
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/v1"
+
+    async def close(self):
+        self.server.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while request := await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers.get("content-length", 0))))
+                self.requests.append(body)
+                step = self.script.pop(0) if self.script else {}
+                await asyncio.sleep(step.get("delay", 0))
+                status = step.get("status", 200)
+                if status != 200:
+                    payload = json.dumps({"error": {"message": "fake failure", "type": "server_error"}}).encode()
+                    writer.write(f"HTTP/1.1 {status} Error\r\nContent-Type: application/json\r\n"
+                                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                else:
+                    payload = json.dumps({
+                        "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": step.get("content", self.content)}}],
+                        "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+                    }).encode()
+                    writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+@pytest.fixture
+async def fake():
+    server = FakeOpenAI()
+    url = await server.start()
+    yield server, url
+    await server.close()
+
+def transport(*urls, **kwargs) -> Transport:
+    kwargs.setdefault("backoff", 0.01)
+    kwargs.setdefault("hedge_usages", ())
+    endpoints = [Endpoint(f"endpoint{i}", make_client(url, "test", {})) for i, url in enumerate(urls)]
+    return Transport(endpoints, registry=metrics.Registry(), **kwargs)
+
+async def ask(client, usage="extraction", **kwargs):
+    with metrics.labels(usage=usage):
+        response = await client.chat.completions.create(
+            model="m", messages=[{"role": "user", "content": "hi"}], **kwargs
+        )
+    return response.choices[0].message.content
+
+def test_retryable():
+    assert retryable(asyncio.TimeoutError())
+    assert not retryable(ValueError())
+
+@pytest.mark.asyncio
+async def test_keeps_connections_alive(fake):
+    server, url = fake
+    client = transport(url)
+    for _ in range(3):
+        assert await ask(client) == "ok"
+    assert len(server.requests) == 3
+    assert server.connections == 1
+
+@pytest.mark.asyncio
+async def test_retries_server_errors(fake):
+    server, url = fake
+    server.script = [{"status": 500}, {"status": 429}]
+    client = transport(url)
+    assert await ask(client) == "ok"
+    assert len(server.requests) == 3
+    assert client.registry.transport[("extraction", "retry")] == 2
+
+@pytest.mark.asyncio
+async def test_client_errors_not_retried(fake):
+    server, url = fake
+    server.script = [{"status": 400}]
+    with pytest.raises(openai.BadRequestError):
+        await ask(transport(url))
+    assert len(server.requests) == 1
+
+@pytest.mark.asyncio
+async def test_gives_up_after_retries(fake):
+    server, url = fake
+    server.script = [{"status": 503}] * 5
+    with pytest.raises(openai.InternalServerError):
+        await ask(transport(url, retries=1))
+    assert len(server.requests) == 2
+
+@pytest.mark.asyncio
+async def test_per_usage_timeout(fake):
+    server, url = fake
+    server.script = [{"delay": 0.5}]
+    client = transport(url, retries=0, timeouts={"extraction": 0.1})
+    start = time.perf_counter()
+    with pytest.raises(openai.APITimeoutError):
+        await ask(client)
+    assert time.perf_counter() - start < 0.4
+
+@pytest.mark.asyncio
+async def test_fails_over_to_secondary(fake):
+    server, url = fake
+    server.content = "local"
+    dead = "http://127.0.0.1:1/v1"
+    client = transport(dead, url)
+    client.endpoints[1].models = {"extraction": "local-model"}
+    assert await ask(client) == "local"
+    assert client.registry.transport[("extraction", "failover")] == 1
+    assert server.requests[0]["model"] == "local-model"
+    # The failed endpoint is skipped until its cooldown ends.
+    assert await ask(client) == "local"
+    assert client.registry.transport[("extraction", "failover")] == 1
+
+@pytest.mark.asyncio
+async def test_hedges_slow_extraction(fake):
+    server, url = fake
+    server.script = [{"delay": 1.0, "content": "slow"}, {"content": "fast"}]
+    client = transport(url, hedge_usages=("extraction",), hedge_delay=0.05)
+    start = time.perf_counter()
+    assert await ask(client) == "fast"
+    assert time.perf_counter() - start < 0.5
+    assert len(server.requests) == 2
+    assert client.registry.transport[("extraction", "hedge")] == 1
+
+@pytest.mark.asyncio
+async def test_fast_and_chat_calls_not_hedged(fake):
+    server, url = fake
+    server.script = [{"delay": 0.1}]
+    client = transport(url, hedge_usages=("extraction",), hedge_delay=0.05)
+    assert await ask(client, usage="chat") == "ok"
+    assert await ask(client) == "ok"
+    assert len(server.requests) == 2
+
+@pytest.mark.asyncio
+async def test_batch_calls_not_hedged_or_sampled(fake):
+    server, url = fake
+    server.script = [{"delay": 0.1}]
+    client = transport(url, hedge_usages=("extraction",), hedge_delay=0.05)
+    with metrics.labels(skill="batch"):
+        assert await ask(client) == "ok"
+    assert len(server.requests) == 1
+    assert not client._latency["extraction"]
+    assert await ask(client) == "ok"
+    assert len(client._latency["extraction"]) == 1
+
+def test_hedge_delay_tracks_p95():
+    client = transport("http://127.0.0.1:1/v1", hedge_delay=5.0, hedge_min_samples=10)
+    assert client.hedge_after("extraction") == 5.0
+    client._latency["extraction"].extend(i / 100 for i in range(1, 101))
+    assert client.hedge_after("extraction") == pytest.approx(0.96)
+
+def test_from_config_adds_fallback(monkeypatch):
+    monkeypatch.setenv("LLM_FALLBACK_BASE_URL", "http://localhost:4000")
+    client = from_config({"retries": 4, "timeouts": {"chat": 5}}, "https://example.com/v1", "key")
+    assert [e.name for e in client.endpoints] == ["primary", "fallback"]
+    assert client.retries == 4
+    assert client.timeout("chat").read == 5
+    assert client.timeout("extraction").read == 30
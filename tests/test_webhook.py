@@ -0,0 +1,90 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from telegram import Update
+from src import webhook
+
+# A text message update as Telegram delivers it.
+UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 7,
+        "date": 1760000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Ada"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Ada"},
+        "text": "remind me to water the plants tomorrow",
+    },
+}
+
+async def request(port, method, path, body=b"", headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.decode().partition("\r\n\r\n")
+    return int(head.split()[1]), payload
+
+@pytest.fixture
+async def served():
+    app = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+    hook = webhook.WebhookServer(app, "/telegram", "s3cret")
+    server = await hook.start("127.0.0.1", 0)
+    hook.ready = True
+    yield hook, server.sockets[0].getsockname()[1]
+    await hook.close()
+
+@pytest.mark.asyncio
+async def test_recorded_update_is_queued(served):
+    hook, port = served
+    status, _ = await request(port, "POST", "/telegram", json.dumps(UPDATE).encode(),
+                              {"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+    assert status == 200
+    update = hook.app.update_queue.get_nowait()
+    assert isinstance(update, Update)
+    assert update.effective_chat.id == 42
+    assert update.message.text == UPDATE["message"]["text"]
+
+@pytest.mark.asyncio
+async def test_rejects_wrong_secret(served):
+    hook, port = served
+    status, _ = await request(port, "POST", "/telegram", json.dumps(UPDATE).encode(),
+                              {"X-Telegram-Bot-Api-Secret-Token": "guess"})
+    assert status == 403
+    assert hook.app.update_queue.empty()
+
+@pytest.mark.asyncio
+async def test_rejects_bad_json_and_unknown_paths(served):
+    _, port = served
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+    assert (await request(port, "POST", "/telegram", b"{not json", headers))[0] == 400
+    assert (await request(port, "POST", "/other", b"{}", headers))[0] == 404
+    assert (await request(port, "GET", "/telegram"))[0] == 405
+
+@pytest.mark.asyncio
+async def test_health_and_readiness(served):
+    hook, port = served
+    status, body = await request(port, "GET", "/healthz")
+    assert status == 200
+    assert json.loads(body) == {"ready": True, "received": 0, "queued": 0}
+    assert (await request(port, "GET", "/readyz"))[0] == 200
+
+    hook.ready = False
+    assert (await request(port, "GET", "/readyz"))[0] == 503
+    status, _ = await request(port, "POST", "/telegram", json.dumps(UPDATE).encode(),
+                              {"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+    assert status == 503
+    assert hook.app.update_queue.empty()
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("WEBHOOK_URL", "https://bot.example.com")
+    monkeypatch.setenv("WEBHOOK_PORT", "9000")
+    monkeypatch.setenv("TELEGRAM_WEBHOOK_SECRET", "s3cret")
+    settings = webhook.settings_from_env({"port": 8443, "path": "/hook"})
+    assert settings["url"] == "https://bot.example.com"
+    assert settings["port"] == 9000
+    assert settings["path"] == "/hook"
+    assert settings["secret_token"] == "s3cret"